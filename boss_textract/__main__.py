@@ -1,29 +1,42 @@
 import argparse
+import importlib
 from utils.logger import logger
-from commands.train_command import TrainCommand
-from commands.predict_command import PredictCommand
 
+# Only the light command modules are imported to build the parser, the heavy
+# dependencies (pandas, spaCy, ...) are loaded when the command executes
 COMMANDS = {
-    "train": TrainCommand,
-    "predict": PredictCommand,
+    "train": "commands.train_command:TrainCommand",
+    "predict": "commands.predict_command:PredictCommand",
+    "serve": "commands.serve_command:ServeCommand",
+    "optimize": "commands.optimize_command:OptimizeCommand",
+    "gazetteer": "commands.gazetteer_command:GazetteerCommand",
+    "benchmark": "commands.benchmark_command:BenchmarkCommand",
+    "shard": "commands.shard_command:ShardCommand",
+    "merge": "commands.merge_command:MergeCommand",
 }
 
 
+def load_command(command_name: str):
+    command_path = COMMANDS.get(command_name)
+    if command_path is None:
+        raise ValueError(f"Command {command_name} is invalid")
+    module_name, class_name = command_path.split(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
 def main():
     parser = argparse.ArgumentParser(prog="BOSS Textract NER")
     subparsers = parser.add_subparsers(dest="command")
 
-    for command_name, command_cls in COMMANDS.items():
-        command_instance = command_cls()
+    for command_name in COMMANDS:
+        command_instance = load_command(command_name)()
         subparser = subparsers.add_parser(command_name)
         command_instance.add_arguments(subparser)
 
     args = parser.parse_args()
 
     try:
-        command_instance = COMMANDS.get(args.command)
-        if command_instance is None:
-            raise ValueError(f"Command {args.command} is invalid")
+        command_instance = load_command(args.command)
         command_instance.execute(args)
     except Exception as e:
         logger.error(e)
@@ -0,0 +1,65 @@
+import json
+from pathlib import Path
+import sys
+import time
+from utils.logger import logger
+from commands.base_command import BaseCommand
+
+
+class BenchmarkCommand(BaseCommand):
+    @staticmethod
+    def add_arguments(parser):
+        parser.add_argument("--scales", type=int, nargs="+", default=[1000, 10000])
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--max_variation", type=int, default=3)
+        parser.add_argument("--train_size", type=int, default=1000)
+        parser.add_argument("--output", type=Path)
+        parser.add_argument("--compare", type=Path)
+
+    @staticmethod
+    def _report(comparison: list[dict]):
+        logger.info(
+            f"{'Etapa':<24}{'Registros':>10}{'Anterior':>12}{'Atual':>12}{'Razão':>10}"
+        )
+        for row in comparison:
+            ratio = row["ratio"] if row["ratio"] is not None else float("nan")
+            logger.info(
+                f"{row['stage']:<24}{row['records']:>10}{row['baseline']:>12.4f}{row['current']:>12.4f}{ratio:>10.2f}"
+            )
+
+    @classmethod
+    def execute(cls, args):
+        try:
+            from core.benchmark import compare_results, run_benchmark
+
+            if args.compare is not None and not args.compare.is_file():
+                raise TypeError("O arquivo de --compare é invalido.")
+
+            results = run_benchmark(
+                args.scales,
+                repeat=args.repeat,
+                seed=args.seed,
+                max_variation=args.max_variation,
+                train_size=args.train_size,
+            )
+
+            output_path: Path = args.output
+            if output_path is None or output_path.is_dir():
+                output_path = (output_path or Path("benchmarks")) / Path(
+                    f"benchmark_{results['version']}_{time.strftime('%Y-%m-%d_%H-%M-%S')}.json"
+                )
+            if not output_path.parent.exists():
+                output_path.parent.mkdir(parents=True, exist_ok=True)
+            output_path.write_text(
+                json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8"
+            )
+            logger.success(f"Resultados salvos em: {output_path}")
+
+            if args.compare is not None:
+                baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+                cls._report(compare_results(baseline, results))
+
+        except Exception as e:
+            exception = sys.exc_info()
+            logger.opt(exception=exception).error(e)
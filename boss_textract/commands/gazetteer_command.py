@@ -0,0 +1,76 @@
+from pathlib import Path
+import sys
+from utils.logger import logger
+from commands.base_command import BaseCommand
+from utils import SEPARATORS
+
+
+class GazetteerCommand(BaseCommand):
+    @staticmethod
+    def add_arguments(parser):
+        parser.add_argument("--data", type=Path, nargs="+", required=True)
+        parser.add_argument("--res_col", type=str, required=True)
+        parser.add_argument("--output", type=Path, required=True)
+        parser.add_argument("--sep", type=str, default="SEMICOLON")
+        parser.add_argument("--encoding", type=str, default="UTF-8")
+        parser.add_argument("--min_samples", type=int, default=1)
+        parser.add_argument("--min_length", type=int, default=3)
+        parser.add_argument("--chunksize", type=int, default=100_000)
+
+    @classmethod
+    def execute(cls, args):
+        try:
+            import pandas as pd
+            from core.corpus import parse_response_columns
+            from core.gazetteer import Gazetteer
+            from core.preprocessor import DataPreprocessor
+
+            separator = SEPARATORS.get(args.sep)
+            separator = separator if separator is not None else args.sep
+            res_columns = parse_response_columns(args.res_col)
+
+            # Training CSVs (response columns) or earlier predict outputs
+            # (output columns), counted by label over every file, each file
+            # only needs the columns it has
+            counts, found = {}, set()
+            for file_path in args.data:
+                skipped = set()
+                for df in DataPreprocessor.load_chunks(
+                    file_path, separator, args.encoding, chunksize=args.chunksize
+                ):
+                    for response_col in res_columns:
+                        if response_col["column"] not in df.columns:
+                            skipped.add(response_col["column"])
+                            continue
+                        found.add(response_col["column"])
+                        column = DataPreprocessor.format_column(
+                            df[response_col["column"]]
+                        ).dropna()
+                        counts[response_col["type"]] = counts.get(
+                            response_col["type"], pd.Series(dtype="int64")
+                        ).add(column.value_counts(), fill_value=0)
+                for column in sorted(skipped):
+                    logger.info(f"A coluna {column} não existe em {file_path}, ignorada")
+
+            missing = [x["column"] for x in res_columns if x["column"] not in found]
+            if missing:
+                raise ValueError(
+                    f"As colunas {missing} não existem em nenhum dos arquivos"
+                )
+
+            patterns = [
+                {"label": label, "pattern": pattern}
+                for label, total in counts.items()
+                for pattern, count in total.sort_values(ascending=False).items()
+                if count >= args.min_samples and len(pattern) >= args.min_length
+            ]
+            if not args.output.parent.exists():
+                args.output.parent.mkdir(parents=True, exist_ok=True)
+            Gazetteer.to_disk(patterns, args.output)
+            logger.success(
+                f"Gazetteer com {len(patterns)} organizações salvo em: {args.output}"
+            )
+
+        except Exception as e:
+            exception = sys.exc_info()
+            logger.opt(exception=exception).error(e)
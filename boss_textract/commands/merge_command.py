@@ -0,0 +1,44 @@
+from pathlib import Path
+import sys
+from utils.logger import logger
+from commands.base_command import BaseCommand
+from utils import SEPARATORS
+
+
+class MergeCommand(BaseCommand):
+    @staticmethod
+    def add_arguments(parser):
+        parser.add_argument("--data", type=Path, nargs="+", required=True)
+        parser.add_argument("--output", type=Path, required=True)
+        parser.add_argument("--src_col", type=str, required=True)
+        parser.add_argument("--out_col", type=str, required=True)
+        parser.add_argument("--max_variation", type=int, default=0)
+        parser.add_argument("--sep", type=str, default="SEMICOLON")
+
+    @classmethod
+    def execute(cls, args):
+        try:
+            from core.sharding import merge_files
+
+            for path in args.data:
+                if not path.is_file():
+                    raise TypeError(f"O arquivo {path} é invalido.")
+            separator = SEPARATORS.get(args.sep)
+            separator = separator if separator is not None else args.sep
+            if not args.output.parent.exists():
+                args.output.parent.mkdir(parents=True, exist_ok=True)
+
+            # Outputs of predict (UTF-8), one per part created by shard
+            df = merge_files(
+                args.data,
+                args.output,
+                args.src_col,
+                args.out_col,
+                separator,
+                max_variation=args.max_variation,
+            )
+            logger.success(f"{len(df)} linhas salvas em: {args.output}")
+
+        except Exception as e:
+            exception = sys.exc_info()
+            logger.opt(exception=exception).error(e)
@@ -0,0 +1,76 @@
+from pathlib import Path
+import sys
+from utils.logger import logger
+from commands.base_command import BaseCommand
+from utils import SEPARATORS
+
+
+class OptimizeCommand(BaseCommand):
+    @staticmethod
+    def add_arguments(parser):
+        parser.add_argument("--model", type=Path, required=True)
+        parser.add_argument("--output", type=Path)
+        parser.add_argument("--optimize", type=str, choices=["cpu"], default="cpu")
+        parser.add_argument("--window", type=int)
+        parser.add_argument("--stride", type=int)
+        parser.add_argument("--eval", type=Path)
+        parser.add_argument("--src_col", type=str)
+        parser.add_argument("--res_col", type=str)
+        parser.add_argument("--sep", type=str, default="SEMICOLON")
+        parser.add_argument("--encoding", type=str, default="UTF-8")
+        parser.add_argument("--batch_size", type=int, default=128)
+
+    @staticmethod
+    def _report(original: dict, optimized: dict):
+        logger.info(f"{'Métrica':<16}{'Original':>12}{'Otimizado':>12}{'Delta':>12}")
+        for key in original:
+            logger.info(
+                f"{key:<16}{original[key]:>12.4f}{optimized[key]:>12.4f}{optimized[key] - original[key]:>+12.4f}"
+            )
+
+    @classmethod
+    def execute(cls, args):
+        try:
+            from core.corpus import parse_response_columns
+            from core.optimizer import evaluate_pipeline, load_pipeline, save_pipeline
+            from core.preprocessor import DataPreprocessor
+
+            if args.output is None and args.eval is None:
+                raise ValueError("Informe --output e/ou --eval")
+            if args.eval is not None and (args.src_col is None or args.res_col is None):
+                raise ValueError("O uso de --eval requer --src_col e --res_col")
+
+            options = {"window": args.window, "stride": args.stride}
+            if args.output is not None:
+                save_pipeline(
+                    args.model, args.output, optimize=args.optimize, **options
+                )
+            if args.eval is None:
+                return
+
+            separator = SEPARATORS.get(args.sep)
+            separator = separator if separator is not None else args.sep
+            df = DataPreprocessor.load(args.eval, separator, args.encoding)
+            dataset = DataPreprocessor.create_train_dataframe(
+                df, args.src_col, parse_response_columns(args.res_col), MIN_SAMPLES=1
+            )
+            del df
+            logger.info(f"Avaliando {len(dataset)} amostras de {args.eval}")
+
+            original = evaluate_pipeline(
+                load_pipeline(args.model), dataset, batch_size=args.batch_size
+            )
+            # The saved model is evaluated when there is one, so the reported
+            # delta is the one of the directory that will be used
+            optimized = evaluate_pipeline(
+                load_pipeline(args.output)
+                if args.output is not None
+                else load_pipeline(args.model, optimize=args.optimize, **options),
+                dataset,
+                batch_size=args.batch_size,
+            )
+            cls._report(original, optimized)
+
+        except Exception as e:
+            exception = sys.exc_info()
+            logger.opt(exception=exception).error(e)
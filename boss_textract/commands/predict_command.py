@@ -1,20 +1,22 @@
+import glob
+import itertools
 from pathlib import Path
 import sys
-from typing import Union
+from typing import TYPE_CHECKING, Iterable, Optional, Union
 import os
-from spacy.util import ensure_path
 from utils.logger import logger, log_path
 from commands.base_command import BaseCommand
 from utils import SEPARATORS
-from core.preprocessor import DataPreprocessor
-from core.predicter import ModelPredicter
-
-if os.name != "nt":
-    from bullet import Bullet, Input, ScrollBar
-
-from spacy import displacy
 import time
 
+# pandas, spaCy and the core modules are imported inside execute, so the
+# parser is built without loading them
+if TYPE_CHECKING:
+    import pandas as pd
+    from core.displacy_log import DisplacyLog
+    from core.manifest import JobManifest
+    from core.predicter import ModelPredicter
+
 
 class PredictCommand(BaseCommand):
     @staticmethod
@@ -29,8 +31,30 @@ class PredictCommand(BaseCommand):
         parser.add_argument("--max_variation", type=int, default=0)
         parser.add_argument("--encoding", type=str, default="UTF-8")
         parser.add_argument("--gpu_id", type=int, default=-1)
+        parser.add_argument("--batch_size", type=int, default=128)
+        parser.add_argument("--batch_tokens", type=int, default=4096)
+        parser.add_argument("--workers", type=int, default=1)
+        parser.add_argument("--cache", type=Path)
+        parser.add_argument("--cache_size", type=int, default=1_000_000)
+        parser.add_argument("--chunksize", type=int)
+        parser.add_argument("--arrow", action="store_true")
+        parser.add_argument("--src_only", action="store_true")
+        parser.add_argument("--previous", type=Path)
+        parser.add_argument("--responses", action="store_true")
+        parser.add_argument("--optimize", type=str, choices=["cpu"])
+        parser.add_argument("--window", type=int)
+        parser.add_argument("--stride", type=int)
+        parser.add_argument("--gazetteer", type=Path)
+        parser.add_argument("--cascade", type=Path)
+        parser.add_argument("--cascade_threshold", type=float, default=0.9)
         parser.add_argument("--log", type=Path, default=Path(log_path))
         parser.add_argument("--no-log", dest="log", action="store_false")
+        parser.add_argument("--log_sample", type=int)
+        parser.add_argument("--log_ambiguous", action="store_true")
+        parser.add_argument("--log_page_size", type=int, default=1000)
+        parser.add_argument("--metrics", type=Path)
+        parser.add_argument("--manifest", type=Path)
+        parser.add_argument("--profile", type=Path)
 
     @staticmethod
     def _get_start_header_index_by_column(
@@ -62,6 +86,8 @@ class PredictCommand(BaseCommand):
         elif len(columns) == 1:
             return columns[0]
 
+        from bullet import ScrollBar
+
         print("\n", end="")
         return ScrollBar(
             prompt=f"{question}:\n",
@@ -77,6 +103,8 @@ class PredictCommand(BaseCommand):
         if os.name == "nt":
             return None
 
+        from bullet import Bullet, Input
+
         SEPARATORS_TITLES = {
             "Ponto e vírgula (;)": "SEMICOLON",
             "Vírgula (,)": "COMMA",
@@ -97,90 +125,536 @@ class PredictCommand(BaseCommand):
         else:
             return SEPARATORS.get(SEPARATORS_TITLES[separator])
 
-    @classmethod
-    def execute(cls, args):
-        try:
-            file_path: Path = args.data
-            separator: str = SEPARATORS.get(args.sep)
-            model_path: Path = args.model
-            encoding: str = args.encoding
-            separator = separator if separator is not None else args.sep
-            separator = separator if separator is not None else cls._choose_separator()
-            source_column = args.src_col if args.src_col is not None else None
-            if not file_path.is_file():
-                raise TypeError("O arquivo selecionado é invalido.")
-            if separator is None:
-                raise ValueError(f"O separador {separator} é invalido")
-
-            start_header = (
-                args.start_header
-                if args.start_header is not None
-                else cls._get_start_header_index_by_column(
-                    file_path, separator, column_name=source_column, encoding=encoding
+    @staticmethod
+    def _get_inputs(data: Path) -> list[Path]:
+        # A file, a directory (its .csv/.parquet files) or a glob pattern
+        if data.is_file():
+            return [data]
+        if data.is_dir():
+            files = [
+                x
+                for x in data.iterdir()
+                if x.is_file() and x.suffix.lower() in (".csv", ".parquet")
+            ]
+        else:
+            files = [Path(x) for x in glob.glob(str(data)) if Path(x).is_file()]
+        if len(files) == 0:
+            raise TypeError("O arquivo selecionado é invalido.")
+        return sorted(files)
+
+    @staticmethod
+    def _get_output_path(output_path: Path, file_path: Path) -> Path:
+        output_path = Path(output_path)
+        # Parquet inputs are written as Parquet, anything else as CSV
+        suffix = ".parquet" if file_path.suffix.lower() == ".parquet" else ".csv"
+
+        if output_path.is_file():
+            if output_path.suffix.lower() not in (".csv", ".parquet"):
+                output_path = output_path.with_suffix(".csv")
+        elif output_path.is_dir():
+            output_path = output_path / f"{file_path.stem}{suffix}"
+
+        if not output_path.parent.exists():
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            logger.info(f"Created output directory: {output_path.parent}")
+
+        return output_path
+
+    @staticmethod
+    def _manifest_settings(args, source_column: str, output_column: str) -> dict:
+        # Outputs recorded by another configuration are not reused
+        return {
+            "model": str(args.model.absolute()),
+            "source_column": source_column,
+            "output_column": output_column,
+            "max_variation": args.max_variation,
+            "chunksize": args.chunksize,
+            "src_only": args.src_only,
+            "previous": str(args.previous.absolute()) if args.previous else None,
+            "responses": args.responses or args.previous is not None,
+            "optimize": args.optimize,
+            "window": args.window,
+            "stride": args.stride,
+            "gazetteer": str(args.gazetteer.absolute()) if args.gazetteer else None,
+            "cascade": str(args.cascade.absolute()) if args.cascade else None,
+            "cascade_threshold": args.cascade_threshold if args.cascade else None,
+        }
+
+    @staticmethod
+    def _is_done(manifest: "JobManifest", file_path: Path, output_path: Path):
+        if manifest.entry(file_path)["status"] == "done" and output_path.is_file():
+            logger.info(f"Arquivo já processado: {file_path}")
+            return True
+        return False
+
+    @staticmethod
+    def _predict_chunks(
+        predicter: "ModelPredicter",
+        chunks: Iterable["pd.DataFrame"],
+        file_path: Path,
+        output_path: Path,
+        separator: str,
+        source_column: str,
+        output_column: str,
+        *,
+        max_variation: int,
+        chunksize: int,
+        log: Optional["DisplacyLog"] = None,
+        previous: Optional[dict[str, str]] = None,
+        manifest: Optional["JobManifest"] = None,
+        response_column: Optional[str] = None,
+    ):
+        from core.preprocessor import DataPreprocessor
+
+        metrics = predicter.metrics
+
+        polish = max_variation is None or max_variation > 0
+        # The part file always keeps the raw responses when polishing, they
+        # select the polished rows (dropped at the end without --responses)
+        part_response_column = (
+            predicter.response_column(output_column)
+            if polish and response_column is None
+            else response_column
+        )
+        part_path = (
+            output_path.with_name(f"{output_path.stem}.part{output_path.suffix}")
+            if polish
+            else output_path
+        )
+
+        # A CSV part file is continued after the last chunk recorded in the
+        # manifest (a Parquet one can't be appended, it is written again)
+        state = manifest.entry(file_path) if manifest is not None else {}
+        done = state.get("chunks", 0)
+        resume = (
+            done > 0
+            and not DataPreprocessor.is_parquet(part_path)
+            and part_path.is_file()
+            and part_path.stat().st_size >= state["offset"]
+        )
+        organizations = state.get("organizations") if resume else None
+        if not resume:
+            done = 0
+        elif state["status"] == "predicted":
+            logger.info(f"Predições já realizadas: {file_path}")
+            predicter.restore_organizations(organizations)
+        else:
+            logger.info(f"Retomando {file_path} a partir do bloco {done + 1}")
+
+        if not resume or state["status"] != "predicted":
+            if resume:
+                # Rows written after the last recorded chunk are dropped
+                with open(part_path, "r+b") as file:
+                    file.truncate(state["offset"])
+                chunks = itertools.islice(chunks, done, None)
+
+            logger.success(f"Saving output file: {part_path}")
+            with DataPreprocessor.chunk_writer(
+                part_path, separator, append=resume
+            ) as write:
+                for df in predicter.predict_chunks(
+                    metrics.iterate("load", chunks),
+                    source_column,
+                    output_column,
+                    log=log,
+                    previous=previous,
+                    organizations=organizations,
+                    response_column=part_response_column,
+                ):
+                    with metrics.stage("write", rows=len(df)):
+                        write(df)
+                    done += 1
+                    if manifest is not None and not DataPreprocessor.is_parquet(
+                        part_path
+                    ):
+                        manifest.update(
+                            file_path,
+                            status="running",
+                            chunks=done,
+                            offset=part_path.stat().st_size,
+                            organizations=predicter.chunk_organizations(),
+                        )
+            if manifest is not None and polish:
+                manifest.update(
+                    file_path,
+                    status="predicted",
+                    chunks=done,
+                    offset=part_path.stat().st_size,
+                    organizations=predicter.chunk_organizations(),
                 )
+
+        if polish:
+            # Second pass over the written file with the complete organizations
+            chunks = DataPreprocessor.load_chunks(
+                part_path, separator, "utf-8", chunksize=chunksize, na_filter=False
             )
-            df = DataPreprocessor.load(
-                file_path, separator, encoding, start_header=start_header
-            )
-            source_column = (
-                source_column
-                if source_column is not None
-                else cls._choose_column(
-                    "Selecione a coluna de origem", list(df.columns.values)
-                )
+            logger.success(f"Saving output file: {output_path}")
+            with DataPreprocessor.chunk_writer(output_path, separator) as write:
+                for df in predicter.polish_chunks(
+                    metrics.iterate("load", chunks),
+                    source_column,
+                    output_column,
+                    max_variation,
+                    part_response_column,
+                ):
+                    if response_column is None:
+                        df = df.drop(columns=[part_response_column])
+                    with metrics.stage("write", rows=len(df)):
+                        write(df)
+            part_path.unlink()
+
+    @classmethod
+    def _get_start_header(
+        cls, args, file_path: Path, separator: str, source_column: Optional[str]
+    ) -> int:
+        from core.preprocessor import DataPreprocessor
+
+        if args.start_header is not None:
+            return args.start_header
+        if DataPreprocessor.is_parquet(file_path):
+            return 0
+        return cls._get_start_header_index_by_column(
+            file_path, separator, column_name=source_column, encoding=args.encoding
+        )
+
+    @classmethod
+    def _get_columns(cls, args, file_path: Path, separator: str) -> tuple[str, str]:
+        from core.preprocessor import DataPreprocessor
+
+        # Asked once (when not informed) from the header of the first file,
+        # every file is predicted with the same columns
+        source_column = args.src_col
+        if source_column is None:
+            columns = DataPreprocessor.load_header(
+                file_path,
+                separator,
+                args.encoding,
+                start_header=cls._get_start_header(args, file_path, separator, None),
+            ).columns
+            source_column = cls._choose_column(
+                "Selecione a coluna de origem", list(columns.values)
             )
-            if source_column is None:
-                raise ValueError("Nenhuma coluna válida foi selecionada.")
-            elif source_column not in df.columns:
-                raise ValueError("A coluna selecionada não existe no DataFrame.")
-
-            output_column = (
-                args.out_col
-                if args.out_col is not None
-                else cls._input_text(
-                    f"Digite o nome da coluna de saída (Padrão: {source_column.upper()}_OUTPUT): "
-                )
+        if source_column is None:
+            raise ValueError("Nenhuma coluna válida foi selecionada.")
+
+        output_column = (
+            args.out_col
+            if args.out_col is not None
+            else cls._input_text(
+                "Digite o nome da coluna de saída (Padrão: "
+                f"{source_column.upper()}_OUTPUT): "
             )
-            if output_column is None or output_column == "":
-                output_column = f"{source_column.upper()}_OUTPUT"
+        )
+        if output_column is None or output_column == "":
+            output_column = f"{source_column.upper()}_OUTPUT"
+        return source_column, output_column
+
+    @staticmethod
+    def _create_log(args) -> Optional["DisplacyLog"]:
+        from core.displacy_log import DisplacyLog
+
+        log_path: Union[Path, bool] = args.log
+        if not isinstance(log_path, Path):
+            return None
+        if log_path.is_dir():
+            log_path = log_path / Path(f"log_{time.strftime('%Y-%m-%d_%H-%M-%S')}.html")
+        logger.info(f"Logging in: {log_path.absolute()}")
+        return DisplacyLog(
+            log_path,
+            page_size=args.log_page_size,
+            sample=args.log_sample,
+            ambiguous=args.log_ambiguous,
+        )
+
+    @staticmethod
+    def _load_previous(
+        previous_path: Path, separator: str, source_column: str, response_column: str
+    ) -> dict[str, str]:
+        from core.preprocessor import DataPreprocessor
+        from core.predicter import ModelPredicter
 
-            log_path: Union[Path, bool] = args.log
-            if isinstance(log_path, Path) and Path(log_path).is_dir():
-                log_path = log_path / Path(
-                    f"log_{time.strftime('%Y-%m-%d_%H-%M-%S')}.html"
+        if not previous_path.is_file():
+            raise TypeError("O arquivo de --previous é invalido.")
+        # Written by an earlier predict: header on the first line
+        columns = DataPreprocessor.load_header(
+            previous_path, separator, "utf-8"
+        ).columns
+        return ModelPredicter.previous_responses(
+            DataPreprocessor.load(
+                previous_path,
+                separator,
+                "utf-8",
+                columns=[x for x in (source_column, response_column) if x in columns],
+            ),
+            source_column,
+            response_column,
+        )
+
+    @classmethod
+    def _predict_file(
+        cls,
+        args,
+        predicter: "ModelPredicter",
+        file_path: Path,
+        output_path: Path,
+        separator: str,
+        source_column: str,
+        output_column: str,
+        *,
+        response_column: Optional[str] = None,
+        log: Optional["DisplacyLog"] = None,
+        previous: Optional[dict[str, str]] = None,
+        manifest: Optional["JobManifest"] = None,
+    ):
+        from core.preprocessor import DataPreprocessor
+
+        metrics = predicter.metrics
+        encoding = args.encoding
+        start_header = cls._get_start_header(args, file_path, separator, source_column)
+        if args.chunksize:
+            chunks = DataPreprocessor.load_chunks(
+                file_path,
+                separator,
+                encoding,
+                chunksize=args.chunksize,
+                start_header=start_header,
+                arrow=args.arrow,
+            )
+            first_chunk = next(chunks, None)
+            if first_chunk is None:
+                raise ValueError("O arquivo selecionado está vazio.")
+            columns = list(first_chunk.columns.values)
+            chunks = itertools.chain([first_chunk], chunks)
+        elif args.src_only:
+            columns = list(
+                DataPreprocessor.load_header(
+                    file_path, separator, encoding, start_header=start_header
+                ).columns.values
+            )
+        else:
+            with metrics.stage("load") as stage:
+                df = DataPreprocessor.load(
+                    file_path,
+                    separator,
+                    encoding,
+                    start_header=start_header,
+                    arrow=args.arrow,
                 )
-            if log_path:
-                logger.info(f"Logging in: {log_path.absolute()}")
+                stage["rows"] = len(df)
+            columns = list(df.columns.values)
+        if source_column not in columns:
+            raise ValueError(
+                f"A coluna selecionada não existe no DataFrame: {file_path}"
+            )
 
-            predicter = ModelPredicter(model_path, gpu_id=args.gpu_id)
-            df, docs = predicter.predict(
-                df,
+        if args.chunksize:
+            cls._predict_chunks(
+                predicter,
+                chunks,
+                file_path,
+                output_path,
+                separator,
                 source_column,
                 output_column,
                 max_variation=args.max_variation,
-                log=isinstance(log_path, Path),
+                chunksize=args.chunksize,
+                log=log,
+                previous=previous,
+                manifest=manifest,
+                response_column=response_column,
             )
-            output_path: Path = ensure_path(args.output)
+            return
 
-            if output_path.is_file():
-                output_path = output_path.with_suffix(".csv")
-            elif output_path.is_dir():
-                output_path = output_path / f"{file_path.stem}.csv"
+        if args.src_only:
+            # Only the source column is read for the inference
+            with metrics.stage("load") as stage:
+                df = DataPreprocessor.load(
+                    file_path,
+                    separator,
+                    encoding,
+                    start_header=start_header,
+                    columns=[source_column],
+                    arrow=args.arrow,
+                )
+                stage["rows"] = len(df)
+        df = predicter.predict(
+            df,
+            source_column,
+            output_column,
+            max_variation=args.max_variation,
+            log=log,
+            previous=previous,
+            response_column=response_column,
+        )
+        logger.success(f"Saving output file: {output_path}")
+        with metrics.stage("write", rows=len(df)):
+            if args.src_only:
+                DataPreprocessor.save_joined(
+                    file_path,
+                    output_path,
+                    separator,
+                    encoding,
+                    start_header=start_header,
+                    after_column=source_column,
+                    outputs={
+                        x: df[x].to_numpy(dtype=object)
+                        for x in (output_column, response_column)
+                        if x is not None
+                    },
+                )
+            else:
+                DataPreprocessor.save(df, output_path, separator)
 
-            if not output_path.parent.exists():
-                output_path.parent.mkdir(parents=True, exist_ok=True)
-                logger.info(f"Created output directory: {output_path.parent}")
+    @classmethod
+    def execute(cls, args):
+        try:
+            from core.preprocessor import DataPreprocessor
+            from core.predicter import ModelPredicter
+            from core.manifest import JobManifest
+            from utils.metrics import RunMetrics
 
-            logger.success(f"Saving output file: {output_path}")
-            df.to_csv(output_path, sep=separator, index=False)
-            del df
+            metrics = RunMetrics(args.metrics, command="predict", profile=args.profile)
+            predicter = None
+            log = None
+            try:
+                inputs = cls._get_inputs(args.data)
+                separator: str = SEPARATORS.get(args.sep)
+                separator = separator if separator is not None else args.sep
+                if args.src_only and args.chunksize:
+                    raise ValueError(
+                        "O uso de --src_only não é suportado com --chunksize"
+                    )
+
+                # A directory or glob is predicted into the --output directory
+                # with one model load, a shared cache and a manifest to resume
+                batch = not args.data.is_file()
+                if batch:
+                    if args.output.is_file():
+                        raise ValueError(
+                            "Com vários arquivos, --output deve ser um diretório"
+                        )
+                    args.output.mkdir(parents=True, exist_ok=True)
+                    logger.info(f"{len(inputs)} arquivos encontrados em: {args.data}")
+                cache_dir = args.cache
+                if cache_dir is None and batch:
+                    cache_dir = args.output / ".cache"
+                manifest_path = args.manifest
+                if manifest_path is None and batch:
+                    manifest_path = args.output / "manifest.json"
+
+                output_paths = [cls._get_output_path(args.output, x) for x in inputs]
+                if separator is None and all(
+                    DataPreprocessor.is_parquet(x) for x in inputs + output_paths
+                ):
+                    # Only a CSV output needs a separator
+                    separator = SEPARATORS["SEMICOLON"]
+                if separator is None:
+                    separator = cls._choose_separator()
+                if separator is None:
+                    raise ValueError(f"O separador {separator} é invalido")
+
+                source_column, output_column = cls._get_columns(
+                    args, inputs[0], separator
+                )
+                # An output used as --previous keeps the responses for the next
+                response_column = (
+                    ModelPredicter.response_column(output_column)
+                    if args.responses or args.previous is not None
+                    else None
+                )
+                manifest = (
+                    JobManifest(
+                        manifest_path,
+                        cls._manifest_settings(args, source_column, output_column),
+                    )
+                    if manifest_path is not None
+                    else None
+                )
+                pending = [
+                    (file_path, output_path)
+                    for file_path, output_path in zip(inputs, output_paths)
+                    if manifest is None
+                    or not cls._is_done(manifest, file_path, output_path)
+                ]
+                if len(pending) == 0:
+                    return
+
+                log = cls._create_log(args)
+                predicter = ModelPredicter(
+                    args.model,
+                    gpu_id=args.gpu_id,
+                    batch_size=args.batch_size,
+                    batch_tokens=args.batch_tokens,
+                    workers=args.workers,
+                    cache_dir=cache_dir,
+                    cache_size=args.cache_size,
+                    optimize=args.optimize,
+                    window=args.window,
+                    stride=args.stride,
+                    gazetteer=args.gazetteer,
+                    cascade=args.cascade,
+                    cascade_threshold=args.cascade_threshold,
+                    metrics=metrics,
+                )
+                previous = (
+                    cls._load_previous(
+                        args.previous, separator, source_column, response_column
+                    )
+                    if args.previous is not None
+                    else None
+                )
 
-            if docs and isinstance(log_path, Path):
-                svg = displacy.render(docs, style="ent", page=True, minify=True)
+                failed = []
+                for file_path, output_path in pending:
+                    try:
+                        if batch:
+                            logger.info(f"Processando: {file_path}")
+                        cls._predict_file(
+                            args,
+                            predicter,
+                            file_path,
+                            output_path,
+                            separator,
+                            source_column,
+                            output_column,
+                            response_column=response_column,
+                            log=log,
+                            previous=previous,
+                            manifest=manifest,
+                        )
+                        if manifest is not None:
+                            manifest.update(
+                                file_path,
+                                status="done",
+                                output=str(output_path.absolute()),
+                                error=None,
+                                chunks=None,
+                                offset=None,
+                                organizations=None,
+                            )
+                    except Exception as e:
+                        if not batch:
+                            raise
+                        # One bad file doesn't stop the others, it is retried
+                        # (or resumed) by the next run
+                        logger.opt(exception=sys.exc_info()).error(
+                            f"Falha ao processar {file_path}: {e}"
+                        )
+                        failed.append(file_path)
+                        if manifest is not None:
+                            manifest.update(file_path, status="failed", error=str(e))
 
-                if not log_path.parent.exists():
-                    log_path.parent.mkdir(parents=True, exist_ok=True)
-                log_path.open("w", encoding="utf-8").write(svg)
+                if failed:
+                    logger.warning(
+                        f"{len(failed)} arquivo(s) com falha: "
+                        + ", ".join(str(x) for x in failed)
+                    )
+            finally:
+                if predicter is not None:
+                    predicter.close()
+                if log is not None:
+                    log.close()
+                metrics.close()
 
         except Exception as e:
             exception = sys.exc_info()
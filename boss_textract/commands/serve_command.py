@@ -0,0 +1,60 @@
+import asyncio
+from pathlib import Path
+import sys
+from utils.logger import logger
+from commands.base_command import BaseCommand
+
+
+class ServeCommand(BaseCommand):
+    @staticmethod
+    def add_arguments(parser):
+        parser.add_argument("--model", type=Path, required=True)
+        parser.add_argument("--host", type=str, default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8000)
+        parser.add_argument("--socket", type=Path)
+        parser.add_argument("--max_batch_size", type=int, default=64)
+        parser.add_argument("--batch_tokens", type=int, default=4096)
+        parser.add_argument("--max_wait_ms", type=float, default=10)
+        parser.add_argument("--gpu_id", type=int, default=-1)
+        parser.add_argument("--cache", type=Path)
+        parser.add_argument("--cache_size", type=int, default=1_000_000)
+        parser.add_argument("--optimize", type=str, choices=["cpu"])
+        parser.add_argument("--window", type=int)
+        parser.add_argument("--stride", type=int)
+        parser.add_argument("--gazetteer", type=Path)
+        parser.add_argument("--cascade", type=Path)
+        parser.add_argument("--cascade_threshold", type=float, default=0.9)
+
+    @classmethod
+    def execute(cls, args):
+        try:
+            from core.predicter import ModelPredicter
+            from core.server import PredictionServer
+
+            predicter = ModelPredicter(
+                args.model,
+                gpu_id=args.gpu_id,
+                batch_size=args.max_batch_size,
+                batch_tokens=args.batch_tokens,
+                cache_dir=args.cache,
+                cache_size=args.cache_size,
+                optimize=args.optimize,
+                window=args.window,
+                stride=args.stride,
+                gazetteer=args.gazetteer,
+                cascade=args.cascade,
+                cascade_threshold=args.cascade_threshold,
+            )
+            server = PredictionServer(
+                predicter,
+                max_batch_size=args.max_batch_size,
+                max_wait=args.max_wait_ms / 1000,
+            )
+            asyncio.run(
+                server.serve(host=args.host, port=args.port, socket_path=args.socket)
+            )
+        except KeyboardInterrupt:
+            logger.info("Servidor finalizado.")
+        except Exception as e:
+            exception = sys.exc_info()
+            logger.opt(exception=exception).error(e)
@@ -0,0 +1,46 @@
+from pathlib import Path
+import sys
+from utils.logger import logger
+from commands.base_command import BaseCommand
+from utils import SEPARATORS
+
+
+class ShardCommand(BaseCommand):
+    @staticmethod
+    def add_arguments(parser):
+        parser.add_argument("--data", type=Path, required=True)
+        parser.add_argument("--parts", type=int, required=True)
+        parser.add_argument("--output", type=Path, required=True)
+        parser.add_argument("--src_col", type=str, required=True)
+        parser.add_argument("--start_header", type=int, default=0)
+        parser.add_argument("--sep", type=str, default="SEMICOLON")
+        parser.add_argument("--encoding", type=str, default="UTF-8")
+        parser.add_argument("--chunksize", type=int, default=100_000)
+
+    @classmethod
+    def execute(cls, args):
+        try:
+            from core.sharding import shard_file
+
+            if not args.data.is_file():
+                raise TypeError("O arquivo selecionado é invalido.")
+            separator = SEPARATORS.get(args.sep)
+            separator = separator if separator is not None else args.sep
+            if not args.output.exists():
+                args.output.mkdir(parents=True, exist_ok=True)
+
+            paths = shard_file(
+                args.data,
+                args.output,
+                args.parts,
+                args.src_col,
+                separator,
+                args.encoding,
+                start_header=args.start_header,
+                chunksize=args.chunksize,
+            )
+            logger.success(f"{len(paths)} partes salvas em: {args.output}")
+
+        except Exception as e:
+            exception = sys.exc_info()
+            logger.opt(exception=exception).error(e)
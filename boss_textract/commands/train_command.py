@@ -2,21 +2,24 @@ from email.policy import default
 import math
 from pathlib import Path
 import sys
-from typing import Union
+import tempfile
+from typing import TYPE_CHECKING, Optional, Union
 import os
 from utils._version import __version__
-import pandas as pd
-from core.preprocessor import DataPreprocessor
-from core.trainer import ModelTrainer
 from utils.logger import logger
 from utils import SEPARATORS
 import glob
 import re
 from commands.base_command import BaseCommand
-from spacy.util import load_config
 
-if os.name != "nt":
-    from bullet import ScrollBar
+# pandas, spaCy (and sklearn through the trainer) are imported inside
+# execute, so the parser is built without loading them
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+# Epochs trained when --epochs isn't informed (not used with --stream)
+DEFAULT_EPOCHS = 10
 
 
 class MissingColumnError(Exception): ...
@@ -27,7 +30,7 @@ class EmptyResponseError(Exception): ...
 
 class TrainCommand(BaseCommand):
     @classmethod
-    def _has_columns(cls, df: pd.DataFrame, columns: Union[str, list[str]]):
+    def _has_columns(cls, df: "pd.DataFrame", columns: Union[str, list[str]]):
         if isinstance(columns, str):
             columns = [columns]
 
@@ -37,7 +40,7 @@ class TrainCommand(BaseCommand):
         return all([x if x in df.columns else False for x in columns])
 
     @classmethod
-    def _get_columns(cls, df: pd.DataFrame, args):
+    def _get_columns(cls, df: "pd.DataFrame", args):
         df_columns = list(df.columns.values)
 
         src_column = args.src_col
@@ -87,6 +90,93 @@ class TrainCommand(BaseCommand):
 
         return src_column, res_columns
 
+    @staticmethod
+    def _get_overrides(args, config_path: Path, model: Optional[Path]):
+        from spacy.util import load_config
+
+        config = load_config(config_path)
+
+        overrides = {}
+        overrides["training.max_epochs"] = (
+            args.epochs if args.epochs is not None else DEFAULT_EPOCHS
+        )
+        overrides["training.max_steps"] = (
+            args.max_steps
+            if args.max_steps is not None
+            else config["training"]["max_steps"]
+        )
+        overrides["training.eval_frequency"] = (
+            args.eval_frequency
+            if args.eval_frequency is not None
+            else config["training"]["eval_frequency"]
+        )
+        overrides["training.dropout"] = (
+            args.dropout if args.dropout is not None else config["training"]["dropout"]
+        )
+        if args.eval_limit is not None:
+            overrides["corpora.dev.limit"] = args.eval_limit
+
+        # Every component of the config pipeline (transformer + ner or
+        # tok2vec + ner) is sourced from --model, or created by its factory
+        for name in config["nlp"]["pipeline"]:
+            if model:
+                overrides[f"components.{name}.source"] = str(model)
+            elif "factory" not in config["components"].get(name, {}):
+                overrides[f"components.{name}.factory"] = name
+
+        return overrides
+
+    @staticmethod
+    def _get_trainings(args):
+        # (config, output, source model) of each model to train, the small
+        # CPU model is trained from scratch over the same corpus
+        trainings = []
+        if args.small_config is not None:
+            trainings.append((args.small_config, args.output / "small", None))
+        trainings.append((args.config, args.output, args.model))
+        return trainings
+
+    @staticmethod
+    def _get_stream_overrides(
+        args, src_column: str, res_columns: list, separator: str, min_samples: int
+    ):
+        # Both corpora are read lazily from the CSV, without --eval the dev
+        # rows are picked by a hash of the text (deterministic split). With
+        # max_epochs >= 0 spaCy keeps the whole train corpus in a list to
+        # shuffle it each epoch, -1 streams it (unshuffled) until max_steps.
+        # With --eval the train corpus skips the eval texts, as the
+        # in-memory path drops them from the train rows
+        overrides = {"training.max_epochs": -1}
+        for name, path, split, samples, exclude in (
+            (
+                "train",
+                args.data,
+                None if args.eval is not None else "train",
+                min_samples,
+                str(args.eval) if args.eval is not None else None,
+            ),
+            (
+                "dev",
+                args.eval if args.eval is not None else args.data,
+                None if args.eval is not None else "dev",
+                1 if args.eval is not None else min_samples,
+                None,
+            ),
+        ):
+            overrides[f"corpora.{name}.@readers"] = "boss_textract.CsvCorpus.v1"
+            overrides[f"corpora.{name}.path"] = str(path)
+            overrides[f"corpora.{name}.source_column"] = src_column
+            overrides[f"corpora.{name}.response_columns"] = ";".join(
+                f"{x['column']}:{x['type']}" for x in res_columns
+            )
+            overrides[f"corpora.{name}.split"] = split
+            overrides[f"corpora.{name}.train_size"] = args.train_size
+            overrides[f"corpora.{name}.separator"] = separator
+            overrides[f"corpora.{name}.encoding"] = args.encoding
+            overrides[f"corpora.{name}.min_samples"] = samples
+            overrides[f"corpora.{name}.exclude"] = exclude
+        return overrides
+
     @staticmethod
     def _choose_column(question: str, columns: list):
         if columns is not None and len(columns) == 0:
@@ -96,6 +186,8 @@ class TrainCommand(BaseCommand):
         if os.name == "nt":
             return None
 
+        from bullet import ScrollBar
+
         print("\n", end="")
         return ScrollBar(
             prompt=f"{question}:\n",
@@ -123,20 +215,35 @@ class TrainCommand(BaseCommand):
         parser.add_argument("--encoding", type=str, default="UTF-8")
         parser.add_argument("--sep", type=str, default="SEMICOLON")
         parser.add_argument("--min_samples", type=int, default=5)
-        parser.add_argument("--epochs", type=int, default=10)
+        parser.add_argument("--epochs", type=int)
+        parser.add_argument("--max_steps", type=int)
         parser.add_argument("--gpu_id", type=int, default=-1)
         parser.add_argument("--train_size", type=float, default=0.8)
         parser.add_argument("--dropout", type=float)
         parser.add_argument("--eval_frequency", type=int)
-        parser.add_argument(
-            "--output",
-            type=Path,
-            default=f"./models/boss-ner-{__version__}-{get_next_model_number(__version__)}",
-        )
+        parser.add_argument("--eval_limit", type=int)
+        parser.add_argument("--corpus_cache", type=Path)
+        parser.add_argument("--workers", type=int, default=1)
+        parser.add_argument("--stream", action="store_true")
+        parser.add_argument("--small_config", type=Path)
+        parser.add_argument("--output", type=Path)
+        parser.add_argument("--metrics", type=Path)
+        parser.add_argument("--profile", type=Path)
 
     @classmethod
     def execute(cls, args):
         try:
+            from core.preprocessor import DataPreprocessor
+            from core.trainer import ModelTrainer
+            from utils.metrics import RunMetrics
+
+            metrics = RunMetrics(args.metrics, command="train", profile=args.profile)
+
+            if args.output is None:
+                args.output = Path(
+                    f"./models/boss-ner-{__version__}-{get_next_model_number(__version__)}"
+                )
+
             file_path = args.data
             eval_path = args.eval
             train_size = args.train_size
@@ -156,14 +263,26 @@ class TrainCommand(BaseCommand):
 
             if separator is None:
                 raise ValueError(f"O separador {separator} é invalido")
+            if args.stream and args.epochs is not None:
+                raise ValueError(
+                    "O uso de --epochs não é suportado com --stream (o corpus é lido "
+                    "sem épocas), limite o treino com --max_steps"
+                )
 
             # Loading and formatting dataframe
-            df_input = DataPreprocessor.load(file_path, separator, encoding)
-            df_eval = (
-                DataPreprocessor.load(eval_path, separator, encoding)
-                if eval_path is not None
-                else None
+            load = (
+                DataPreprocessor.load_header if args.stream else DataPreprocessor.load
             )
+            with metrics.stage("load") as stage:
+                df_input = load(file_path, separator, encoding)
+                df_eval = (
+                    load(eval_path, separator, encoding)
+                    if eval_path is not None
+                    else None
+                )
+                stage["rows"] = df_input.shape[0] + (
+                    df_eval.shape[0] if df_eval is not None else 0
+                )
 
             src_column, res_columns = cls._get_columns(df_input, args)
             if len(res_columns) == 0:
@@ -188,6 +307,25 @@ class TrainCommand(BaseCommand):
             logger.info(f"Coluna de origem: [{src_column}]")
             logger.info(f"Coluna c/ resposta: [{res_columns}]")
 
+            if args.stream:
+                stream_overrides = cls._get_stream_overrides(
+                    args, src_column, res_columns, separator, min_samples
+                )
+                for config_path, output_path, model in cls._get_trainings(args):
+                    overrides = cls._get_overrides(args, config_path, model)
+                    overrides.update(stream_overrides)
+                    if overrides["training.max_steps"] <= 0:
+                        raise ValueError(
+                            f"O uso de --stream exige max_steps maior que zero "
+                            f"({config_path}), informe --max_steps"
+                        )
+                    trainer = ModelTrainer(
+                        config_path, output_path, overrides=overrides, metrics=metrics
+                    )
+                    trainer.train_corpora(gpu_id=args.gpu_id)
+                metrics.close()
+                return
+
             logger.info("Iniciando criação do dataset de treino...")
             logger.info(
                 f"Amostras listadas: Treino [{df_input.shape[0] if df_eval is not None else math.ceil(df_input.shape[0] * train_size)}] | Validação [{df_eval.shape[0] if df_eval is not None else math.ceil(df_input.shape[0] * (1 - train_size))}]"
@@ -196,17 +334,24 @@ class TrainCommand(BaseCommand):
             if df_eval is not None:
                 df_input = df_input[~df_input[src_column].isin(df_eval[src_column])]
 
-            dataset = DataPreprocessor.create_train_dataframe(
-                df_input, src_column, res_columns, MIN_SAMPLES=min_samples
-            )
+            with metrics.stage("normalize") as stage:
+                stage["rows"] = df_input.shape[0] + (
+                    df_eval.shape[0] if df_eval is not None else 0
+                )
+                dataset = DataPreprocessor.create_train_dataframe(
+                    df_input, src_column, res_columns, MIN_SAMPLES=min_samples
+                )
 
-            eval_dataset = (
-                DataPreprocessor.create_train_dataframe(
-                    df_eval, src_column, res_columns, MIN_SAMPLES=1
+                eval_dataset = (
+                    DataPreprocessor.create_train_dataframe(
+                        df_eval, src_column, res_columns, MIN_SAMPLES=1
+                    )
+                    if df_eval is not None
+                    else None
+                )
+                stage["samples"] = len(dataset) + (
+                    len(eval_dataset) if eval_dataset is not None else 0
                 )
-                if df_eval is not None
-                else None
-            )
             del df_eval, df_input
 
             logger.info("Iniciando criação do dataset de treino...")
@@ -214,39 +359,29 @@ class TrainCommand(BaseCommand):
                 f"Amostras de Apuradas: Treino [{len(dataset) if eval_dataset is not None else math.ceil(len(dataset) * train_size)}] | Validação [{len(eval_dataset) if eval_dataset is not None else math.ceil(len(dataset) * (1 - train_size))}]"
             )
 
-            config = load_config(args.config)
-
-            overrides = {}
-            overrides["training.max_epochs"] = (
-                args.epochs
-                if args.epochs is not None
-                else config["training"]["max_epochs"]
-            )
-            overrides["training.eval_frequency"] = (
-                args.eval_frequency
-                if args.eval_frequency is not None
-                else config["training"]["eval_frequency"]
-            )
-            overrides["training.dropout"] = (
-                args.dropout
-                if args.dropout is not None
-                else config["training"]["dropout"]
-            )
-
-            if args.model:
-                overrides["components.ner.source"] = str(args.model)
-                overrides["components.transformer.source"] = str(args.model)
-            else:
-                overrides["components.ner.factory"] = "ner"
-                overrides["components.transformer.factory"] = "transformer"
-
-            trainer = ModelTrainer(args.config, args.output, overrides=overrides)
-            trainer.train(
-                dataset,
-                train_size=train_size,
-                gpu_id=args.gpu_id,
-                dev_data=eval_dataset,
-            )
+            with tempfile.TemporaryDirectory() as temp_dir:
+                # With --small_config both models share the prepared corpus
+                corpus_cache = args.corpus_cache
+                if corpus_cache is None and args.small_config is not None:
+                    corpus_cache = Path(temp_dir)
+
+                for config_path, output_path, model in cls._get_trainings(args):
+                    logger.info(f"Treinando {config_path} em {output_path}")
+                    trainer = ModelTrainer(
+                        config_path,
+                        output_path,
+                        overrides=cls._get_overrides(args, config_path, model),
+                        corpus_cache=corpus_cache,
+                        workers=args.workers,
+                        metrics=metrics,
+                    )
+                    trainer.train(
+                        dataset,
+                        train_size=train_size,
+                        gpu_id=args.gpu_id,
+                        dev_data=eval_dataset,
+                    )
+            metrics.close()
 
         except EmptyResponseError as e:
             logger.error("Nenhuma coluna de resposta foi selecionada")
@@ -0,0 +1,266 @@
+import platform
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Iterable, Optional, Union
+
+import pandas as pd
+import spacy
+from spacy.training import Example
+
+from core.corpus import make_reference_doc
+from core.predicter import ModelPredicter
+from core.preprocessor import DataPreprocessor
+from core.trainer import ModelTrainer
+from utils._version import __version__
+from utils.logger import logger
+
+SOURCE_COLUMN = "HISTORICO"
+RESPONSE_COLUMN = "EMPRESA"
+RESPONSE_COLUMNS = [{"column": RESPONSE_COLUMN, "type": "ORG"}]
+
+_FIRST_WORDS = (
+    "ALFA", "ATLAS", "BRASIL", "CENTRAL", "COMERCIAL", "DISTRIBUIDORA", "ESTRELA",
+    "FORTE", "GLOBAL", "IMPERIAL", "MASTER", "NACIONAL", "NOVA", "PAULISTA",
+    "PRIME", "REAL", "SAO JORGE", "SANTA CLARA", "TOTAL", "UNIAO", "VALE", "VIA",
+)
+_SECOND_WORDS = (
+    "ALIMENTOS", "AUTO PECAS", "COMBUSTIVEIS", "CONSTRUCOES", "CONTABILIDADE",
+    "ENGENHARIA", "FARMA", "INFORMATICA", "LOGISTICA", "MATERIAIS", "METAIS",
+    "PAPELARIA", "SERVICOS", "SUPERMERCADOS", "TECNOLOGIA", "TELECOM",
+    "TRANSPORTES", "VEICULOS",
+)
+_SUFFIXES = (
+    " LTDA", " LTDA.", " LTDA - ME", " LTDA - EPP", " S.A", " S.A.", " S/A",
+    " - ME", " EIRELI", " ME", "",
+)
+_TEMPLATES = (
+    "NF {invoice} {org} {date}",
+    "{org}/ RPS: {invoice}",
+    "PAGTO {org} CNPJ {cnpj}",
+    "{cnpj} / {org} / {month}-{year}",
+    "FATURA {invoice} - {org} - VENC {date}",
+    "TED {org}//NF {invoice}",
+    "{org}",
+    "DUPL {invoice}/{installment} {org} {date}",
+)
+_MONTHS = (
+    "JAN", "FEV", "MAR", "ABR", "MAI", "JUN", "JUL", "AGO", "SET", "OUT", "NOV", "DEZ",
+)
+_CNPJ_WEIGHTS = (
+    (5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2),
+    (6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2),
+)
+
+
+def _cnpj(rng: random.Random) -> str:
+    digits = [rng.randint(0, 9) for _ in range(8)] + [0, 0, 0, 1]
+    # Check digits of the CNPJ (modulo 11), so the generated ones are valid
+    for weights in _CNPJ_WEIGHTS:
+        rest = sum(x * y for x, y in zip(digits, weights)) % 11
+        digits.append(0 if rest < 2 else 11 - rest)
+    cnpj = "".join(str(x) for x in digits)
+    return f"{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:]}"
+
+
+def _typo(rng: random.Random, name: str) -> str:
+    # Small variations of the same organization, the job of max_variation
+    index = rng.randrange(len(name))
+    return name[:index] + name[index + 1 :] if name[index] != " " else name
+
+
+def generate_records(
+    size: int, *, seed: int = 0, organizations: Optional[int] = None
+) -> pd.DataFrame:
+    rng = random.Random(seed)
+    organizations = organizations or max(10, size // 20)
+    names = [
+        f"{rng.choice(_FIRST_WORDS)} {rng.choice(_SECOND_WORDS)}{rng.choice(_SUFFIXES)}"
+        for _ in range(organizations)
+    ]
+    sources, responses = [], []
+    for _ in range(size):
+        org = rng.choice(names)
+        if rng.random() < 0.05:
+            org = _typo(rng, org)
+        source = rng.choice(_TEMPLATES).format(
+            org=org,
+            invoice=rng.randint(1, 999_999),
+            installment=rng.randint(1, 12),
+            cnpj=_cnpj(rng),
+            date=f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(2019, 2025)}",
+            month=rng.choice(_MONTHS),
+            year=rng.randint(19, 25),
+        )
+        if rng.random() < 0.1:
+            source = source.replace(" ", rng.choice(("/", " / ", "  ")), 1)
+        sources.append(source)
+        responses.append(org)
+    return pd.DataFrame({SOURCE_COLUMN: sources, RESPONSE_COLUMN: responses})
+
+
+def build_tiny_model(
+    output_path: Union[str, Path], dataset: list, *, epochs: int = 5, seed: int = 0
+):
+    # Blank pt pipeline with the default CNN ner, trained for a few epochs so
+    # the predictions look like the real ones without downloading a model
+    spacy.util.fix_random_seed(seed)
+    nlp = spacy.blank("pt")
+    nlp.add_pipe("ner")
+    examples = [
+        Example(nlp.make_doc(text), make_reference_doc(nlp, text, ann["entities"])[0])
+        for text, ann in dataset
+    ]
+    optimizer = nlp.initialize(lambda: examples)
+    rng = random.Random(seed)
+    for _ in range(epochs):
+        rng.shuffle(examples)
+        for batch in spacy.util.minibatch(examples, size=32):
+            nlp.update(batch, sgd=optimizer)
+    nlp.to_disk(output_path)
+
+
+def _timeit(function: Callable, repeat: int) -> float:
+    # Best of repeat runs, the least disturbed by the rest of the machine
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _benchmark_scale(
+    df: pd.DataFrame,
+    model_path: Path,
+    work_dir: Path,
+    *,
+    repeat: int,
+    max_variation: int,
+) -> dict[str, float]:
+    timings = {}
+    timings["format_column"] = _timeit(
+        lambda: DataPreprocessor.format_column(df[SOURCE_COLUMN]), repeat
+    )
+    timings["create_train_dataframe"] = _timeit(
+        lambda: DataPreprocessor.create_train_dataframe(
+            df, SOURCE_COLUMN, RESPONSE_COLUMNS, MIN_SAMPLES=1
+        ),
+        repeat,
+    )
+    dataset = DataPreprocessor.create_train_dataframe(
+        df, SOURCE_COLUMN, RESPONSE_COLUMNS, MIN_SAMPLES=1
+    )
+    trainer = ModelTrainer(model_path / "config.cfg", work_dir / "model")
+    timings["prepare_training_data"] = _timeit(
+        lambda: trainer._prepare_training_data(
+            dataset, work_dir / "train.spacy", "BENCHMARK"
+        ),
+        repeat,
+    )
+
+    predicter = ModelPredicter(model_path, gpu_id=-1)
+    data = df[[SOURCE_COLUMN]]
+    timings["predict"] = _timeit(
+        lambda: predicter.predict(
+            data.copy(), SOURCE_COLUMN, "OUTPUT", max_variation=0
+        ),
+        repeat,
+    )
+
+    # The steps of the max_variation polishing over the predicted organizations
+    _, texts, responses, outputs = predicter._infer(data[SOURCE_COLUMN])
+    predicter.orgs_list = {}
+    for response in responses:
+        if response != "":
+            predicter.orgs_list.setdefault(response, {"codes": []})
+    polished = {}
+    timings["polish_organizations"] = _timeit(
+        lambda: polished.update(predicter._polish(max_variation)), repeat
+    )
+    timings["fill_empty"] = _timeit(
+        lambda: ModelPredicter._fill_empty(
+            texts, outputs.copy(), predicter._fallback_matcher(polished)
+        ),
+        repeat,
+    )
+    return timings
+
+
+def run_benchmark(
+    scales: Iterable[int],
+    *,
+    repeat: int = 3,
+    seed: int = 0,
+    max_variation: int = 3,
+    train_size: int = 1000,
+) -> dict:
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_dir = Path(temp_dir)
+        logger.info(f"Treinando o modelo do benchmark com {train_size} registros...")
+        train_df = generate_records(train_size, seed=seed + 1)
+        build_tiny_model(
+            temp_dir / "tiny",
+            DataPreprocessor.create_train_dataframe(
+                train_df, SOURCE_COLUMN, RESPONSE_COLUMNS, MIN_SAMPLES=1
+            ),
+            seed=seed,
+        )
+
+        for size in scales:
+            logger.info(f"Benchmark com {size} registros...")
+            df = generate_records(size, seed=seed)
+            timings = _benchmark_scale(
+                df,
+                temp_dir / "tiny",
+                temp_dir,
+                repeat=repeat,
+                max_variation=max_variation,
+            )
+            for stage, seconds in timings.items():
+                results.append(
+                    {
+                        "stage": stage,
+                        "records": size,
+                        "seconds": seconds,
+                        "records_per_second": size / seconds if seconds > 0 else None,
+                    }
+                )
+                logger.info(f"{stage:<24}{size:>10}{seconds:>12.4f}s")
+
+    return {
+        "version": __version__,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "spacy": spacy.__version__,
+        "pandas": pd.__version__,
+        "settings": {
+            "repeat": repeat,
+            "seed": seed,
+            "max_variation": max_variation,
+            "train_size": train_size,
+        },
+        "results": results,
+    }
+
+
+def compare_results(baseline: dict, current: dict) -> list[dict]:
+    # Matched by stage and number of records, ratio > 1 means slower
+    seconds = {(x["stage"], x["records"]): x["seconds"] for x in baseline["results"]}
+    return [
+        {
+            "stage": x["stage"],
+            "records": x["records"],
+            "baseline": seconds[(x["stage"], x["records"])],
+            "current": x["seconds"],
+            "ratio": x["seconds"] / seconds[(x["stage"], x["records"])]
+            if seconds[(x["stage"], x["records"])] > 0
+            else None,
+        }
+        for x in current["results"]
+        if (x["stage"], x["records"]) in seconds
+    ]
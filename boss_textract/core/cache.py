@@ -0,0 +1,148 @@
+import hashlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Iterable, Union
+
+from utils.logger import logger
+
+Entities = tuple[tuple[int, int, str], ...]
+
+# Files hashed by content, the others (weights) by size and modification time
+_FINGERPRINT_CONTENT_FILES = {"meta.json", "config.cfg"}
+_SQLITE_MAX_VARIABLES = 900
+
+
+def model_fingerprint(model_path: Union[str, Path]) -> str:
+    model_path = Path(model_path)
+    digest = hashlib.sha256()
+    for file in sorted(x for x in model_path.rglob("*") if x.is_file()):
+        digest.update(str(file.relative_to(model_path)).encode("utf-8"))
+        if file.name in _FINGERPRINT_CONTENT_FILES:
+            digest.update(file.read_bytes())
+        else:
+            stat = file.stat()
+            digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class PredictionCache:
+    FILE_NAME = "predictions.sqlite3"
+
+    def __init__(
+        self,
+        cache_dir: Union[str, Path],
+        model_path: Union[str, Path],
+        *,
+        max_entries: int = 1_000_000,
+        variant: str = "",
+    ):
+        cache_dir = Path(cache_dir)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.fingerprint = model_fingerprint(model_path)
+        model_key = str(Path(model_path).absolute())
+        if variant:
+            # The same model loaded with other settings (--optimize, ...) has
+            # its own predictions
+            self.fingerprint = hashlib.sha256(
+                f"{self.fingerprint}:{variant}".encode("utf-8")
+            ).hexdigest()
+            model_key = f"{model_key}#{variant}"
+        self.hits = 0
+        self.misses = 0
+        # Accessed by one thread at a time, but not always the creating one
+        self.connection = sqlite3.connect(
+            cache_dir / self.FILE_NAME, check_same_thread=False
+        )
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS models (
+                path TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS predictions (
+                fingerprint TEXT NOT NULL,
+                text TEXT NOT NULL,
+                ents TEXT NOT NULL,
+                last_used INTEGER NOT NULL,
+                UNIQUE (fingerprint, text)
+            );
+            CREATE INDEX IF NOT EXISTS predictions_last_used
+                ON predictions (last_used);
+            """
+        )
+        self._invalidate(model_key)
+
+    def _invalidate(self, model_path: str):
+        row = self.connection.execute(
+            "SELECT fingerprint FROM models WHERE path = ?", (model_path,)
+        ).fetchone()
+        with self.connection:
+            if row is not None and row[0] != self.fingerprint:
+                deleted = self.connection.execute(
+                    "DELETE FROM predictions WHERE fingerprint = ?", (row[0],)
+                ).rowcount
+                logger.info(
+                    f"Modelo alterado, {deleted} predições removidas do cache."
+                )
+            self.connection.execute(
+                "INSERT OR REPLACE INTO models (path, fingerprint) VALUES (?, ?)",
+                (model_path, self.fingerprint),
+            )
+            self._evict()
+
+    def get_many(self, texts: list[str]) -> dict[str, Entities]:
+        found = {}
+        now = time.time_ns()
+        with self.connection:
+            for i in range(0, len(texts), _SQLITE_MAX_VARIABLES):
+                chunk = texts[i : i + _SQLITE_MAX_VARIABLES]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.connection.execute(
+                    f"SELECT text, ents FROM predictions WHERE fingerprint = ? AND text IN ({placeholders})",
+                    (self.fingerprint, *chunk),
+                ).fetchall()
+                self.connection.execute(
+                    f"UPDATE predictions SET last_used = ? WHERE fingerprint = ? AND text IN ({placeholders})",
+                    (now, self.fingerprint, *chunk),
+                )
+                for text, ents in rows:
+                    found[text] = tuple(tuple(ent) for ent in json.loads(ents))
+
+        self.hits += len(found)
+        self.misses += len(texts) - len(found)
+        return found
+
+    def put_many(self, items: Iterable[tuple[str, Entities]]):
+        now = time.time_ns()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO predictions (fingerprint, text, ents, last_used) VALUES (?, ?, ?, ?)",
+                (
+                    (self.fingerprint, text, json.dumps(ents), now)
+                    for text, ents in items
+                ),
+            )
+            self._evict()
+
+    def _evict(self):
+        (count,) = self.connection.execute(
+            "SELECT COUNT(*) FROM predictions"
+        ).fetchone()
+        if count <= self.max_entries:
+            return
+        self.connection.execute(
+            "DELETE FROM predictions WHERE rowid IN (SELECT rowid FROM predictions ORDER BY last_used LIMIT ?)",
+            (count - self.max_entries,),
+        )
+        logger.debug(f"Cache: {count - self.max_entries} predições removidas (LRU)")
+
+    def log_stats(self):
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        logger.info(f"Cache: {self.hits} acertos | {self.misses} falhas ({rate:.1f}%)")
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,259 @@
+import hashlib
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Callable, Iterator, Optional, Union
+
+import pandas as pd
+import spacy
+from spacy.tokens import Doc, DocBin
+from spacy.training import Corpus, Example
+from spacy.training.corpus import walk_corpus
+
+from core.preprocessor import DataPreprocessor
+from utils.logger import logger
+
+
+def make_reference_doc(
+    nlp, text: str, entities: list, debug_name: Optional[str] = None
+) -> tuple[Doc, int]:
+    doc = nlp.make_doc(text)
+    ents = []
+    invalid_spans = 0
+
+    for start, end, label in entities:
+        span = doc.char_span(start, end, label=label, alignment_mode="strict")
+        if span is not None:
+            logger.trace(
+                f"Span: {str(span)} | Text: {str(doc)[start:end]} | Source: {str(doc)}"
+            )
+            ents.append(span)
+        else:
+            logger.debug(
+                f"{f'[{debug_name}] ' if debug_name is not None else ''}Source don't has char_span [{str(doc)}] <- [{str(doc)[start:end]}]"
+            )
+            invalid_spans += 1
+
+    doc.ents = ents
+    return doc, invalid_spans
+
+
+def text_hash(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+
+
+def in_split(text: str, split: Optional[str], train_size: float) -> bool:
+    if split is None:
+        return True
+    # The same text always lands on the same side, in any run or machine
+    is_train = int.from_bytes(text_hash(text), "big") / 2**64 < train_size
+    return is_train == (split == "train")
+
+
+def parse_response_columns(response_columns: str) -> list[dict[str, str]]:
+    return [
+        (lambda x: {"column": x[0], "type": x[1]})(x.split(":"))
+        for x in response_columns.split(";")
+    ]
+
+
+class _SplitCorpus(Corpus, ABC):
+    def __init__(
+        self,
+        path: Union[str, Path],
+        *,
+        split: Optional[str] = None,
+        train_size: float = 0.8,
+        limit: int = 0,
+        gold_preproc: bool = False,
+        max_length: int = 0,
+        augmenter: Optional[Callable] = None,
+    ):
+        if split not in (None, "train", "dev"):
+            raise ValueError(f"O split {split} é invalido (train, dev ou null)")
+        super().__init__(
+            path,
+            limit=limit,
+            gold_preproc=gold_preproc,
+            max_length=max_length,
+            augmenter=augmenter,
+        )
+        self.split = split
+        self.train_size = train_size
+
+    @abstractmethod
+    def _read_docs(self, nlp) -> Iterator[Doc]:
+        pass
+
+    def _reference_docs(self, nlp) -> Iterator[Doc]:
+        count = 0
+        for doc in self._read_docs(nlp):
+            if len(doc) == 0 or not in_split(doc.text, self.split, self.train_size):
+                continue
+            yield doc
+            count += 1
+            if self.limit >= 1 and count >= self.limit:
+                break
+
+    def __call__(self, nlp) -> Iterator[Example]:
+        ref_docs = self._reference_docs(nlp)
+        if self.gold_preproc:
+            examples = self.make_examples_gold_preproc(nlp, ref_docs)
+        else:
+            examples = self.make_examples(nlp, ref_docs)
+        for real_eg in examples:
+            yield from self.augmenter(nlp, real_eg)
+
+
+class DocBinCorpus(_SplitCorpus):
+    def _read_docs(self, nlp) -> Iterator[Doc]:
+        # One shard in memory at a time
+        for loc in walk_corpus(self.path, ".spacy"):
+            yield from DocBin().from_disk(loc).get_docs(nlp.vocab)
+
+
+class CsvCorpus(_SplitCorpus):
+    def __init__(
+        self,
+        path: Union[str, Path],
+        *,
+        source_column: str,
+        response_columns: str,
+        separator: str = ";",
+        encoding: str = "UTF-8",
+        min_samples: int = 1,
+        chunksize: int = 10_000,
+        exclude: Optional[Union[str, Path]] = None,
+        **kwargs,
+    ):
+        super().__init__(path, **kwargs)
+        self.source_column = source_column
+        self.response_columns = parse_response_columns(response_columns)
+        self.separator = separator
+        self.encoding = encoding
+        self.min_samples = min_samples
+        self.chunksize = chunksize
+        self.exclude = exclude
+        self._counts = None
+        self._excluded = None
+
+    def _chunks(self, path=None) -> Iterator[pd.DataFrame]:
+        return DataPreprocessor.load_chunks(
+            path if path is not None else self.path,
+            self.separator,
+            self.encoding,
+            chunksize=self.chunksize,
+        )
+
+    def _excluded_hashes(self) -> Optional[set[bytes]]:
+        if self.exclude is None:
+            return None
+        if self._excluded is not None:
+            return self._excluded
+
+        # Hashes of the normalized texts of the exclude file (the eval file of
+        # --stream --eval), only the 8 byte digests are held in memory
+        excluded = set()
+        for df in self._chunks(self.exclude):
+            for text in DataPreprocessor.format_column(df[self.source_column]):
+                if isinstance(text, str):
+                    excluded.add(text_hash(text))
+        self._excluded = excluded
+        return excluded
+
+    def _response_counts(self) -> Optional[list[pd.Series]]:
+        if self.min_samples <= 1:
+            return None
+        if self._counts is not None:
+            return self._counts
+
+        # One pass per response column, each counted over the rows kept by
+        # the previous ones, only the value counts are held in memory
+        counts = []
+        for response_col in self.response_columns:
+            total = pd.Series(dtype="int64")
+            for df in self._chunks():
+                keep = pd.Series(True, index=df.index)
+                for previous, previous_counts in zip(self.response_columns, counts):
+                    column = DataPreprocessor.format_column(df[previous["column"]])
+                    keep &= column.map(previous_counts).ge(self.min_samples)
+                column = DataPreprocessor.format_column(df[response_col["column"]])
+                total = total.add(column[keep].value_counts(), fill_value=0)
+            counts.append(total)
+        self._counts = counts
+        return counts
+
+    def _read_docs(self, nlp) -> Iterator[Doc]:
+        counts = self._response_counts()
+        excluded = self._excluded_hashes()
+        for df in self._chunks():
+            dataset = DataPreprocessor.create_train_dataframe(
+                df,
+                self.source_column,
+                self.response_columns,
+                MIN_SAMPLES=self.min_samples if counts is not None else 1,
+                counts=counts,
+            )
+            for text, annotations in dataset:
+                if excluded is not None and text_hash(text) in excluded:
+                    continue
+                yield make_reference_doc(nlp, text, annotations["entities"])[0]
+
+
+@spacy.registry.readers("boss_textract.DocBinCorpus.v1")
+def create_docbin_reader(
+    path: Optional[Path],
+    split: Optional[str] = None,
+    train_size: float = 0.8,
+    gold_preproc: bool = False,
+    max_length: int = 0,
+    limit: int = 0,
+    augmenter: Optional[Callable] = None,
+) -> Callable[["spacy.Language"], Iterator[Example]]:
+    if path is None:
+        raise ValueError("O caminho do corpus não foi informado")
+    return DocBinCorpus(
+        path,
+        split=split,
+        train_size=train_size,
+        gold_preproc=gold_preproc,
+        max_length=max_length,
+        limit=limit,
+        augmenter=augmenter,
+    )
+
+
+@spacy.registry.readers("boss_textract.CsvCorpus.v1")
+def create_csv_reader(
+    path: Optional[Path],
+    source_column: str,
+    response_columns: str,
+    split: Optional[str] = None,
+    train_size: float = 0.8,
+    separator: str = ";",
+    encoding: str = "UTF-8",
+    min_samples: int = 1,
+    chunksize: int = 10_000,
+    exclude: Optional[Path] = None,
+    gold_preproc: bool = False,
+    max_length: int = 0,
+    limit: int = 0,
+    augmenter: Optional[Callable] = None,
+) -> Callable[["spacy.Language"], Iterator[Example]]:
+    if path is None:
+        raise ValueError("O caminho do corpus não foi informado")
+    return CsvCorpus(
+        path,
+        source_column=source_column,
+        response_columns=response_columns,
+        separator=separator,
+        encoding=encoding,
+        min_samples=min_samples,
+        chunksize=chunksize,
+        exclude=exclude,
+        split=split,
+        train_size=train_size,
+        gold_preproc=gold_preproc,
+        max_length=max_length,
+        limit=limit,
+        augmenter=augmenter,
+    )
@@ -0,0 +1,110 @@
+import html
+import random
+from pathlib import Path
+from typing import Optional, Union
+
+from spacy import displacy
+
+from core.cache import Entities
+from utils.logger import logger
+
+
+class DisplacyLog:
+    def __init__(
+        self,
+        path: Union[str, Path],
+        *,
+        page_size: int = 1000,
+        sample: Optional[int] = None,
+        ambiguous: bool = False,
+        seed: int = 0,
+    ):
+        if page_size <= 0:
+            raise ValueError(f"O tamanho da página {page_size} é invalido")
+        if sample is not None and sample <= 0:
+            raise ValueError(f"O tamanho da amostra {sample} é invalido")
+        self.path = Path(path)
+        self.page_size = page_size
+        self.sample = sample
+        self.ambiguous = ambiguous
+        self.random = random.Random(seed)
+        self.seen = 0
+        self.written = 0
+        self.pages: list[Path] = []
+        # Entries of the current page, or the reservoir when sampling
+        self.entries: list[tuple[int, dict]] = []
+        if not self.path.parent.exists():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def wants(self, ents: Entities) -> bool:
+        # Texts without entities are only logged as ambiguous ones
+        if self.ambiguous:
+            return len(ents) != 1
+        return len(ents) > 0
+
+    def add(self, text: str, ents: Entities):
+        if not self.wants(ents):
+            return
+        entry = {
+            "text": text,
+            "ents": [
+                {"start": start, "end": end, "label": label}
+                for start, end, label in ents
+            ],
+            "title": None,
+        }
+        self.seen += 1
+        if self.sample is None:
+            self.entries.append((self.seen, entry))
+            if len(self.entries) >= self.page_size:
+                self._write_page()
+        elif len(self.entries) < self.sample:
+            self.entries.append((self.seen, entry))
+        else:
+            # Reservoir sampling: every logged text has the same sample/seen
+            # chance of being kept, whatever the size of the input
+            index = self.random.randrange(self.seen)
+            if index < self.sample:
+                self.entries[index] = (self.seen, entry)
+
+    def _page_path(self, number: int) -> Path:
+        return self.path.with_name(f"{self.path.stem}_{number:04d}{self.path.suffix}")
+
+    def _write_page(self):
+        page_path = self._page_path(len(self.pages) + 1)
+        svg = displacy.render(
+            [entry for _, entry in self.entries],
+            style="ent",
+            page=True,
+            minify=True,
+            manual=True,
+        )
+        page_path.write_text(svg, encoding="utf-8")
+        self.pages.append(page_path)
+        self.written += len(self.entries)
+        self.entries = []
+
+    def _write_index(self):
+        links = "".join(
+            f'<li><a href="{html.escape(page.name)}">{html.escape(page.name)}</a></li>'
+            for page in self.pages
+        )
+        self.path.write_text(
+            "<!DOCTYPE html><html lang='pt'><head><meta charset='utf-8'>"
+            f"<title>{html.escape(self.path.stem)}</title></head><body>"
+            f"<p>{len(self.pages)} página(s), {self.written} de {self.seen} texto(s)</p>"
+            f"<ol>{links}</ol></body></html>",
+            encoding="utf-8",
+        )
+
+    def close(self):
+        # The sample is written in input order, split in pages as the stream
+        entries = sorted(self.entries)
+        self.entries = []
+        for start in range(0, len(entries), self.page_size):
+            self.entries = entries[start : start + self.page_size]
+            self._write_page()
+        if not self.pages:
+            return
+        self._write_index()
+        logger.info(f"Log com {len(self.pages)} página(s) salvo em: {self.path}")
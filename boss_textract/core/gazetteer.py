@@ -0,0 +1,71 @@
+import json
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Union
+
+import spacy
+from spacy.matcher import PhraseMatcher
+
+from core.cache import Entities
+from utils.logger import logger
+
+# Company suffixes kept by the normalizer: a known name followed by one of
+# them is only a part of a longer organization ("UNIAO SERVICOS" in
+# "UNIAO SERVICOS ME"), left to the model
+ORG_SUFFIXES = {
+    "LTDA", "ME", "EM", "EPP", "EIRELI", "MEI", "EI", "CIA", "SA", "S.A", "S/A",
+    "B.V", "U.A", "A.S", "N.V", "Z.O.O", "S.P.A", "S.R.O", "S.A.C", "S.A.S",
+    "S.A.U", "S.R.L",
+}
+
+
+def load_tokenizer(model: Union[str, Path]):
+    # Only the vocab and the tokenizer of the model, no components
+    config = spacy.util.load_config(Path(model) / "config.cfg", interpolate=False)
+    return spacy.load(model, exclude=list(config["nlp"]["pipeline"]))
+
+
+class Gazetteer:
+    def __init__(self, nlp, patterns: Iterable[dict]):
+        self.nlp = nlp
+        self.matcher = PhraseMatcher(nlp.vocab)
+        phrases = {}
+        for pattern in patterns:
+            phrases.setdefault(pattern["label"], []).append(pattern["pattern"])
+        for label, values in phrases.items():
+            self.matcher.add(label, list(nlp.tokenizer.pipe(values)))
+        self.size = sum(len(x) for x in phrases.values())
+
+    @classmethod
+    def from_disk(cls, nlp, path: Union[str, Path]):
+        # Same JSONL format of the spaCy entity_ruler patterns
+        with open(path, mode="r", encoding="utf-8") as file:
+            gazetteer = cls(nlp, (json.loads(line) for line in file if line.strip()))
+        logger.info(f"Gazetteer carregado com {gazetteer.size} organizações: {path}")
+        return gazetteer
+
+    @staticmethod
+    def to_disk(patterns: Iterable[dict], path: Union[str, Path]):
+        with open(path, mode="w", encoding="utf-8") as file:
+            for pattern in patterns:
+                file.write(json.dumps(pattern, ensure_ascii=False) + "\n")
+
+    def _match(self, doc) -> Optional[Entities]:
+        # Only a single known organization is trusted: every match must lie
+        # inside the longest one (nested names), no match, two distinct or
+        # overlapping organizations or the same one twice are left to the model
+        spans = self.matcher(doc, as_spans=True)
+        if len(spans) == 0:
+            return None
+        start = min(x.start for x in spans)
+        end = max(x.end for x in spans)
+        labels = {x.label_ for x in spans if (x.start, x.end) == (start, end)}
+        if len(labels) != 1:
+            return None
+        if end < len(doc) and doc[end].text.upper().rstrip(".") in ORG_SUFFIXES:
+            return None
+        span = doc[start:end]
+        return ((span.start_char, span.end_char, labels.pop()),)
+
+    def match(self, texts: list[str]) -> Iterator[Optional[Entities]]:
+        for doc in self.nlp.tokenizer.pipe(texts):
+            yield self._match(doc)
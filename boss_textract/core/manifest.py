@@ -0,0 +1,62 @@
+import json
+import os
+from pathlib import Path
+from typing import Union
+
+from utils.logger import logger
+
+
+class JobManifest:
+    def __init__(self, path: Union[str, Path], settings: dict):
+        self.path = Path(path)
+        self.settings = settings
+        self.files: dict[str, dict] = {}
+        if self.path.is_file():
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            if data.get("settings") == settings:
+                self.files = data.get("files", {})
+            else:
+                # Other model, columns, ... the outputs can't be reused
+                logger.warning(
+                    f"O manifesto {self.path} é de outra configuração, reiniciando"
+                )
+
+    @staticmethod
+    def _key(file_path: Path) -> str:
+        return str(Path(file_path).absolute())
+
+    @staticmethod
+    def _signature(file_path: Path) -> dict:
+        stat = Path(file_path).stat()
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def entry(self, file_path: Path) -> dict:
+        key = self._key(file_path)
+        signature = self._signature(file_path)
+        entry = self.files.get(key)
+        if entry is None or entry.get("signature") != signature:
+            # New or modified input, processed from the start
+            entry = {"signature": signature, "status": "pending"}
+            self.files[key] = entry
+        return entry
+
+    def update(self, file_path: Path, **fields):
+        entry = self.entry(file_path)
+        for key, value in fields.items():
+            if value is None:
+                entry.pop(key, None)
+            else:
+                entry[key] = value
+        self.save()
+
+    def save(self):
+        # Written to a temporary file and renamed, a crash while saving keeps
+        # the previous manifest
+        temp_path = self.path.with_name(f"{self.path.name}.tmp")
+        temp_path.write_text(
+            json.dumps(
+                {"settings": self.settings, "files": self.files}, ensure_ascii=False
+            ),
+            encoding="utf-8",
+        )
+        os.replace(temp_path, self.path)
@@ -0,0 +1,106 @@
+import atexit
+import math
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+_WHITESPACE = re.compile(r"\s+")
+
+# Applied in order to every text, the same sequence formerly chained through
+# Series.replace in DataPreprocessor.format_column
+RULES = [
+    (re.compile(pattern), replacement)
+    for pattern, replacement in (
+        (r"<BR>", " "),
+        (r"\s+", " "),
+        # Ending to [CPF,CPNJ or Date] -> Empty
+        (r"\d{11,}|\d{1,2}[\/\\]\d{2,4}$", ""),
+        # [ /NAME, NAME/] -> NAME
+        (r"(?:\s|^)[\/\\](?=[\w\s\.\,])|(?<=[\w\s\.\,])[\/\\](?=\s|$)", " "),
+        # [ENTER-NAME] -> ENTER NAME
+        (r"(?<=[\w\s\.\,])\-(?=[\w\s\.\,])", " - "),
+        # [GOOGLE,LLC] -> GOOGLE LLC
+        (r"(?<=[\w\s\.\,])(?<!\s)[\\\/,\;]+(?=(?=\s)|(?!\s))(?<![\w\s])", " "),
+        # [ - ME, - EM, - EPP] -> Empty
+        (r"\s?\-\s*(ME|EM|EPP)(?=$|\s+)", ""),
+        # [ S.] -> Empty
+        (r"\s+S\.(\s+|$)", ""),
+        # [B.V.] -> B.V
+        (r"B\.V\.?(\s+|$)", "B.V "),
+        # [U.A.] -> U.A
+        (r"U\.A\.?(\s+|$)", "U.A "),
+        # [A.S.] -> A.S
+        (r"A\.S\.?(\s+|$)", "A.S "),
+        # [N.V.] -> N.V
+        (r"N\.V\.?(\s+|$)", "N.V "),
+        # [Z.O.O.] -> Z.O.O
+        (r"Z[\.\s]+O[\.\s]+O\.?[\/\\]?(\s+|$)", "Z.O.O "),
+        # [S.P.A.] -> S.P.A
+        (r"S[\.\s]+P[\.\s]+A\.?[\/\\]?(\s+|$)", "S.P.A "),
+        # [S.R.O.] -> S.R.O
+        (r"S[\.\s]+R[\.\s]+O\.?[\/\\]?(\s+|$)", "S.R.O "),
+        # [S.A.C.] -> S.A.C
+        (r"S[\.\s]+A[\.\s]+C\.?[\/\\]?(\s+|$)", "S.A.C "),
+        # [S.A.S.] -> S.A.S
+        (r"S[\.\s]+A[\.\s]+S\.?[\/\\]?(\s+|$)", "S.A.S "),
+        # [S.A.U.] -> S.A.U
+        (r"S[\.\s]+A[\.\s]+U\.?[\/\\]?(\s+|$)", "S.A.U "),
+        # [S.R.L.] -> S.R.L
+        (r"S[\.\s]+R[\.\s]+L\.?[\/\\]?(\s+|$)", "S.R.L "),
+        # [NF.1234-, NF.12345,NF.] -> Empty
+        (r"(?:NF\.)(?:(?:\d+\-?)|(?=[\w\d]))", ""),
+        # [RPS: 1234, RPS 1234] -> Empty
+        (r"(?:RPS:?\s)(?:\d+\-?)", ""),
+        # [LTDA- ME,LTDA- EM,LTDA - EPP, LTDAME] -> LTDA
+        (r"LTDA\.?\s?[\.\-\|]?(?=\w*)\s*(ME|EM|EPP|\/\d{2,4})?\s*", "LTDA "),
+        # [S.A., S\A, S/A, SA] -> S.A
+        (r"(?<=\s)S\.?/?\\?\s?A\.?(?:C\.)?(?=\s+|$)", "S.A"),
+    )
+]
+
+
+def normalize_text(text: str) -> str:
+    text = text.upper()
+    for pattern, replacement in RULES:
+        text = pattern.sub(replacement, text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def normalize_many(texts: list) -> list:
+    return [
+        normalize_text(text) if isinstance(text, str) else math.nan for text in texts
+    ]
+
+
+# Started on the first large column and reused by the next ones (chunks of
+# the same file, source and output columns), spawn is paid once per process
+_executor = None
+_executor_workers = 0
+
+
+def _get_executor(workers: int) -> ProcessPoolExecutor:
+    global _executor, _executor_workers
+    if _executor is None or _executor_workers != workers:
+        shutdown_parallel()
+        _executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        _executor_workers = workers
+    return _executor
+
+
+@atexit.register
+def shutdown_parallel():
+    global _executor, _executor_workers
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
+        _executor_workers = 0
+
+
+def normalize_parallel(
+    texts: list, workers: int, *, chunk_size: int = 10_000
+) -> list:
+    chunks = [texts[i : i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    executor = _get_executor(workers)
+    return [text for chunk in executor.map(normalize_many, chunks) for text in chunk]
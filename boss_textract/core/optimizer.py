@@ -0,0 +1,164 @@
+import time
+from pathlib import Path
+from typing import Optional, Union
+
+import spacy
+from spacy.language import Language
+from spacy.training import Example
+from thinc.api import PyTorchShim
+
+from core.corpus import make_reference_doc
+from utils.logger import logger
+
+OPTIMIZE_MODES = ("cpu",)
+META_KEY = "boss_textract"
+NER_FACTORY = "ner"
+UPSTREAM_FACTORIES = ("transformer", "tok2vec")
+
+
+def _ner_components(config) -> set[str]:
+    # The ner components and the components their listeners read from
+    components = config["components"]
+    keep = set()
+    for name, component in components.items():
+        if component.get("factory") != NER_FACTORY:
+            continue
+        keep.add(name)
+        upstream = component.get("model", {}).get("tok2vec", {}).get("upstream")
+        if upstream == "*":
+            keep.update(
+                x
+                for x, y in components.items()
+                if y.get("factory") in UPSTREAM_FACTORIES
+            )
+        elif upstream is not None:
+            keep.add(upstream)
+    return keep
+
+
+def _span_overrides(
+    config, window: Optional[int], stride: Optional[int]
+) -> dict[str, int]:
+    if window is None and stride is None:
+        return {}
+    names = [
+        name
+        for name, component in config["components"].items()
+        if "get_spans" in component.get("model", {})
+    ]
+    if len(names) == 0:
+        logger.warning("O modelo não possui transformer, --window/--stride ignorados")
+        return {}
+
+    overrides = {}
+    for name in names:
+        get_spans = config["components"][name]["model"]["get_spans"]
+        span_window = window if window is not None else int(get_spans["window"])
+        # Without --stride the original window/stride ratio is kept
+        ratio = int(get_spans["stride"]) / int(get_spans["window"])
+        span_stride = stride if stride is not None else max(1, int(span_window * ratio))
+        if not 0 < span_stride <= span_window:
+            raise ValueError(
+                f"O stride {span_stride} deve estar entre 1 e o window {span_window}"
+            )
+        overrides[f"components.{name}.model.get_spans.window"] = span_window
+        overrides[f"components.{name}.model.get_spans.stride"] = span_stride
+    return overrides
+
+
+def _quantize(nlp: Language) -> int:
+    # Dynamic int8 quantization of the linear layers of every PyTorch model
+    # wrapped by the pipeline (the transformer), weights are quantized once
+    # and activations on the fly, so no calibration data is needed
+    quantized = 0
+    for _, component in nlp.pipeline:
+        model = getattr(component, "model", None)
+        if model is None or not hasattr(model, "walk"):
+            continue
+        for node in model.walk():
+            for shim in node.shims:
+                if not isinstance(shim, PyTorchShim):
+                    continue
+                import torch
+
+                shim._model = torch.quantization.quantize_dynamic(
+                    shim._model, {torch.nn.Linear}, dtype=torch.qint8
+                )
+                quantized += 1
+    return quantized
+
+
+def load_pipeline(
+    model: Union[str, Path],
+    *,
+    optimize: Optional[str] = None,
+    window: Optional[int] = None,
+    stride: Optional[int] = None,
+    quantize: bool = True,
+) -> Language:
+    if optimize is not None and optimize not in OPTIMIZE_MODES:
+        raise ValueError(f"O modo de otimização {optimize} é invalido")
+
+    model_path = Path(model)
+    if optimize is None and window is None and stride is None:
+        nlp = spacy.load(model_path)
+    else:
+        config = spacy.util.load_config(model_path / "config.cfg", interpolate=False)
+        exclude = []
+        if optimize is not None:
+            keep = _ner_components(config)
+            exclude = [x for x in config["nlp"]["pipeline"] if x not in keep]
+            if exclude:
+                logger.info(f"Componentes removidos do pipeline: {exclude}")
+        nlp = spacy.load(
+            model_path,
+            exclude=exclude,
+            config=_span_overrides(config, window, stride),
+        )
+
+    # Models saved by save_pipeline are quantized again when loaded
+    optimize = optimize or nlp.meta.get(META_KEY, {}).get("optimize")
+    if optimize == "cpu" and quantize:
+        quantized = _quantize(nlp)
+        if quantized:
+            logger.info(f"Quantização int8 aplicada em {quantized} modelo(s) PyTorch")
+        else:
+            logger.warning("Nenhum modelo PyTorch encontrado para quantização")
+    return nlp
+
+
+def save_pipeline(
+    model: Union[str, Path],
+    output_path: Union[str, Path],
+    *,
+    optimize: str = "cpu",
+    window: Optional[int] = None,
+    stride: Optional[int] = None,
+):
+    # Saved before quantization (the quantized weights can't be loaded back
+    # into the original architecture), the flag in meta.json makes
+    # load_pipeline quantize the model again
+    nlp = load_pipeline(
+        model, optimize=optimize, window=window, stride=stride, quantize=False
+    )
+    nlp.meta[META_KEY] = {**nlp.meta.get(META_KEY, {}), "optimize": optimize}
+    nlp.to_disk(output_path)
+    logger.success(f"Modelo otimizado salvo em: {output_path}")
+
+
+def evaluate_pipeline(
+    nlp: Language, dataset: list, *, batch_size: int = 128
+) -> dict[str, float]:
+    examples = [
+        Example(nlp.make_doc(text), make_reference_doc(nlp, text, ann["entities"])[0])
+        for text, ann in dataset
+    ]
+    start = time.perf_counter()
+    scores = nlp.evaluate(examples, batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+    return {
+        "ents_p": scores.get("ents_p") or 0.0,
+        "ents_r": scores.get("ents_r") or 0.0,
+        "ents_f": scores.get("ents_f") or 0.0,
+        "docs_per_second": len(examples) / elapsed if elapsed > 0 else 0.0,
+    }
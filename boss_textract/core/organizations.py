@@ -0,0 +1,88 @@
+import math
+import re
+from collections import defaultdict, deque
+from typing import Iterable, Optional
+
+
+# An organization can only be found inside another one (whole words, ignoring
+# case) when all of its tokens are tokens of the other, so only the
+# intersection of the token postings is checked with the regex
+class OrganizationIndex:
+    def __init__(self, organizations: Iterable[str]):
+        self.organizations = list(organizations)
+        self.postings = defaultdict(set)
+        for position, organization in enumerate(self.organizations):
+            for token in organization.casefold().split():
+                self.postings[token].add(position)
+
+    def _candidates(self, org_name: str) -> Iterable[int]:
+        tokens = set(org_name.casefold().split())
+        if len(tokens) == 0:
+            return range(len(self.organizations))
+
+        postings = sorted(
+            (self.postings.get(token, set()) for token in tokens), key=len
+        )
+        return sorted(postings[0].intersection(*postings[1:]))
+
+    def variations(self, org_name: str) -> list[str]:
+        pattern = re.compile(rf"(^|\s+){re.escape(org_name)}($|\s+)", re.IGNORECASE)
+        return [
+            self.organizations[position]
+            for position in self._candidates(org_name)
+            if self.organizations[position] != org_name
+            and pattern.search(self.organizations[position])
+        ]
+
+    def polish(self, org_name: str, *, max_variation: int = 5) -> Optional[str]:
+        result = self.variations(org_name)
+        if len(result) == 0 or len(result) > max_variation:
+            return None
+
+        longest_name = max(result, key=len)
+        return longest_name
+
+
+# Aho-Corasick automaton over organization names, when several of them occur
+# in a text the first inserted wins (same as scanning the list in order)
+class OrganizationMatcher:
+    def __init__(self, organizations: Iterable[str]):
+        self.organizations = list(organizations)
+        self.goto = [{}]
+        self.best = [math.inf]
+        for priority, organization in enumerate(self.organizations):
+            node = 0
+            for char in organization:
+                if char not in self.goto[node]:
+                    self.goto.append({})
+                    self.best.append(math.inf)
+                    self.goto[node][char] = len(self.goto) - 1
+                node = self.goto[node][char]
+            self.best[node] = min(self.best[node], priority)
+
+        # Breadth first, so the fail state of a node is always resolved before it
+        self.fail = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            self.best[node] = min(self.best[node], self.best[self.fail[node]])
+            for char, child in self.goto[node].items():
+                fail = self.fail[node]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                if node != 0:
+                    self.fail[child] = self.goto[fail].get(char, 0)
+                queue.append(child)
+
+    def find(self, text: str) -> Optional[str]:
+        node, found = 0, self.best[0]
+        for char in text:
+            if found == 0:
+                break
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            if self.best[node] < found:
+                found = self.best[node]
+
+        return self.organizations[found] if found != math.inf else None
@@ -1,38 +1,384 @@
-import re
-from typing import Union
+import json
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, Optional, Union
 from pathlib import Path
 from tqdm import tqdm
 
+from core.cache import Entities, PredictionCache
+from core.displacy_log import DisplacyLog
+from core.gazetteer import Gazetteer, load_tokenizer
+from core.optimizer import load_pipeline
+from core.organizations import OrganizationIndex, OrganizationMatcher
 from core.preprocessor import DataPreprocessor
 from utils.logger import logger
+from utils.metrics import RunMetrics
 
+import numpy as np
 import pandas as pd
 import spacy
 
+_worker_nlp = None
+
+
+def _init_worker(model: Union[str, Path], threads: int, optimize_options: dict):
+    global _worker_nlp
+    try:
+        import torch
+
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    _worker_nlp = load_pipeline(model, **optimize_options)
+
+
+def _padded_batches(docs: Iterable, batch_size: int, batch_tokens: int):
+    # Like spaCy's batch_by_padded: a batch is closed when its padded size
+    # (longest doc x number of docs) would pass batch_tokens, the docs are
+    # expected sorted by length so each batch holds docs of similar size
+    batch, longest = [], 0
+    for doc in docs:
+        padded = max(longest, len(doc)) * (len(batch) + 1)
+        if batch and (len(batch) >= batch_size or padded > batch_tokens):
+            yield batch
+            batch, longest = [], 0
+        batch.append(doc)
+        longest = max(longest, len(doc))
+    if batch:
+        yield batch
+
+
+def _pipe_entities(
+    nlp, texts: list[str], batch_size: int, batch_tokens: int
+) -> Iterator[Entities]:
+    if batch_tokens <= 0:
+        batches = [nlp.pipe(texts, batch_size=batch_size)]
+    else:
+        batches = (
+            nlp.pipe(batch, batch_size=len(batch))
+            for batch in _padded_batches(
+                (nlp.make_doc(text) for text in texts), batch_size, batch_tokens
+            )
+        )
+    for docs in batches:
+        for doc in docs:
+            yield tuple((ent.start_char, ent.end_char, ent.label_) for ent in doc.ents)
+
+
+def _cascade_entities(
+    nlp, texts: list[str], batch_size: int, beam_width: int
+) -> Iterator[tuple[Entities, float]]:
+    # Entities of the greedy ner (the same prediction as predict) with the
+    # beam search probability of the entity when there is exactly one
+    ner = nlp.get_pipe("ner")
+    for batch in spacy.util.minibatch(texts, size=batch_size):
+        docs = list(nlp.pipe(batch, disable=["ner"]))
+        # The beam runs before the annotations are set, entities already in
+        # the doc would be kept as preset and always score 1.0
+        scores = ner.scored_ents(ner.beam_parse(docs, beam_width=beam_width))
+        ner.set_annotations(docs, ner.predict(docs))
+        for doc, doc_scores in zip(docs, scores):
+            ents = tuple((ent.start_char, ent.end_char, ent.label_) for ent in doc.ents)
+            confidence = (
+                doc_scores.get((doc.ents[0].start, doc.ents[0].end, doc.ents[0].label_))
+                if len(doc.ents) == 1
+                else None
+            )
+            yield ents, confidence or 0.0
+
+
+def _extract_shard(
+    texts: list[str], batch_size: int, batch_tokens: int
+) -> list[Entities]:
+    return list(_pipe_entities(_worker_nlp, texts, batch_size, batch_tokens))
+
 
 class ModelPredicter:
-    def __init__(self, model: Union[str, Path], gpu_id: int):
+    CASCADE_BEAM_WIDTH = 4
+
+    def __init__(
+        self,
+        model: Union[str, Path],
+        gpu_id: int,
+        *,
+        batch_size: int = 128,
+        batch_tokens: int = 4096,
+        workers: int = 1,
+        cache_dir: Union[str, Path, None] = None,
+        cache_size: int = 1_000_000,
+        optimize: Optional[str] = None,
+        window: Optional[int] = None,
+        stride: Optional[int] = None,
+        gazetteer: Union[str, Path, None] = None,
+        cascade: Union[str, Path, None] = None,
+        cascade_threshold: float = 0.9,
+        metrics: Optional[RunMetrics] = None,
+    ):
+        if workers > 1 and gpu_id > -1:
+            raise ValueError("O uso de --workers só é suportado no processador")
+        if optimize == "cpu" and gpu_id > -1:
+            raise ValueError("O uso de --optimize cpu não é suportado na GPU")
         if gpu_id > -1:
             spacy.prefer_gpu(gpu_id=gpu_id)
-        logger.info("Iniciando o modelo...")
-        self.nlp = spacy.load(model)
+        self.model = model
+        self.batch_size = batch_size
+        self.batch_tokens = batch_tokens
+        self.workers = workers
+        self.metrics = metrics if metrics is not None else RunMetrics()
+        self.optimize_options = {
+            "optimize": optimize,
+            "window": window,
+            "stride": stride,
+        }
+        self.nlp = None
+        self.executor = None
+        if workers <= 1:
+            logger.info("Iniciando o modelo...")
+            with self.metrics.stage("model_load", model=str(model)):
+                self.nlp = load_pipeline(model, **self.optimize_options)
+        options = {x: y for x, y in self.optimize_options.items() if y is not None}
+        self.cache = (
+            PredictionCache(
+                cache_dir,
+                model,
+                max_entries=cache_size,
+                variant=json.dumps(options, sort_keys=True) if options else "",
+            )
+            if cache_dir is not None
+            else None
+        )
+        self.gazetteer = (
+            Gazetteer.from_disk(
+                self.nlp if self.nlp is not None else load_tokenizer(model),
+                gazetteer,
+            )
+            if gazetteer is not None
+            else None
+        )
+        self.cascade = None
+        if cascade is not None:
+            logger.info("Iniciando o modelo da cascata...")
+            with self.metrics.stage("model_load", model=str(cascade)):
+                self.cascade = spacy.load(cascade)
+        self.cascade_threshold = cascade_threshold
         self.orgs_list = {}
 
+    def _extract(self, texts: list[str]) -> Iterable[Entities]:
+        if self.workers <= 1:
+            yield from _pipe_entities(
+                self.nlp, texts, self.batch_size, self.batch_tokens
+            )
+            return
+        if len(texts) == 0:
+            return
+
+        shard_size = self.batch_size * 8
+        shards = [
+            texts[i : i + shard_size] for i in range(0, len(texts), shard_size)
+        ]
+        if self.executor is None:
+            # Kept until close, so each process loads the model only once for
+            # every file and chunk
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            logger.info(
+                f"Iniciando {self.workers} processos com {threads} thread(s) cada..."
+            )
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.model, threads, self.optimize_options),
+            )
+        for shard in self.executor.map(
+            _extract_shard,
+            shards,
+            [self.batch_size] * len(shards),
+            [self.batch_tokens] * len(shards),
+        ):
+            yield from shard
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        if self.cache is not None:
+            self.cache.close()
+
+    def _predict_texts(
+        self, texts: list[str], *, verbose: bool = True
+    ) -> list[Entities]:
+        cached = self.cache.get_many(texts) if self.cache is not None else {}
+        if self.cache is not None and verbose:
+            self.cache.log_stats()
+
+        missing = [text for text in texts if text not in cached]
+        matched = {}
+        if self.gazetteer is not None:
+            # Known organizations skip the model (and are not cached)
+            matched = {
+                text: ents
+                for text, ents in zip(missing, self.gazetteer.match(missing))
+                if ents is not None
+            }
+            missing = [text for text in missing if text not in matched]
+            if verbose:
+                logger.info(
+                    f"Gazetteer: {len(matched)} textos | Modelo: {len(missing)} textos"
+                )
+        if self.cascade is not None:
+            # Only rows the small model isn't sure about (no entity, several
+            # entities or low confidence) go to the main model (not cached)
+            confident = {
+                text: ents
+                for text, (ents, confidence) in zip(
+                    missing,
+                    _cascade_entities(
+                        self.cascade, missing, self.batch_size, self.CASCADE_BEAM_WIDTH
+                    ),
+                )
+                if len(ents) == 1 and confidence >= self.cascade_threshold
+            }
+            matched.update(confident)
+            missing = [text for text in missing if text not in confident]
+            if verbose:
+                logger.info(
+                    f"Cascata: {len(confident)} textos | Modelo: {len(missing)} textos"
+                )
+        if self.batch_tokens > 0:
+            # Similar lengths end up in the same batches (less padding), the
+            # input order is restored through the predicted dict
+            missing.sort(key=len)
+        results = self._extract(missing)
+        if verbose:
+            results = tqdm(results, total=len(missing))
+        predicted = dict(zip(missing, results))
+        if self.cache is not None and predicted:
+            self.cache.put_many(predicted.items())
+        predicted.update(matched)
+
+        return [
+            cached[text] if text in cached else predicted[text] for text in texts
+        ]
+
     @classmethod
     def _polish_organizations(
-        cls, org_name: str, organizations: list, *, max_variation: int = 5
+        cls,
+        org_name: str,
+        organizations: Union[list, OrganizationIndex],
+        *,
+        max_variation: int = 5,
     ):
-        result = [
-            text
-            for text in organizations
-            if text != org_name
-            and re.search(rf"(^|\s+){re.escape(org_name)}($|\s+)", text, re.IGNORECASE)
-        ]
-        if len(result) == 0 or len(result) > max_variation:
-            return None
+        if not isinstance(organizations, OrganizationIndex):
+            organizations = OrganizationIndex(organizations)
+        return organizations.polish(org_name, max_variation=max_variation)
+
+    @staticmethod
+    def response_column(output_column: str) -> str:
+        # Raw response of the model (before formatting, max_variation and the
+        # fallback) written next to the output, what --previous reuses
+        return f"{output_column}_RESPONSE"
+
+    @staticmethod
+    def previous_responses(
+        df: pd.DataFrame, source_column: str, response_column: str
+    ) -> dict[str, str]:
+        # Normalized source text -> raw response of an earlier predict output
+        for column in (source_column, response_column):
+            if column not in df.columns:
+                raise ValueError(
+                    f"A coluna {column} não existe na saída anterior "
+                    "(gere-a com --responses)"
+                )
+        texts = DataPreprocessor.format_column(
+            DataPreprocessor.to_object(df[source_column])
+        )
+        responses = DataPreprocessor.to_object(df[response_column])
+        return {
+            str(text): response if isinstance(response, str) else ""
+            for text, response in zip(texts, responses)
+        }
 
-        longest_name = max(result, key=len)
-        return longest_name
+    def _infer(
+        self,
+        column: pd.Series,
+        log: Optional[DisplacyLog] = None,
+        previous: Optional[dict[str, str]] = None,
+    ):
+        # Each distinct normalized text is predicted once and broadcast back
+        # to its rows through the factorize codes, keeping the input order
+        with self.metrics.stage("normalize", rows=len(column)) as stage:
+            codes, uniques = pd.factorize(
+                DataPreprocessor.format_column(DataPreprocessor.to_object(column)),
+                sort=True,
+                use_na_sentinel=False,
+            )
+            texts = [str(text) for text in uniques]
+            stage["unique"] = len(texts)
+            stage["unique_ratio"] = (
+                round(len(texts) / len(column), 4) if len(column) else None
+            )
+
+        previous = previous if previous is not None else {}
+        reused = [index for index, text in enumerate(texts) if text in previous]
+        pending = [index for index, text in enumerate(texts) if text not in previous]
+        if previous:
+            logger.info(
+                f"Saída anterior: {len(reused)} textos | Modelo: {len(pending)} textos"
+            )
+
+        responses = np.full(len(texts), "", dtype=object)
+        # A reused response is polished by max_variation and fallback filled
+        # again with the new ones, as if the model had predicted it
+        for index in reused:
+            responses[index] = previous[texts[index]]
+        with self.metrics.stage("infer", rows=len(pending)) as stage:
+            cache_stats = (self.cache.hits, self.cache.misses) if self.cache else None
+            for index, ents in zip(
+                pending, self._predict_texts([texts[index] for index in pending])
+            ):
+                if log is not None:
+                    log.add(texts[index], ents)
+                if len(ents) != 1:
+                    continue
+
+                responses[index] = texts[index][ents[0][0] : ents[0][1]]
+            if cache_stats is not None:
+                hits = self.cache.hits - cache_stats[0]
+                lookups = hits + self.cache.misses - cache_stats[1]
+                stage["cache_hit_rate"] = round(hits / lookups, 4) if lookups else None
+
+        outputs = DataPreprocessor.format_column(pd.Series(responses, dtype=object))
+        outputs = outputs.to_numpy(dtype=object, copy=True)
+        return codes, texts, responses, outputs
+
+    @classmethod
+    def polish_names(cls, names: list[str], max_variation: int) -> dict[str, str]:
+        logger.info("Padronizando as saídas...")
+        organizations = OrganizationIndex(names)
+        polished = {}
+        for org_name in tqdm(names):
+            new_org_name = cls._polish_organizations(
+                org_name, organizations, max_variation=max_variation
+            )
+            if new_org_name is not None:
+                polished[org_name] = new_org_name
+        return polished
+
+    def _polish(self, max_variation: int) -> dict[str, str]:
+        return self.polish_names(list(self.orgs_list.keys()), max_variation)
+
+    def _fallback_matcher(self, polished: dict[str, str]) -> OrganizationMatcher:
+        return OrganizationMatcher(
+            polished.get(org_name, org_name) for org_name in self.orgs_list
+        )
+
+    @staticmethod
+    def _fill_empty(texts: list[str], outputs: np.ndarray, matcher):
+        for index, (text, existing) in enumerate(zip(texts, outputs)):
+            if pd.isna(existing) or existing == "":
+                match = matcher.find(text)
+                outputs[index] = match if match is not None else existing
 
     def predict(
         self,
@@ -40,70 +386,129 @@ class ModelPredicter:
         source_column: str,
         output_column: str,
         max_variation: int,
-        log: bool = False,
-    ):
-        logger.info("Formatando o dados...")
-        tmp_column = source_column + ":TEMP_SYS"
-        df.insert(
-            df.columns.get_loc(source_column) + 1,
-            tmp_column,
-            df[source_column].values,
-        )
-        df.insert(df.columns.get_loc(source_column) + 2, output_column, "")
-        df[tmp_column] = DataPreprocessor.format_column(df[tmp_column])
-        df = df.sort_values(by=tmp_column)
-        df = df.reset_index(drop=True)
+        log: Optional[DisplacyLog] = None,
+        previous: Optional[dict[str, str]] = None,
+        response_column: Optional[str] = None,
+    ) -> pd.DataFrame:
         logger.info("Realizando predições...")
-        docs = []
-
-        for i, row in tqdm(df.iterrows(), total=df.shape[0]):
-            text, response = str(row[tmp_column]), None
-
-            last_row = i - 1
-            if last_row != -1:
-                last_text = str(df.at[last_row, tmp_column])
-                last_response = str(df.at[last_row, output_column])
-                if last_response and (last_text == text):
-                    response = last_response
-
-            if response is None:
-                doc = self.nlp(text)
+        self.orgs_list = {}
+        codes, texts, responses, outputs = self._infer(
+            df[source_column], log, previous
+        )
+        for index, response in enumerate(responses):
+            if response != "":
+                self.orgs_list.setdefault(response, {"codes": []})["codes"].append(
+                    index
+                )
 
-                if len(doc.ents) == 0:
-                    continue
-                elif len(doc.ents) == 1:
-                    response = str(doc.ents[0])
+        if max_variation is None or max_variation > 0:
+            with self.metrics.stage("polish", rows=len(self.orgs_list)):
+                polished = self._polish(max_variation)
+                for org_name, new_org_name in polished.items():
+                    outputs[self.orgs_list[org_name]["codes"]] = new_org_name
+            with self.metrics.stage("fill", rows=len(texts)):
+                self._fill_empty(texts, outputs, self._fallback_matcher(polished))
 
-                if log:
-                    docs.append(doc)
+        df.insert(df.columns.get_loc(source_column) + 1, output_column, outputs[codes])
+        if response_column is not None:
+            df.insert(
+                df.columns.get_loc(output_column) + 1,
+                response_column,
+                responses[codes],
+            )
+        return df
 
-            if response is not None:
-                organization = self.orgs_list.get(response, {"rows": []})
-                organization["rows"].append(i)
+    def chunk_organizations(self) -> dict[str, dict]:
+        # Response -> output and first text of the chunks predicted so far,
+        # enough to resume predict_chunks or to run polish_chunks elsewhere
+        return {response: dict(org) for response, org in self.orgs_list.items()}
 
-                self.orgs_list.update({response: organization})
-                df.at[i, output_column] = response
+    def restore_organizations(self, organizations: dict[str, dict]):
+        self.orgs_list = {
+            response: dict(org) for response, org in organizations.items()
+        }
 
-        df[output_column] = DataPreprocessor.format_column(df[output_column])
+    def _sort_organizations(self):
+        # Same order as the single pass of predict, where the organizations
+        # are added in the order of the sorted texts: the polishing and the
+        # fallback matcher depend on it, not on the size of the chunks
+        self.orgs_list = dict(
+            sorted(self.orgs_list.items(), key=lambda item: item[1]["text"])
+        )
 
-        if max_variation is None or max_variation > 0:
-            ORGS_LIST = []
-            logger.info("Padronizando as saídas...")
-            for org_name, org_data in tqdm(self.orgs_list.items()):
-                new_org_name = self._polish_organizations(
-                    org_name, self.orgs_list.keys(), max_variation=max_variation
+    def predict_chunks(
+        self,
+        chunks: Iterable[pd.DataFrame],
+        source_column: str,
+        output_column: str,
+        log: Optional[DisplacyLog] = None,
+        previous: Optional[dict[str, str]] = None,
+        organizations: Optional[dict[str, dict]] = None,
+        response_column: Optional[str] = None,
+    ) -> Iterator[pd.DataFrame]:
+        # Only the organization table is kept between chunks, the
+        # max_variation polishing is applied afterwards by polish_chunks
+        self.restore_organizations(organizations or {})
+        for index, df in enumerate(chunks):
+            logger.info(f"Realizando predições do bloco {index + 1}...")
+            codes, texts, responses, outputs = self._infer(
+                df[source_column], log, previous
+            )
+            for text, response, output in zip(texts, responses, outputs):
+                if response == "":
+                    continue
+                org = self.orgs_list.setdefault(
+                    response, {"output": output, "text": text}
                 )
-                if new_org_name is not None:
-                    df.loc[org_data["rows"], output_column] = new_org_name
+                # The smallest text of each response gives its global order
+                org["text"] = min(org["text"], text)
 
-                ORGS_LIST.append(new_org_name if new_org_name is not None else org_name)
+            df.insert(
+                df.columns.get_loc(source_column) + 1, output_column, outputs[codes]
+            )
+            if response_column is not None:
+                df.insert(
+                    df.columns.get_loc(output_column) + 1,
+                    response_column,
+                    responses[codes],
+                )
+            yield df
 
-            df[output_column] = [
-                next((item for item in ORGS_LIST if item in text), existing)
-                if pd.isna(existing) or existing == ""
-                else existing
-                for text, existing in zip(df[tmp_column], df[output_column])
-            ]
+    def polish_chunks(
+        self,
+        chunks: Iterable[pd.DataFrame],
+        source_column: str,
+        output_column: str,
+        max_variation: int,
+        response_column: str,
+    ) -> Iterator[pd.DataFrame]:
+        self._sort_organizations()
+        with self.metrics.stage("polish", rows=len(self.orgs_list)):
+            polished = self._polish(max_variation)
+        matcher = self._fallback_matcher(polished)
+        for df in chunks:
+            # As in predict, the raw response of each row (not its formatted
+            # output, two responses can format the same) selects the name
+            outputs = np.array(
+                [
+                    polished.get(response, output)
+                    if isinstance(response, str)
+                    else output
+                    for response, output in zip(
+                        df[response_column], df[output_column]
+                    )
+                ],
+                dtype=object,
+            )
+            empty = np.array([not isinstance(x, str) or x == "" for x in outputs])
+            if empty.any():
+                with self.metrics.stage("fill", rows=int(empty.sum())):
+                    texts = DataPreprocessor.format_column(
+                        DataPreprocessor.to_object(df.loc[empty, source_column])
+                    )
+                    missing = outputs[empty]
+                    self._fill_empty([str(text) for text in texts], missing, matcher)
+                    outputs[empty] = missing
 
-        df = df.drop(columns=[tmp_column])
-        return df, docs
+            df[output_column] = outputs
+            yield df
@@ -1,17 +1,36 @@
+import os
 import pathlib
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional, Union
+import numpy as np
 import pandas as pd
-from tqdm import tqdm
+from core.normalizer import normalize_many, normalize_parallel, normalize_text
 from utils.logger import logger
 
 
 class DataPreprocessor:
+    PARALLEL_THRESHOLD = 200_000
+    PARALLEL_CHUNK_SIZE = 10_000
+
+    @staticmethod
+    def _backend(arrow: bool) -> dict:
+        # Arrow backed columns (pandas ArrowDtype) instead of Python strings
+        return {"dtype_backend": "pyarrow"} if arrow else {}
+
     @staticmethod
+    def is_parquet(file_path: pathlib.Path) -> bool:
+        return pathlib.Path(file_path).suffix.lower() == ".parquet"
+
+    @classmethod
     def _get_dataframe_from_csv(
+        cls,
         file_path: pathlib.Path,
         separator: str = ";",
         encoding: str = "UTF-8",
         *,
         start_header: int,
+        columns: Optional[list[str]] = None,
+        arrow: bool = False,
     ):
         with open(file_path, mode="r", encoding=encoding) as file:
             return pd.read_csv(
@@ -22,122 +41,155 @@ class DataPreprocessor:
                 index_col=False,
                 header=start_header,
                 on_bad_lines="warn",
+                usecols=columns,
+                **cls._backend(arrow),
+            )
+
+    @classmethod
+    def _get_chunks_from_csv(
+        cls,
+        file_path: pathlib.Path,
+        separator: str = ";",
+        encoding: str = "UTF-8",
+        *,
+        start_header: int,
+        chunksize: int,
+        na_filter: bool = True,
+        columns: Optional[list[str]] = None,
+        arrow: bool = False,
+    ) -> Iterator[pd.DataFrame]:
+        with open(file_path, mode="r", encoding=encoding) as file:
+            yield from pd.read_csv(
+                file,
+                sep=separator,
+                encoding=encoding,
+                dtype=str,
+                index_col=False,
+                header=start_header,
+                on_bad_lines="warn",
+                chunksize=chunksize,
+                na_filter=na_filter,
+                usecols=columns,
+                **cls._backend(arrow),
             )
 
+    @classmethod
+    def _get_dataframe_from_parquet(
+        cls,
+        file_path: pathlib.Path,
+        *,
+        columns: Optional[list[str]] = None,
+        arrow: bool = False,
+    ):
+        return pd.read_parquet(file_path, columns=columns, **cls._backend(arrow))
+
     @staticmethod
-    def format_column(column):
-        column = column.str.upper()
-        column = column.replace(r"<BR>", " ", regex=True)
-        column = column.replace(r"\s+", " ", regex=True)
-        # Ending to [CPF,CPNJ or Date] -> Empty
-        column = column.replace(r"\d{11,}|\d{1,2}[\/\\]\d{2,4}$", "", regex=True)
-        # [ /NAME, NAME/] -> NAME
-        column = column.replace(
-            r"(?:\s|^)[\/\\](?=[\w\s\.\,])|(?<=[\w\s\.\,])[\/\\](?=\s|$)",
-            " ",
-            regex=True,
-        )
-        # [ENTER-NAME] -> ENTER NAME
-        column = column.replace(
-            r"(?<=[\w\s\.\,])\-(?=[\w\s\.\,])",
-            " - ",
-            regex=True,
-        )
-        # [GOOGLE,LLC] -> GOOGLE LLC
-        column = column.replace(
-            r"(?<=[\w\s\.\,])(?<!\s)[\\\/,\;]+(?=(?=\s)|(?!\s))(?<![\w\s])",
-            " ",
-            regex=True,
-        )
+    def _get_chunks_from_parquet(
+        file_path: pathlib.Path,
+        *,
+        chunksize: int,
+        columns: Optional[list[str]] = None,
+        arrow: bool = False,
+    ) -> Iterator[pd.DataFrame]:
+        import pyarrow.parquet as pq
 
-        # [ - ME, - EM, - EPP] -> Empty
-        column = column.replace(r"\s?\-\s*(ME|EM|EPP)(?=$|\s+)", "", regex=True)
-        # [ S.] -> Empty
-        column = column.replace(r"\s+S\.(\s+|$)", "", regex=True)
-        # [B.V.] -> B.V
-        column = column.replace(r"B\.V\.?(\s+|$)", "B.V ", regex=True)
-        # [U.A.] -> U.A
-        column = column.replace(r"U\.A\.?(\s+|$)", "U.A ", regex=True)
-        # [A.S.] -> A.S
-        column = column.replace(r"A\.S\.?(\s+|$)", "A.S ", regex=True)
-        # [N.V.] -> N.V
-        column = column.replace(r"N\.V\.?(\s+|$)", "N.V ", regex=True)
-        # [Z.O.O.] -> Z.O.O
-        column = column.replace(
-            r"Z[\.\s]+O[\.\s]+O\.?[\/\\]?(\s+|$)", "Z.O.O ", regex=True
-        )
-        # [S.P.A.] -> S.P.A
-        column = column.replace(
-            r"S[\.\s]+P[\.\s]+A\.?[\/\\]?(\s+|$)", "S.P.A ", regex=True
-        )
-        # [S.R.O.] -> S.R.O
-        column = column.replace(
-            r"S[\.\s]+R[\.\s]+O\.?[\/\\]?(\s+|$)", "S.R.O ", regex=True
-        )
-        # [S.A.C.] -> S.A.C
-        column = column.replace(
-            r"S[\.\s]+A[\.\s]+C\.?[\/\\]?(\s+|$)", "S.A.C ", regex=True
-        )
-        # [S.A.S.] -> S.A.S
-        column = column.replace(
-            r"S[\.\s]+A[\.\s]+S\.?[\/\\]?(\s+|$)", "S.A.S ", regex=True
-        )
-        # [S.A.U.] -> S.A.U
-        column = column.replace(
-            r"S[\.\s]+A[\.\s]+U\.?[\/\\]?(\s+|$)", "S.A.U ", regex=True
-        )
-        # [S.P.A.] -> S.P.A
-        column = column.replace(
-            r"S[\.\s]+R[\.\s]+L\.?[\/\\]?(\s+|$)", "S.R.L ", regex=True
-        )
-        # [NF.1234-, NF.12345,NF.] -> Empty
-        column = column.replace(r"(?:NF\.)(?:(?:\d+\-?)|(?=[\w\d]))", "", regex=True)
-        # [RPS: 1234, RPS 1234] -> Empty
-        column = column.replace(r"(?:RPS:?\s)(?:\d+\-?)", "", regex=True)
-        # [LTDA- ME,LTDA- EM,LTDA - EPP, LTDAME] -> LTDA
-        column = column.replace(
-            r"LTDA\.?\s?[\.\-\|]?(?=\w*)\s*(ME|EM|EPP|\/\d{2,4})?\s*",
-            "LTDA ",
-            regex=True,
-        )
-        # [S.A., S\A, S/A, SA] -> S.A
-        column = column.replace(
-            r"(?<=\s)S\.?/?\\?\s?A\.?(?:C\.)?(?=\s+|$)", "S.A", regex=True
+        for batch in pq.ParquetFile(file_path).iter_batches(
+            batch_size=chunksize, columns=columns
+        ):
+            yield batch.to_pandas(types_mapper=pd.ArrowDtype if arrow else None)
+
+    @staticmethod
+    def to_object(column: pd.Series) -> pd.Series:
+        # Arrow backed columns (--arrow) use NA for the missing values, the
+        # model gets the same texts of the default (dtype=str) columns
+        if not isinstance(column.dtype, pd.ArrowDtype):
+            return column
+        return column.astype(object).where(column.notna(), np.nan)
+
+    @classmethod
+    def format_column(
+        cls,
+        column: Union[pd.Series, str],
+        *,
+        workers: Optional[int] = None,
+        parallel_threshold: Optional[int] = None,
+    ):
+        if isinstance(column, str):
+            return normalize_text(column)
+
+        # Only distinct values are normalized, then broadcast back by code
+        codes, uniques = pd.factorize(column)
+        uniques = list(uniques)
+        workers = workers if workers is not None else (os.cpu_count() or 1)
+        parallel_threshold = (
+            parallel_threshold
+            if parallel_threshold is not None
+            else cls.PARALLEL_THRESHOLD
         )
-        column = column.replace(r"\s+", " ", regex=True)
-        column = column.str.strip()
+        if workers > 1 and len(uniques) >= parallel_threshold:
+            logger.debug(
+                f"Normalizando {len(uniques)} textos únicos em {workers} processos"
+            )
+            normalized = normalize_parallel(
+                uniques, workers, chunk_size=cls.PARALLEL_CHUNK_SIZE
+            )
+        else:
+            normalized = normalize_many(uniques)
 
-        return column
+        # Missing values (-1 code) are kept as they were in the source column
+        values = np.array(normalized + [np.nan], dtype=object)[codes]
+        missing = codes == -1
+        values[missing] = column.to_numpy(dtype=object)[missing]
+        return pd.Series(
+            values, index=column.index, name=column.name, dtype=column.dtype
+        )
 
     @classmethod
     def create_train_dataframe(
-        cls, df: pd.DataFrame, source_col: str, response_cols: str, MIN_SAMPLES: int = 5
+        cls,
+        df: pd.DataFrame,
+        source_col: str,
+        response_cols: str,
+        MIN_SAMPLES: int = 5,
+        *,
+        counts: Optional[list[pd.Series]] = None,
     ):
-        df[source_col] = cls.format_column(df[source_col])
-        for response_col in response_cols:
-            df[response_col["column"]] = cls.format_column(df[response_col["column"]])
-            df = df.groupby(response_col["column"]).filter(
-                lambda x: len(x) >= MIN_SAMPLES
+        sources = cls.format_column(df[source_col])
+        keep = np.ones(df.shape[0], dtype=bool)
+        responses = []
+        # Same sequential filtering as a groupby filter per response column:
+        # each column is counted only over the rows kept by the previous ones
+        # (or with the given counts, when df is only a part of the data)
+        for index, response_col in enumerate(response_cols):
+            column = cls.format_column(df[response_col["column"]])
+            column_counts = (
+                counts[index] if counts is not None else column[keep].value_counts()
             )
+            keep &= column.map(column_counts).ge(MIN_SAMPLES).to_numpy(dtype=bool)
+            responses.append(column)
 
-        training_data = []
-
-        for i, row in tqdm(df.iterrows(), total=df.shape[0]):
-            source_val = row[source_col]
-            train_element = [source_val, {"entities": []}]
-            for response_col in response_cols:
-                response_val = row[response_col["column"]]
-                start_idx = source_val.find(response_val)
-                if start_idx != -1:
-                    end_idx = start_idx + len(response_val)
-                    train_element[1]["entities"].append(
-                        (start_idx, end_idx, response_col["type"])
+        sources = sources.to_numpy(dtype=object)[keep]
+        entities = [[] for _ in range(len(sources))]
+        for response_col, column in zip(response_cols, responses):
+            column = column.to_numpy(dtype=object)[keep]
+            starts = [
+                source.find(response) if isinstance(source, str) else -1
+                for source, response in zip(sources, column)
+            ]
+            for index in np.flatnonzero(np.array(starts) != -1):
+                entities[index].append(
+                    (
+                        starts[index],
+                        starts[index] + len(column[index]),
+                        response_col["type"],
                     )
+                )
 
-            if len(train_element[1]["entities"]) > 0:
-                training_data.append(train_element)
-
-        return training_data
+        return [
+            [source, {"entities": ents}]
+            for source, ents in zip(sources, entities)
+            if len(ents) > 0
+        ]
 
     @classmethod
     def load(
@@ -147,13 +199,228 @@ class DataPreprocessor:
         encoding: str,
         *,
         start_header: int = 0,
+        columns: Optional[list[str]] = None,
+        arrow: bool = False,
     ):
         if not file_path.is_file():
             raise TypeError("O arquivo não pode ser um diretório")
 
-        df = cls._get_dataframe_from_csv(
-            file_path, separator, encoding, start_header=start_header
-        )
+        if cls.is_parquet(file_path):
+            df = cls._get_dataframe_from_parquet(
+                file_path, columns=columns, arrow=arrow
+            )
+        else:
+            df = cls._get_dataframe_from_csv(
+                file_path,
+                separator,
+                encoding,
+                start_header=start_header,
+                columns=columns,
+                arrow=arrow,
+            )
 
         logger.info(f"Pré-processando os dados! {file_path}")
         return df
+
+    @classmethod
+    def load_chunks(
+        cls,
+        file_path: pathlib.Path,
+        separator: str,
+        encoding: str,
+        *,
+        chunksize: int,
+        start_header: int = 0,
+        na_filter: bool = True,
+        columns: Optional[list[str]] = None,
+        arrow: bool = False,
+    ) -> Iterator[pd.DataFrame]:
+        if not file_path.is_file():
+            raise TypeError("O arquivo não pode ser um diretório")
+
+        logger.info(f"Pré-processando os dados em blocos de {chunksize}! {file_path}")
+        if cls.is_parquet(file_path):
+            return cls._get_chunks_from_parquet(
+                file_path, chunksize=chunksize, columns=columns, arrow=arrow
+            )
+        return cls._get_chunks_from_csv(
+            file_path,
+            separator,
+            encoding,
+            start_header=start_header,
+            chunksize=chunksize,
+            na_filter=na_filter,
+            columns=columns,
+            arrow=arrow,
+        )
+
+    @classmethod
+    def load_header(
+        cls,
+        file_path: pathlib.Path,
+        separator: str,
+        encoding: str,
+        *,
+        start_header: int = 0,
+    ):
+        if not file_path.is_file():
+            raise TypeError("O arquivo não pode ser um diretório")
+
+        if cls.is_parquet(file_path):
+            import pyarrow.parquet as pq
+
+            return pd.DataFrame(columns=pq.read_schema(file_path).names)
+        with open(file_path, mode="r", encoding=encoding) as file:
+            return pd.read_csv(
+                file,
+                sep=separator,
+                encoding=encoding,
+                dtype=str,
+                index_col=False,
+                header=start_header,
+                nrows=0,
+            )
+
+    @classmethod
+    def save(cls, df: pd.DataFrame, output_path: pathlib.Path, separator: str):
+        if cls.is_parquet(output_path):
+            df.to_parquet(output_path, index=False)
+        else:
+            df.to_csv(output_path, sep=separator, index=False)
+
+    @classmethod
+    @contextmanager
+    def chunk_writer(
+        cls, output_path: pathlib.Path, separator: str, *, append: bool = False
+    ) -> Iterator[Callable[[pd.DataFrame], None]]:
+        if not cls.is_parquet(output_path):
+            # Appending continues a CSV that already has the header
+            written = 1 if append else 0
+
+            def write_csv(df: pd.DataFrame):
+                nonlocal written
+                df.to_csv(
+                    output_path,
+                    sep=separator,
+                    index=False,
+                    mode="a" if written else "w",
+                    header=written == 0,
+                )
+                written += 1
+
+            yield write_csv
+            return
+
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        writer = None
+
+        def write_parquet(df: pd.DataFrame):
+            nonlocal writer
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if writer is None:
+                # Columns only with missing values in the first chunk would be
+                # typed as null, they are written as strings
+                schema = pa.schema(
+                    (
+                        field.with_type(pa.string())
+                        if pa.types.is_null(field.type)
+                        else field
+                    )
+                    for field in table.schema
+                )
+                writer = pq.ParquetWriter(output_path, schema)
+            writer.write_table(table.cast(writer.schema))
+
+        try:
+            yield write_parquet
+        finally:
+            if writer is not None:
+                writer.close()
+
+    @classmethod
+    def save_joined(
+        cls,
+        file_path: pathlib.Path,
+        output_path: pathlib.Path,
+        separator: str,
+        encoding: str,
+        *,
+        start_header: int,
+        after_column: str,
+        outputs: dict[str, np.ndarray],
+    ):
+        # The original table is read by Arrow (no Python strings) and written
+        # back with only the output columns added after after_column
+        import pyarrow as pa
+        import pyarrow.csv as pv
+        import pyarrow.parquet as pq
+
+        if cls.is_parquet(file_path):
+            table = pq.read_table(file_path)
+        else:
+            columns = cls.load_header(
+                file_path, separator, encoding, start_header=start_header
+            ).columns
+            table = pv.read_csv(
+                file_path,
+                read_options=pv.ReadOptions(encoding=encoding, skip_rows=start_header),
+                parse_options=pv.ParseOptions(
+                    delimiter=separator,
+                    newlines_in_values=True,
+                    invalid_row_handler=lambda row: "skip",
+                ),
+                convert_options=pv.ConvertOptions(
+                    column_types={column: pa.string() for column in columns},
+                    strings_can_be_null=True,
+                ),
+            )
+        index = table.schema.get_field_index(after_column)
+        for output_column, values in outputs.items():
+            if table.num_rows != len(values):
+                raise ValueError(
+                    f"O arquivo possui {table.num_rows} linhas válidas, mas "
+                    f"{len(values)} foram preditas (utilize sem --src_only)"
+                )
+            index += 1
+            table = table.add_column(
+                index,
+                output_column,
+                pa.array(values, type=pa.string(), from_pandas=True),
+            )
+        if cls.is_parquet(output_path):
+            pq.write_table(table, output_path)
+        elif cls._needs_quoting(table, separator):
+            # Arrow would quote every string ("needed" quotes by type), only
+            # pandas writes the same file as the default path
+            cls.save(table.to_pandas(), output_path, separator)
+        else:
+            # Arrow quotes the header even with "none", it's written here
+            with open(output_path, "wb") as file:
+                file.write((separator.join(table.column_names) + "\n").encode("utf-8"))
+                pv.write_csv(
+                    table,
+                    file,
+                    write_options=pv.WriteOptions(
+                        include_header=False,
+                        delimiter=separator,
+                        quoting_style="none",
+                    ),
+                )
+
+    @staticmethod
+    def _needs_quoting(table, separator: str) -> bool:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        patterns = (separator, '"', "\n", "\r")
+        if any(x in name for name in table.column_names for x in patterns):
+            return True
+        for column in table.itercolumns():
+            if not pa.types.is_string(column.type):
+                continue
+            for pattern in patterns:
+                if pc.any(pc.match_substring(column, pattern)).as_py():
+                    return True
+        return False
@@ -0,0 +1,198 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from pathlib import Path
+from typing import Optional, Union
+
+from core.predicter import ModelPredicter
+from core.preprocessor import DataPreprocessor
+from utils.logger import logger
+
+_MAX_BODY_SIZE = 16 * 1024 * 1024
+
+
+class PredictionServer:
+    def __init__(
+        self,
+        predicter: ModelPredicter,
+        *,
+        max_batch_size: int = 64,
+        max_wait: float = 0.01,
+    ):
+        self.predicter = predicter
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        # The model always runs on a single thread, off the event loop
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.queue: Optional[asyncio.Queue] = None
+        self.batcher: Optional[asyncio.Task] = None
+
+    async def predict(self, texts: list[str]) -> list[dict]:
+        loop = asyncio.get_running_loop()
+        normalized = [DataPreprocessor.format_column(str(text)) for text in texts]
+        futures = [loop.create_future() for _ in normalized]
+        for text, future in zip(normalized, futures):
+            await self.queue.put((text, future))
+        results = await asyncio.gather(*futures)
+
+        return [
+            {
+                "text": text,
+                "normalized": norm,
+                "output": DataPreprocessor.format_column(norm[ents[0][0] : ents[0][1]])
+                if len(ents) == 1
+                else "",
+                "entities": [
+                    {"start": start, "end": end, "label": label, "text": norm[start:end]}
+                    for start, end, label in ents
+                ],
+            }
+            for text, norm, ents in zip(texts, normalized, results)
+        ]
+
+    async def _next_batch(self) -> list[tuple[str, asyncio.Future]]:
+        # Waits for the first request, then for up to max_wait (or until the
+        # batch is full) so concurrent requests share the same nlp.pipe call
+        batch = [await self.queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            texts = list(dict.fromkeys(text for text, _ in batch))
+            try:
+                results = await loop.run_in_executor(
+                    self.executor,
+                    lambda: self.predicter._predict_texts(texts, verbose=False),
+                )
+            except Exception as e:
+                logger.opt(exception=e).error(e)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            logger.debug(f"Micro-batch: {len(batch)} requisições, {len(texts)} textos")
+            results = dict(zip(texts, results))
+            for text, future in batch:
+                if not future.done():
+                    future.set_result(results[text])
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            status, payload = await self._route(reader)
+        except Exception as e:
+            logger.opt(exception=e).error(e)
+            status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)}
+
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        writer.write(
+            (
+                f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                "Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n"
+            ).encode("latin-1")
+            + body
+        )
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _route(self, reader: asyncio.StreamReader):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            return HTTPStatus.BAD_REQUEST, {"error": "Requisição inválida"}
+
+        lines = head.decode("latin-1").split("\r\n")
+        request_line = lines[0].split(" ")
+        if len(request_line) != 3:
+            return HTTPStatus.BAD_REQUEST, {"error": "Requisição inválida"}
+        method, path, _ = request_line
+        headers = {
+            key.strip().lower(): value.strip()
+            for key, _, value in (line.partition(":") for line in lines[1:] if line)
+        }
+
+        if method == "GET" and path == "/health":
+            return HTTPStatus.OK, {"status": "ok"}
+        if path != "/predict":
+            return HTTPStatus.NOT_FOUND, {"error": f"Rota {path} inexistente"}
+        if method != "POST":
+            return HTTPStatus.METHOD_NOT_ALLOWED, {"error": "Utilize POST"}
+
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            return HTTPStatus.BAD_REQUEST, {"error": "Content-Length inválido"}
+        if length > _MAX_BODY_SIZE:
+            return HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "Corpo muito grande"}
+        try:
+            data = json.loads(await reader.readexactly(length))
+        except (asyncio.IncompleteReadError, ValueError):
+            return HTTPStatus.BAD_REQUEST, {"error": "JSON inválido"}
+
+        # Accepts {"text": "..."} or {"texts": ["...", ...]}
+        if not isinstance(data, dict):
+            return HTTPStatus.BAD_REQUEST, {"error": "Informe 'text' ou 'texts'"}
+        texts = data.get("texts", [data["text"]] if "text" in data else None)
+        if not isinstance(texts, list) or not all(isinstance(x, str) for x in texts):
+            return HTTPStatus.BAD_REQUEST, {"error": "Informe 'text' ou 'texts'"}
+
+        return HTTPStatus.OK, {"results": await self.predict(texts)}
+
+    async def start(
+        self,
+        *,
+        host: str = "127.0.0.1",
+        port: int = 8000,
+        socket_path: Union[str, Path, None] = None,
+    ) -> asyncio.AbstractServer:
+        # Starts the batcher and listens (port 0 picks a free port), the
+        # caller serves the returned server and calls close at the end
+        self.queue = asyncio.Queue()
+        self.batcher = asyncio.create_task(self._batcher())
+        if socket_path is not None:
+            server = await asyncio.start_unix_server(self._handle, path=str(socket_path))
+            logger.success(f"Servidor iniciado em unix:{socket_path}")
+        else:
+            server = await asyncio.start_server(self._handle, host=host, port=port)
+            port = server.sockets[0].getsockname()[1]
+            logger.success(f"Servidor iniciado em http://{host}:{port}")
+        return server
+
+    def close(self):
+        if self.batcher is not None:
+            self.batcher.cancel()
+            self.batcher = None
+        self.executor.shutdown(wait=False)
+        self.predicter.close()
+
+    async def serve(
+        self,
+        *,
+        host: str = "127.0.0.1",
+        port: int = 8000,
+        socket_path: Union[str, Path, None] = None,
+    ):
+        server = await self.start(host=host, port=port, socket_path=socket_path)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.close()
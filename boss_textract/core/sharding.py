@@ -0,0 +1,175 @@
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from core.organizations import OrganizationMatcher
+from core.predicter import ModelPredicter
+from core.preprocessor import DataPreprocessor
+from utils.logger import logger
+
+# Original position of each row, kept by predict as any other column
+ROW_COLUMN = "BOSS_ROW"
+
+
+def shard_paths(file_path: Path, output_dir: Path, parts: int) -> list[Path]:
+    suffix = ".parquet" if DataPreprocessor.is_parquet(file_path) else ".csv"
+    return [
+        output_dir / f"{file_path.stem}.shard{index + 1:03d}of{parts:03d}{suffix}"
+        for index in range(parts)
+    ]
+
+
+def shard_file(
+    file_path: Path,
+    output_dir: Path,
+    parts: int,
+    source_column: str,
+    separator: str,
+    encoding: str,
+    *,
+    start_header: int = 0,
+    chunksize: int = 100_000,
+) -> list[Path]:
+    if parts < 1:
+        raise ValueError(f"A quantidade de partes {parts} é invalida")
+    paths = shard_paths(file_path, output_dir, parts)
+    rows = np.zeros(parts, dtype=np.int64)
+    offset = 0
+    with ExitStack() as stack:
+        writers = [
+            stack.enter_context(DataPreprocessor.chunk_writer(path, separator))
+            for path in paths
+        ]
+        for df in DataPreprocessor.load_chunks(
+            file_path,
+            separator,
+            encoding,
+            chunksize=chunksize,
+            start_header=start_header,
+        ):
+            if source_column not in df.columns:
+                raise ValueError(f"A coluna {source_column} não existe em {file_path}")
+            if ROW_COLUMN in df.columns:
+                raise ValueError(f"A coluna {ROW_COLUMN} já existe em {file_path}")
+            df.insert(0, ROW_COLUMN, np.arange(offset, offset + len(df)))
+            offset += len(df)
+
+            # Same normalized text, same part: duplicates are predicted once
+            # and max_variation sees them together on each node
+            texts = DataPreprocessor.format_column(
+                DataPreprocessor.to_object(df[source_column])
+            ).fillna("")
+            shards = pd.util.hash_array(texts.to_numpy(dtype=object)) % parts
+            for index, write in enumerate(writers):
+                part = df[shards == index]
+                if len(part) or rows[index] == 0:
+                    # Empty parts are still written, so each one has a header
+                    write(part)
+                rows[index] += len(part)
+
+    for path, count in zip(paths, rows):
+        logger.info(f"{path}: {count} linhas")
+    return paths
+
+
+def _polish_outputs(
+    texts: pd.Series,
+    outputs: np.ndarray,
+    max_variation: int,
+    responses: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    # The organization table is built as in predict, in the order of the
+    # sorted normalized texts. With the raw responses of the nodes it holds
+    # the same names as a single predict and the polished name replaces the
+    # output of their rows (exact), without them the formatted outputs of
+    # the nodes stand for the responses (approximate)
+    names_source = responses if responses is not None else outputs
+    codes, _ = pd.factorize(texts, sort=True, use_na_sentinel=False)
+    names = {}
+    for index in np.argsort(codes, kind="stable"):
+        name = names_source[index]
+        if isinstance(name, str) and name != "":
+            names.setdefault(name, None)
+    names = list(names)
+
+    polished = ModelPredicter.polish_names(names, max_variation)
+    outputs = np.array(
+        [
+            polished.get(name, output) if isinstance(name, str) else output
+            for name, output in zip(names_source, outputs)
+        ],
+        dtype=object,
+    )
+
+    empty = np.array([not isinstance(x, str) or x == "" for x in outputs])
+    if empty.any():
+        missing = outputs[empty]
+        ModelPredicter._fill_empty(
+            [str(text) for text in texts[empty]],
+            missing,
+            OrganizationMatcher(polished.get(x, x) for x in names),
+        )
+        outputs[empty] = missing
+    return outputs
+
+
+def merge_files(
+    paths: list[Path],
+    output_path: Path,
+    source_column: str,
+    output_column: str,
+    separator: str,
+    *,
+    max_variation: int = 0,
+    encoding: str = "utf-8",
+) -> pd.DataFrame:
+    frames = []
+    for path in paths:
+        df = DataPreprocessor.load(path, separator, encoding)
+        for column in (ROW_COLUMN, source_column, output_column):
+            if column not in df.columns:
+                raise ValueError(f"A coluna {column} não existe em {path}")
+        frames.append(df)
+    response_column = ModelPredicter.response_column(output_column)
+    with_responses = [response_column in df.columns for df in frames]
+    if any(with_responses) and not all(with_responses):
+        raise ValueError(
+            f"A coluna {response_column} não existe em todas as partes "
+            "(gere todas com --responses)"
+        )
+    df = pd.concat(frames, ignore_index=True)
+    del frames
+
+    rows = df.pop(ROW_COLUMN).astype("int64")
+    if rows.duplicated().any():
+        raise ValueError("Linhas repetidas entre as partes, verifique os arquivos")
+    df = df.iloc[np.argsort(rows.to_numpy(), kind="stable")].reset_index(drop=True)
+    expected = int(rows.max()) + 1 if len(rows) else 0
+    if expected != len(df):
+        logger.warning(f"{expected - len(df)} linhas ausentes nas partes informadas")
+
+    if max_variation is None or max_variation > 0:
+        texts = DataPreprocessor.format_column(
+            DataPreprocessor.to_object(df[source_column])
+        )
+        if response_column not in df.columns:
+            logger.warning(
+                f"Sem a coluna {response_column} (--responses no predict), o "
+                "--max_variation usa as saídas formatadas e pode diferir do predict"
+            )
+        df[output_column] = _polish_outputs(
+            texts,
+            DataPreprocessor.to_object(df[output_column]).to_numpy(dtype=object),
+            max_variation,
+            (
+                DataPreprocessor.to_object(df[response_column]).to_numpy(dtype=object)
+                if response_column in df.columns
+                else None
+            ),
+        )
+
+    DataPreprocessor.save(df, output_path, separator)
+    return df
@@ -1,25 +1,84 @@
 import gc
+import hashlib
+import json
+import multiprocessing
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import tempfile
 import spacy
 from sklearn.model_selection import train_test_split
+from core.corpus import make_reference_doc
 from utils.logger import logger
-from typing import Union, Dict, Any
+from utils.metrics import RunMetrics
+from typing import Optional, Union, Dict, Any
 from spacy.cli.train import train
 from tqdm import tqdm
 
+_blank_nlp = None
+
+
+def _build_doc_bin(dataset: list, output_path: Path, debug_name: str) -> int:
+    global _blank_nlp
+    if _blank_nlp is None:
+        _blank_nlp = spacy.blank("pt")
+
+    # Salvar dados em formato spaCy
+    doc_bin = spacy.tokens.DocBin()
+    invalid_spans = 0
+    for text, annotations in dataset:
+        doc, invalid = make_reference_doc(
+            _blank_nlp, text, annotations["entities"], debug_name
+        )
+        invalid_spans += invalid
+        doc_bin.add(doc)
+    doc_bin.to_disk(output_path)
+    return invalid_spans
+
 
 class ModelTrainer:
+    SHARD_SIZE = 10_000
+
     def __init__(
         self,
         config_path: Union[Path, str],
         output_path: Union[Path, str],
         *,
         overrides: Dict[str, Any] = spacy.util.SimpleFrozenDict(),
+        corpus_cache: Optional[Union[Path, str]] = None,
+        workers: int = 1,
+        metrics: Optional[RunMetrics] = None,
     ):
         self.config_path = spacy.util.ensure_path(config_path)
         self.output_path = spacy.util.ensure_path(output_path)
-        self.overrides = overrides
+        self.overrides = dict(overrides)
+        self.corpus_cache = spacy.util.ensure_path(corpus_cache)
+        self.workers = workers
+        self.metrics = metrics if metrics is not None else RunMetrics()
+
+    @staticmethod
+    def _corpus_key(train_data: list, dev_data: Optional[list], train_size: float):
+        # The docs are tokenized by a blank pt pipeline, a new spaCy version
+        # may tokenize (and align the spans) differently
+        digest = hashlib.sha256()
+        digest.update(
+            json.dumps(
+                {
+                    "train_size": train_size,
+                    "random_state": 42,
+                    "lang": "pt",
+                    "spacy": spacy.about.__version__,
+                }
+            ).encode()
+        )
+        for name, dataset in (("train", train_data), ("dev", dev_data)):
+            digest.update(name.encode())
+            if dataset is None:
+                continue
+            for example in dataset:
+                digest.update(json.dumps(example, ensure_ascii=False).encode("utf-8"))
+                digest.update(b"\n")
+        return digest.hexdigest()
 
     def train(
         self,
@@ -28,60 +87,106 @@ class ModelTrainer:
         train_size: float = 0.8,
         dev_data: list[str, Dict[str, list[int, int, str]]] = None,
         gpu_id: int = -1,
+    ):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            if self.corpus_cache is not None:
+                corpus_path = self.corpus_cache / self._corpus_key(
+                    train_data, dev_data, train_size
+                )
+            else:
+                corpus_path = Path(temp_dir) / "corpus"
+
+            if corpus_path.is_dir():
+                logger.info(f"Utilizando corpus em cache: {corpus_path}")
+            else:
+                rows = len(train_data) + (len(dev_data) if dev_data else 0)
+                with self.metrics.stage("prepare_corpus", rows=rows):
+                    self._prepare_corpus(
+                        train_data,
+                        corpus_path,
+                        train_size=train_size,
+                        dev_data=dev_data,
+                    )
+            del train_data, dev_data
+            gc.collect()
+
+            self.overrides["paths.train"] = str(corpus_path / "train")
+            self.overrides["paths.dev"] = str(corpus_path / "dev")
+            with self.metrics.stage("train", output=str(self.output_path)):
+                train(
+                    self.config_path,
+                    output_path=self.output_path,
+                    use_gpu=gpu_id,
+                    overrides=self.overrides,
+                )
+
+    def _prepare_corpus(
+        self,
+        train_data: list,
+        corpus_path: Path,
+        *,
+        train_size: float,
+        dev_data: Optional[list],
     ):
         if dev_data is None:
             train_data, dev_data = train_test_split(
                 train_data, train_size=train_size, random_state=42
             )
 
-        gc.collect()
-        with tempfile.TemporaryDirectory() as temp_dir:
-            train_path = Path(temp_dir) / "train.spacy"
-            dev_path = Path(temp_dir) / "dev.spacy"
-            logger.info("Preparing Training data")
-            invalid_spans = 0
-            invalid_spans += self._prepare_training_data(
-                train_data, train_path, "TRAIN DATASET"
+        # Built next to the final directory and renamed once complete, so an
+        # interrupted run never leaves a partial corpus in the cache
+        build_path = corpus_path.with_name(f"{corpus_path.name}.tmp")
+        if build_path.exists():
+            shutil.rmtree(build_path)
+
+        logger.info("Preparing Training data")
+        invalid_spans = 0
+        for name, dataset, debug_name in (
+            ("train", train_data, "TRAIN DATASET"),
+            ("dev", dev_data, "EVAL DATASET"),
+        ):
+            (build_path / name).mkdir(parents=True)
+            invalid_spans += self._prepare_shards(
+                dataset, build_path / name, debug_name
             )
-            invalid_spans += self._prepare_training_data(
-                dev_data, dev_path, "EVAL DATASET"
+        logger.info(f"Foram encontrados {invalid_spans} spans inválidos.")
+        build_path.rename(corpus_path)
+
+    def _prepare_shards(self, dataset: list, output_dir: Path, debug_name: str):
+        shards = [
+            dataset[i : i + self.SHARD_SIZE]
+            for i in range(0, len(dataset), self.SHARD_SIZE)
+        ] or [[]]
+        paths = [output_dir / f"{index:05d}.spacy" for index in range(len(shards))]
+        if self.workers <= 1 or len(shards) <= 1:
+            return sum(
+                _build_doc_bin(shard, path, debug_name)
+                for shard, path in tqdm(zip(shards, paths), total=len(shards))
             )
-            logger.info(f"Foram encontrados {invalid_spans} spans inválidos.")
 
-            self.overrides["paths.train"] = str(train_path)
-            self.overrides["paths.dev"] = str(dev_path)
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as executor:
+            return sum(
+                tqdm(
+                    executor.map(
+                        _build_doc_bin, shards, paths, [debug_name] * len(shards)
+                    ),
+                    total=len(shards),
+                )
+            )
 
-            del train_data, dev_data
+    def _prepare_training_data(self, dataset: list, output_path: Path, debug_name: str):
+        return _build_doc_bin(tqdm(dataset), output_path, debug_name)
+
+    def train_corpora(self, *, gpu_id: int = -1):
+        # Corpora read by the readers set in the config/overrides (for example
+        # boss_textract.CsvCorpus.v1), nothing is prepared in memory
+        with self.metrics.stage("train", output=str(self.output_path)):
             train(
                 self.config_path,
                 output_path=self.output_path,
                 use_gpu=gpu_id,
                 overrides=self.overrides,
             )
-
-    def _prepare_training_data(self, dataset: list, output_path: Path, debug_name: str):
-        # Salvar dados em formato spaCy
-        doc_bin = spacy.tokens.DocBin()
-        nlp = spacy.blank("pt")
-        invalid_spans = 0
-        for text, annotations in tqdm(dataset):
-            doc = nlp.make_doc(text)
-            ents = []
-
-            for start, end, label in annotations["entities"]:
-                span = doc.char_span(start, end, label=label, alignment_mode="strict")
-                if span is not None:
-                    logger.trace(
-                        f"Span: {str(span)} | Text: {str(doc)[start:end]} | Source: {str(doc)}"
-                    )
-                    ents.append(span)
-                else:
-                    logger.debug(
-                        f"{f'[{debug_name}] ' if debug_name is not None else ''}Source don't has char_span [{str(doc)}] <- [{str(doc)[start:end]}]"
-                    )
-                    invalid_spans += 1
-
-            doc.ents = ents
-            doc_bin.add(doc)
-        doc_bin.to_disk(output_path)
-        return invalid_spans
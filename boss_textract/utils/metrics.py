@@ -0,0 +1,112 @@
+import cProfile
+import json
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Union
+
+from utils.logger import logger
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Stages wrapped by the profiler, the ones where the time is spent
+PROFILED_STAGES = {"infer", "polish", "fill", "prepare_corpus"}
+
+
+def peak_rss_mb(who: str = "self") -> Optional[float]:
+    if resource is None:
+        return None
+    usage = resource.getrusage(
+        resource.RUSAGE_SELF if who == "self" else resource.RUSAGE_CHILDREN
+    )
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(usage.ru_maxrss / scale, 1)
+
+
+class RunMetrics:
+    def __init__(
+        self,
+        path: Union[str, Path, None] = None,
+        *,
+        command: str = "",
+        profile: Union[str, Path, None] = None,
+    ):
+        self.path = Path(path) if path is not None else None
+        self.command = command
+        self.profile_path = Path(profile) if profile is not None else None
+        self.profiler = cProfile.Profile() if profile is not None else None
+        self.start = time.perf_counter()
+        self.file = None
+        if self.path is not None:
+            if not self.path.parent.exists():
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.file = self.path.open("a", encoding="utf-8")
+
+    def emit(self, stage: str, **fields):
+        if self.file is None:
+            return
+        record = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "command": self.command,
+            "stage": stage,
+            **fields,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        children = peak_rss_mb("children")
+        if children:
+            record["peak_rss_children_mb"] = children
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def _record(self, name: str, seconds: float, fields: dict):
+        rows = fields.get("rows")
+        if rows is not None:
+            fields["rows_per_second"] = (
+                round(rows / seconds, 1) if seconds > 0 else None
+            )
+        self.emit(name, seconds=round(seconds, 6), **fields)
+
+    @contextmanager
+    def stage(self, name: str, **fields) -> Iterator[dict]:
+        # The yielded dict takes the fields only known inside the stage (rows,
+        # unique texts, cache hits, ...), rows/s is derived from "rows"
+        profile = self.profiler is not None and name in PROFILED_STAGES
+        if profile:
+            self.profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield fields
+        finally:
+            seconds = time.perf_counter() - start
+            if profile:
+                self.profiler.disable()
+            self._record(name, seconds, fields)
+
+    def iterate(self, name: str, items: Iterable) -> Iterator:
+        # Times the reading of each item of a lazy iterable (the chunks of a
+        # file), one record per item with its number of rows
+        iterator = iter(items)
+        while True:
+            start = time.perf_counter()
+            item = next(iterator, None)
+            if item is None:
+                return
+            self._record(name, time.perf_counter() - start, {"rows": len(item)})
+            yield item
+
+    def close(self):
+        self.emit("total", seconds=round(time.perf_counter() - self.start, 6))
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            logger.info(f"Métricas salvas em: {self.path}")
+        if self.profiler is not None:
+            if not self.profile_path.parent.exists():
+                self.profile_path.parent.mkdir(parents=True, exist_ok=True)
+            self.profiler.dump_stats(self.profile_path)
+            logger.info(f"Perfil (cProfile) salvo em: {self.profile_path}")
@@ -0,0 +1,113 @@
+import json
+import sqlite3
+
+import pandas as pd
+import pytest
+import spacy
+
+from core.cache import PredictionCache
+from core.predicter import ModelPredicter
+
+SOURCE, OUTPUT = "HISTORICO", "EMPRESA"
+
+TEXTS = [
+    "PAGTO ALFA LTDA",
+    "PAGTO BETA SERVICOS",
+    "TED ALFA LTDA",
+    "OUTRO",
+    "PAGTO ALFA LTDA",
+    "DEB GAMA",
+]
+
+
+@pytest.fixture
+def model(tmp_path):
+    # A real pipeline, the organizations are found by an entity ruler
+    nlp = spacy.blank("pt")
+    ruler = nlp.add_pipe("entity_ruler")
+    ruler.add_patterns(
+        [
+            {"label": "ORG", "pattern": name}
+            for name in ("ALFA LTDA", "BETA SERVICOS", "GAMA")
+        ]
+    )
+    nlp.to_disk(tmp_path / "model")
+    return tmp_path / "model"
+
+
+def count_rows(cache_dir) -> int:
+    connection = sqlite3.connect(cache_dir / PredictionCache.FILE_NAME)
+    try:
+        return connection.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+    finally:
+        connection.close()
+
+
+def test_evicts_the_least_recently_used(tmp_path, model):
+    cache = PredictionCache(tmp_path / "cache", model, max_entries=3)
+    for text in ("A", "B", "C"):
+        cache.put_many([(text, ((0, 1, "ORG"),))])
+    # A is read again, so B is now the least recently used
+    assert list(cache.get_many(["A"])) == ["A"]
+    cache.put_many([("D", ())])
+    assert count_rows(tmp_path / "cache") == 3
+    assert cache.get_many(["A", "B", "C", "D"]) == {
+        "A": ((0, 1, "ORG"),),
+        "C": ((0, 1, "ORG"),),
+        "D": (),
+    }
+    cache.close()
+
+    # A smaller capacity is applied when the cache is opened
+    cache = PredictionCache(tmp_path / "cache", model, max_entries=1)
+    assert count_rows(tmp_path / "cache") == 1
+    cache.close()
+
+
+def test_model_change_invalidates(tmp_path, model):
+    cache = PredictionCache(tmp_path / "cache", model)
+    cache.put_many([("PAGTO ALFA LTDA", ((6, 15, "ORG"),))])
+    cache.close()
+
+    cache = PredictionCache(tmp_path / "cache", model)
+    assert cache.get_many(["PAGTO ALFA LTDA"]) == {"PAGTO ALFA LTDA": ((6, 15, "ORG"),)}
+    cache.close()
+
+    meta = json.loads((model / "meta.json").read_text(encoding="utf-8"))
+    meta["version"] = "0.0.1"
+    (model / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+    cache = PredictionCache(tmp_path / "cache", model)
+    assert cache.get_many(["PAGTO ALFA LTDA"]) == {}
+    assert count_rows(tmp_path / "cache") == 0
+    cache.close()
+
+
+def test_variants_have_their_own_predictions(tmp_path, model):
+    cache = PredictionCache(tmp_path / "cache", model)
+    cache.put_many([("PAGTO ALFA LTDA", ())])
+    other = PredictionCache(tmp_path / "cache", model, variant='{"window": 64}')
+    assert other.get_many(["PAGTO ALFA LTDA"]) == {}
+    assert cache.get_many(["PAGTO ALFA LTDA"]) == {"PAGTO ALFA LTDA": ()}
+    other.close()
+    cache.close()
+
+
+@pytest.mark.parametrize("max_variation", [0, 3])
+def test_rerun_hits_the_cache_with_the_same_outputs(tmp_path, model, max_variation):
+    df = pd.DataFrame({SOURCE: TEXTS})
+    uncached = ModelPredicter(model, -1)
+    expected = uncached.predict(df.copy(), SOURCE, OUTPUT, max_variation)
+    uncached.close()
+    assert expected[OUTPUT].tolist()[:3] == ["ALFA LTDA", "BETA SERVICOS", "ALFA LTDA"]
+
+    outputs = []
+    for _ in range(2):
+        predicter = ModelPredicter(model, -1, cache_dir=tmp_path / "cache")
+        outputs.append(predicter.predict(df.copy(), SOURCE, OUTPUT, max_variation))
+        hits, misses = predicter.cache.hits, predicter.cache.misses
+        predicter.close()
+    unique = len(set(TEXTS))
+    assert (hits, misses) == (unique, 0)
+    assert count_rows(tmp_path / "cache") == unique
+    for output in outputs:
+        assert output.equals(expected)
@@ -0,0 +1,65 @@
+import argparse
+
+import pandas as pd
+import spacy
+
+from commands.train_command import TrainCommand
+from core.corpus import CsvCorpus
+
+SOURCE, RESPONSE = "HISTORICO", "EMPRESA"
+
+TRAIN = [
+    ("PAGTO ALFA LTDA", "ALFA LTDA"),
+    ("pagto  beta", "BETA"),
+    ("PAGTO GAMA", "GAMA"),
+    ("TED DELTA", "DELTA"),
+    ("PAGTO BETA", "BETA"),
+]
+# Also found in the train file, one of them only after the normalization
+EVAL = [("PAGTO BETA", "BETA"), ("TED DELTA", "DELTA"), ("PAGTO OMEGA", "OMEGA")]
+
+
+def write_csv(path, rows):
+    pd.DataFrame(rows, columns=[SOURCE, RESPONSE]).to_csv(path, sep=";", index=False)
+
+
+def read_texts(corpus) -> list:
+    return [example.reference.text for example in corpus(spacy.blank("pt"))]
+
+
+def test_exclude_skips_the_eval_texts(tmp_path):
+    write_csv(tmp_path / "train.csv", TRAIN)
+    write_csv(tmp_path / "eval.csv", EVAL)
+    options = dict(source_column=SOURCE, response_columns=f"{RESPONSE}:ORG")
+
+    texts = read_texts(CsvCorpus(tmp_path / "train.csv", **options))
+    assert texts == [
+        "PAGTO ALFA LTDA",
+        "PAGTO BETA",
+        "PAGTO GAMA",
+        "TED DELTA",
+        "PAGTO BETA",
+    ]
+
+    corpus = CsvCorpus(tmp_path / "train.csv", exclude=tmp_path / "eval.csv", **options)
+    assert read_texts(corpus) == ["PAGTO ALFA LTDA", "PAGTO GAMA"]
+    # Read again each epoch, the hashes of the eval file are kept
+    assert read_texts(corpus) == ["PAGTO ALFA LTDA", "PAGTO GAMA"]
+
+
+def test_stream_overrides_exclude_eval_from_train(tmp_path):
+    args = argparse.Namespace(
+        data=tmp_path / "train.csv",
+        eval=tmp_path / "eval.csv",
+        train_size=0.8,
+        encoding="UTF-8",
+    )
+    columns = [{"column": RESPONSE, "type": "ORG"}]
+    overrides = TrainCommand._get_stream_overrides(args, SOURCE, columns, ";", 5)
+    assert overrides["corpora.train.exclude"] == str(tmp_path / "eval.csv")
+    assert overrides["corpora.dev.exclude"] is None
+
+    args.eval = None
+    overrides = TrainCommand._get_stream_overrides(args, SOURCE, columns, ";", 5)
+    assert overrides["corpora.train.exclude"] is None
+    assert overrides["corpora.train.split"] == "train"
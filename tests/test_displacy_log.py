@@ -0,0 +1,78 @@
+import re
+
+import pytest
+
+from core.displacy_log import DisplacyLog
+
+
+def add_texts(log: DisplacyLog, size: int):
+    for index in range(size):
+        text = f"PAGTO EMPRESA {index:04d}"
+        # Every third text has no entity, skipped when not ambiguous
+        ents = () if index % 3 == 2 else ((6, len(text), "ORG"),)
+        log.add(text, ents)
+
+
+def page_numbers(log: DisplacyLog) -> list:
+    return [
+        [int(x) for x in re.findall(r"EMPRESA (\d{4})", page.read_text("utf-8"))]
+        for page in log.pages
+    ]
+
+
+def test_pages_are_written_while_streaming(tmp_path):
+    log = DisplacyLog(tmp_path / "log.html", page_size=4)
+    add_texts(log, 15)
+    # 10 texts with entities, the full pages are already on disk
+    assert len(log.pages) == 2 and all(page.exists() for page in log.pages)
+    assert not (tmp_path / "log.html").exists()
+    log.close()
+    assert page_numbers(log) == [[0, 1, 3, 4], [6, 7, 9, 10], [12, 13]]
+    assert [page.name for page in log.pages] == [
+        "log_0001.html",
+        "log_0002.html",
+        "log_0003.html",
+    ]
+    index = (tmp_path / "log.html").read_text(encoding="utf-8")
+    assert "3 página(s), 10 de 10 texto(s)" in index
+    assert all(page.name in index for page in log.pages)
+
+
+def test_sample_is_bounded(tmp_path):
+    log = DisplacyLog(tmp_path / "log.html", page_size=4, sample=10, ambiguous=True)
+    add_texts(log, 3000)
+    # The reservoir never holds more than the sample, nothing is written yet
+    assert len(log.entries) == 10 and log.pages == []
+    log.close()
+    numbers = page_numbers(log)
+    assert [len(x) for x in numbers] == [4, 4, 2]
+    # Only the texts without entity, in input order
+    flat = [x for page in numbers for x in page]
+    assert flat == sorted(flat) and all(x % 3 == 2 for x in flat)
+    assert (log.seen, log.written) == (1000, 10)
+
+
+def test_sample_is_reproducible(tmp_path):
+    samples = []
+    for name, seed in (("a", 7), ("b", 7), ("c", 8)):
+        log = DisplacyLog(
+            tmp_path / f"{name}.html", page_size=100, sample=20, seed=seed
+        )
+        add_texts(log, 3000)
+        log.close()
+        samples.append(page_numbers(log))
+    assert samples[0] == samples[1]
+    assert samples[0] != samples[2]
+
+
+def test_nothing_logged_writes_no_files(tmp_path):
+    log = DisplacyLog(tmp_path / "log.html", sample=5)
+    log.add("OUTRO", ())
+    log.close()
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize("options", [{"page_size": 0}, {"sample": 0}])
+def test_invalid_sizes(tmp_path, options):
+    with pytest.raises(ValueError):
+        DisplacyLog(tmp_path / "log.html", **options)
@@ -0,0 +1,133 @@
+import argparse
+
+import pandas as pd
+import spacy
+
+from commands.gazetteer_command import GazetteerCommand
+from core.gazetteer import Gazetteer
+from core.predicter import ModelPredicter
+
+
+def parse_args(*argv) -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    GazetteerCommand.add_arguments(parser)
+    return parser.parse_args([*argv, "--sep", "SEMICOLON"])
+
+
+def write_csv(path, **columns):
+    pd.DataFrame(columns).to_csv(path, sep=";", index=False)
+
+
+def test_build_and_match(tmp_path):
+    write_csv(
+        tmp_path / "train.csv",
+        HISTORICO=["PAGTO ALFA LTDA", "TED alfa ltda", "PAGTO BETA", "PAGTO XY", "XY"],
+        EMPRESA=["ALFA LTDA", "alfa  ltda", "BETA", "XY", "XY"],
+    )
+    GazetteerCommand.execute(
+        parse_args(
+            "--data",
+            str(tmp_path / "train.csv"),
+            "--res_col",
+            "EMPRESA:ORG",
+            "--output",
+            str(tmp_path / "gazetteer.jsonl"),
+            "--min_samples",
+            "2",
+            "--min_length",
+            "3",
+        )
+    )
+    # BETA has one sample and XY is too short
+    gazetteer = Gazetteer.from_disk(spacy.blank("pt"), tmp_path / "gazetteer.jsonl")
+    assert gazetteer.size == 1
+    assert list(
+        gazetteer.match(
+            [
+                "PAGTO ALFA LTDA",
+                "PAGTO BETA",
+                "ALFA LTDA EIRELI",
+                "ALFA LTDA E ALFA LTDA",
+            ]
+        )
+    ) == [((6, 15, "ORG"),), None, None, None]
+
+
+def test_build_skips_missing_columns(tmp_path):
+    write_csv(
+        tmp_path / "train.csv",
+        HISTORICO=["PAGTO ALFA", "PAGTO BETA"],
+        EMPRESA=["ALFA", "BETA"],
+        BANCO=["ITAU", "CAIXA"],
+    )
+    # An earlier predict output, without the BANCO column
+    write_csv(tmp_path / "output.csv", HISTORICO=["PAGTO GAMA"], EMPRESA=["GAMA"])
+    args = parse_args(
+        "--data",
+        str(tmp_path / "train.csv"),
+        str(tmp_path / "output.csv"),
+        "--res_col",
+        "EMPRESA:ORG;BANCO:BANK",
+        "--output",
+        str(tmp_path / "gazetteer.jsonl"),
+    )
+    GazetteerCommand.execute(args)
+    gazetteer = Gazetteer.from_disk(spacy.blank("pt"), args.output)
+    assert gazetteer.size == 5
+    assert list(gazetteer.match(["PAGTO GAMA", "TED CAIXA"])) == [
+        ((6, 10, "ORG"),),
+        ((4, 9, "BANK"),),
+    ]
+
+    # A column that no file has is an error, nothing is written
+    args.output = tmp_path / "other.jsonl"
+    args.res_col = "OUTRA:ORG"
+    GazetteerCommand.execute(args)
+    assert not args.output.exists()
+
+
+def test_gazetteer_takes_precedence_over_the_model(tmp_path):
+    # The model only knows ALFA and BETA EIRELI, the gazetteer ALFA LTDA
+    # and BETA
+    nlp = spacy.blank("pt")
+    nlp.add_pipe("entity_ruler").add_patterns(
+        [
+            {"label": "ORG", "pattern": "ALFA"},
+            {"label": "ORG", "pattern": "BETA EIRELI"},
+        ]
+    )
+    nlp.to_disk(tmp_path / "model")
+    Gazetteer.to_disk(
+        [
+            {"label": "ORG", "pattern": "ALFA LTDA"},
+            {"label": "ORG", "pattern": "BETA"},
+        ],
+        tmp_path / "gazetteer.jsonl",
+    )
+    texts = ["PAGTO ALFA LTDA", "PAGTO ALFA", "PAGTO BETA EIRELI", "PAGTO BETA"]
+
+    predicter = ModelPredicter(tmp_path / "model", -1)
+    assert predicter._predict_texts(texts) == [
+        ((6, 10, "ORG"),),
+        ((6, 10, "ORG"),),
+        ((6, 17, "ORG"),),
+        (),
+    ]
+    predicter.close()
+
+    predicter = ModelPredicter(
+        tmp_path / "model",
+        -1,
+        gazetteer=tmp_path / "gazetteer.jsonl",
+        cache_dir=tmp_path / "cache",
+    )
+    # A known name followed by a company suffix is left to the model
+    assert predicter._predict_texts(texts) == [
+        ((6, 15, "ORG"),),
+        ((6, 10, "ORG"),),
+        ((6, 17, "ORG"),),
+        ((6, 10, "ORG"),),
+    ]
+    # Only the texts predicted by the model are cached
+    assert set(predicter.cache.get_many(texts)) == {"PAGTO ALFA", "PAGTO BETA EIRELI"}
+    predicter.close()
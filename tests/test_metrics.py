@@ -0,0 +1,84 @@
+import argparse
+import json
+import pstats
+
+import pandas as pd
+import pytest
+import spacy
+
+from commands.predict_command import PredictCommand
+from utils.metrics import RunMetrics
+
+SOURCE, OUTPUT = "HISTORICO", "EMPRESA"
+
+TEXTS = ["PAGTO ALFA LTDA", "TED ALFA LTDA", "PAGTO BETA", "OUTRO", "PAGTO ALFA LTDA"]
+
+
+@pytest.fixture
+def model(tmp_path):
+    nlp = spacy.blank("pt")
+    nlp.add_pipe("entity_ruler").add_patterns(
+        [{"label": "ORG", "pattern": name} for name in ("ALFA LTDA", "BETA")]
+    )
+    nlp.to_disk(tmp_path / "model")
+    return tmp_path / "model"
+
+
+def read_records(path) -> list:
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_stage_records(tmp_path):
+    metrics = RunMetrics(tmp_path / "metrics.ndjson", command="test")
+    with metrics.stage("infer", unique=3) as stage:
+        stage["rows"] = 10
+    assert list(metrics.iterate("load", [[1, 2], [3]])) == [[1, 2], [3]]
+    metrics.close()
+
+    records = read_records(tmp_path / "metrics.ndjson")
+    assert [x["stage"] for x in records] == ["infer", "load", "load", "total"]
+    assert all(x["command"] == "test" and x["seconds"] >= 0 for x in records)
+    assert records[0]["unique"] == 3 and records[0]["rows"] == 10
+    assert "rows_per_second" in records[0]
+    assert [x["rows"] for x in records[1:3]] == [2, 1]
+    assert "rows" not in records[3]
+
+
+def test_no_path_writes_nothing(tmp_path):
+    metrics = RunMetrics()
+    with metrics.stage("infer", rows=1):
+        pass
+    metrics.close()
+    assert metrics.file is None
+
+
+def test_predict_metrics_and_profile(tmp_path, model):
+    pd.DataFrame({SOURCE: TEXTS}).to_csv(tmp_path / "input.csv", sep=";", index=False)
+    parser = argparse.ArgumentParser()
+    PredictCommand.add_arguments(parser)
+    args = parser.parse_args(
+        ["--data", str(tmp_path / "input.csv"), "--output", str(tmp_path / "out.csv")]
+        + ["--model", str(model), "--src_col", SOURCE, "--out_col", OUTPUT]
+        + ["--sep", "SEMICOLON", "--no-log", "--max_variation", "2"]
+        + ["--metrics", str(tmp_path / "metrics.ndjson")]
+        + ["--profile", str(tmp_path / "predict.prof")]
+    )
+    PredictCommand.execute(args)
+
+    records = read_records(tmp_path / "metrics.ndjson")
+    stages = [x["stage"] for x in records]
+    for stage in ("model_load", "load", "infer", "polish", "write"):
+        assert stage in stages, stage
+    assert stages[-1] == "total"
+    infer = records[stages.index("infer")]
+    # The repeated text is predicted once
+    assert infer["rows"] == 4 and infer["rows_per_second"] is not None
+    assert all(x["command"] == "predict" for x in records)
+    assert all(x["peak_rss_mb"] > 0 for x in records)
+
+    # Only the profiled stages are in the profile
+    functions = {
+        name for _, _, name in pstats.Stats(str(tmp_path / "predict.prof")).stats
+    }
+    assert "_predict_texts" in functions
+    assert "read_csv" not in functions
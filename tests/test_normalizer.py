@@ -0,0 +1,188 @@
+import math
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from core import normalizer
+from core.normalizer import normalize_text
+from core.preprocessor import DataPreprocessor
+
+
+def legacy_format_column(column: pd.Series) -> pd.Series:
+    # Frozen copy of the Series.replace chain format_column used before the
+    # precompiled normalizer, the reference of the parity tests
+    column = column.str.upper()
+    column = column.replace(r"<BR>", " ", regex=True)
+    column = column.replace(r"\s+", " ", regex=True)
+    column = column.replace(r"\d{11,}|\d{1,2}[\/\\]\d{2,4}$", "", regex=True)
+    column = column.replace(
+        r"(?:\s|^)[\/\\](?=[\w\s\.\,])|(?<=[\w\s\.\,])[\/\\](?=\s|$)",
+        " ",
+        regex=True,
+    )
+    column = column.replace(r"(?<=[\w\s\.\,])\-(?=[\w\s\.\,])", " - ", regex=True)
+    column = column.replace(
+        r"(?<=[\w\s\.\,])(?<!\s)[\\\/,\;]+(?=(?=\s)|(?!\s))(?<![\w\s])",
+        " ",
+        regex=True,
+    )
+    column = column.replace(r"\s?\-\s*(ME|EM|EPP)(?=$|\s+)", "", regex=True)
+    column = column.replace(r"\s+S\.(\s+|$)", "", regex=True)
+    column = column.replace(r"B\.V\.?(\s+|$)", "B.V ", regex=True)
+    column = column.replace(r"U\.A\.?(\s+|$)", "U.A ", regex=True)
+    column = column.replace(r"A\.S\.?(\s+|$)", "A.S ", regex=True)
+    column = column.replace(r"N\.V\.?(\s+|$)", "N.V ", regex=True)
+    column = column.replace(r"Z[\.\s]+O[\.\s]+O\.?[\/\\]?(\s+|$)", "Z.O.O ", regex=True)
+    column = column.replace(r"S[\.\s]+P[\.\s]+A\.?[\/\\]?(\s+|$)", "S.P.A ", regex=True)
+    column = column.replace(r"S[\.\s]+R[\.\s]+O\.?[\/\\]?(\s+|$)", "S.R.O ", regex=True)
+    column = column.replace(r"S[\.\s]+A[\.\s]+C\.?[\/\\]?(\s+|$)", "S.A.C ", regex=True)
+    column = column.replace(r"S[\.\s]+A[\.\s]+S\.?[\/\\]?(\s+|$)", "S.A.S ", regex=True)
+    column = column.replace(r"S[\.\s]+A[\.\s]+U\.?[\/\\]?(\s+|$)", "S.A.U ", regex=True)
+    column = column.replace(r"S[\.\s]+R[\.\s]+L\.?[\/\\]?(\s+|$)", "S.R.L ", regex=True)
+    column = column.replace(r"(?:NF\.)(?:(?:\d+\-?)|(?=[\w\d]))", "", regex=True)
+    column = column.replace(r"(?:RPS:?\s)(?:\d+\-?)", "", regex=True)
+    column = column.replace(
+        r"LTDA\.?\s?[\.\-\|]?(?=\w*)\s*(ME|EM|EPP|\/\d{2,4})?\s*",
+        "LTDA ",
+        regex=True,
+    )
+    column = column.replace(
+        r"(?<=\s)S\.?/?\\?\s?A\.?(?:C\.)?(?=\s+|$)", "S.A", regex=True
+    )
+    column = column.replace(r"\s+", " ", regex=True)
+    return column.str.strip()
+
+
+# One or more examples of each rule, taken from the comments of the rules
+RULE_CASES = [
+    "EMPRESA<BR>TESTE",
+    "EMPRESA   TESTE\t\nLTDA",
+    "EMPRESA TESTE 12345678000199",
+    "EMPRESA TESTE 12/2024",
+    "EMPRESA TESTE 1/24",
+    "PAGTO /EMPRESA TESTE",
+    "EMPRESA TESTE/ RPS: 123",
+    "ENTER-NAME",
+    "GOOGLE,LLC",
+    "GOOGLE;LLC",
+    "EMPRESA TESTE - ME",
+    "EMPRESA TESTE -EPP",
+    "EMPRESA TESTE - EM X",
+    "EMPRESA S. TESTE",
+    "EMPRESA B.V.",
+    "EMPRESA U.A. X",
+    "EMPRESA A.S.",
+    "EMPRESA N.V",
+    "EMPRESA Z.O.O.",
+    "EMPRESA Z O O/",
+    "EMPRESA S.P.A.",
+    "EMPRESA S. R. O.",
+    "EMPRESA S.A.C.",
+    "EMPRESA S.A.S.",
+    "EMPRESA S.A.U.",
+    "EMPRESA S.R.L.",
+    "NF.1234- EMPRESA",
+    "NF.12345,EMPRESA",
+    "NF.EMPRESA",
+    "RPS: 1234 EMPRESA",
+    "RPS 1234 EMPRESA",
+    "EMPRESA LTDA- ME",
+    "EMPRESA LTDA- EM",
+    "EMPRESA LTDA - EPP",
+    "EMPRESA LTDAME",
+    "EMPRESA LTDA./2024",
+    "EMPRESA S.A.",
+    "EMPRESA S\\A",
+    "EMPRESA S/A",
+    "EMPRESA SA",
+    "empresa teste ltda",
+    "",
+    "   ",
+]
+
+# Pieces the random strings are built from, the characters and words the
+# rules look for
+_ALPHABET = list("ABCDELMNOPSUVZ0123456789 ./\\-,;:|\t") + [
+    "<BR>",
+    "LTDA",
+    "ME",
+    "EM",
+    "EPP",
+    "S.A",
+    "S/A",
+    "NF.",
+    "RPS:",
+    "RPS ",
+    "B.V",
+    "Z.O.O",
+    "12345678000199",
+    "12/2024",
+    "ltda",
+    "  ",
+]
+
+
+def random_texts(size: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    return [
+        "".join(rng.choice(_ALPHABET) for _ in range(rng.randint(1, 12)))
+        for _ in range(size)
+    ]
+
+
+def assert_same(result: pd.Series, expected: pd.Series):
+    assert len(result) == len(expected)
+    for value, reference in zip(result, expected):
+        if isinstance(reference, float) and math.isnan(reference):
+            assert isinstance(value, float) and math.isnan(value)
+        else:
+            assert value == reference, f"{value!r} != {reference!r}"
+
+
+@pytest.mark.parametrize("text", RULE_CASES)
+def test_normalize_text_matches_legacy(text):
+    assert normalize_text(text) == legacy_format_column(pd.Series([text]))[0]
+
+
+def test_format_column_single_string():
+    for text in RULE_CASES:
+        assert (
+            DataPreprocessor.format_column(text)
+            == legacy_format_column(pd.Series([text]))[0]
+        )
+
+
+def test_format_column_random_strings():
+    column = pd.Series(random_texts(5000), dtype=object)
+    assert_same(DataPreprocessor.format_column(column), legacy_format_column(column))
+
+
+def test_format_column_keeps_missing_values():
+    column = pd.Series(
+        ["EMPRESA LTDA - ME", np.nan, "GOOGLE,LLC", None, "EMPRESA LTDA - ME"],
+        dtype=object,
+    )
+    result = DataPreprocessor.format_column(column)
+    assert_same(result, legacy_format_column(column))
+    assert result.isna().tolist() == [False, True, False, True, False]
+    assert result.index.equals(column.index)
+
+
+def test_format_column_parallel_matches_legacy():
+    column = pd.Series(random_texts(300, seed=1) + [np.nan], dtype=object)
+    assert_same(
+        DataPreprocessor.format_column(column, workers=2, parallel_threshold=1),
+        legacy_format_column(column),
+    )
+
+
+def test_format_column_parallel_reuses_the_pool():
+    column = pd.Series(random_texts(50, seed=2), dtype=object)
+    DataPreprocessor.format_column(column, workers=2, parallel_threshold=1)
+    executor = normalizer._executor
+    DataPreprocessor.format_column(column, workers=2, parallel_threshold=1)
+    assert executor is not None and normalizer._executor is executor
+    normalizer.shutdown_parallel()
+    assert normalizer._executor is None
@@ -0,0 +1,82 @@
+import random
+
+import pytest
+import spacy
+from spacy.training import Example
+
+from core.optimizer import META_KEY, load_pipeline, save_pipeline
+from core.predicter import ModelPredicter, _pipe_entities
+
+TRAIN = [
+    ("PAGTO ALFA LTDA", [(6, 15, "ORG")]),
+    ("TED BETA SERVICOS", [(4, 17, "ORG")]),
+    ("PAGTO GAMA", [(6, 10, "ORG")]),
+    ("DEB DELTA COMERCIO", [(4, 18, "ORG")]),
+]
+
+
+@pytest.fixture(scope="module")
+def model(tmp_path_factory):
+    # tok2vec shared by a listener of the ner, plus a component that isn't
+    # needed for the entities
+    nlp = spacy.blank("pt")
+    nlp.add_pipe("sentencizer")
+    nlp.add_pipe("tok2vec")
+    nlp.add_pipe(
+        "ner",
+        config={
+            "model": {
+                "@architectures": "spacy.TransitionBasedParser.v2",
+                "state_type": "ner",
+                "extra_state_tokens": False,
+                "hidden_width": 32,
+                "maxout_pieces": 2,
+                "use_upper": True,
+                "tok2vec": {
+                    "@architectures": "spacy.Tok2VecListener.v1",
+                    "width": 96,
+                    "upstream": "*",
+                },
+            }
+        },
+    )
+    examples = [
+        Example.from_dict(nlp.make_doc(text), {"entities": ents})
+        for text, ents in TRAIN
+    ]
+    optimizer = nlp.initialize(lambda: examples)
+    rng = random.Random(0)
+    for _ in range(20):
+        rng.shuffle(examples)
+        nlp.update(examples, sgd=optimizer)
+    path = tmp_path_factory.mktemp("model") / "model"
+    nlp.to_disk(path)
+    return path
+
+
+def entities(nlp) -> list:
+    return list(_pipe_entities(nlp, [text for text, _ in TRAIN], 2, 0))
+
+
+def test_optimize_cpu_keeps_only_the_ner_components(model):
+    full = load_pipeline(model)
+    optimized = load_pipeline(model, optimize="cpu")
+    assert full.pipe_names == ["sentencizer", "tok2vec", "ner"]
+    assert optimized.pipe_names == ["tok2vec", "ner"]
+    assert entities(optimized) == entities(full)
+    assert entities(full) == [tuple(tuple(x) for x in ents) for _, ents in TRAIN]
+
+
+def test_saved_model_is_optimized_when_loaded(model, tmp_path):
+    save_pipeline(model, tmp_path / "cpu")
+    nlp = spacy.load(tmp_path / "cpu")
+    assert nlp.meta[META_KEY] == {"optimize": "cpu"}
+    assert nlp.pipe_names == ["tok2vec", "ner"]
+    assert entities(load_pipeline(tmp_path / "cpu")) == entities(load_pipeline(model))
+
+
+def test_optimize_options_are_validated(model):
+    with pytest.raises(ValueError, match="gpu"):
+        load_pipeline(model, optimize="gpu")
+    with pytest.raises(ValueError, match="--optimize cpu"):
+        ModelPredicter(model, 0, optimize="cpu")
@@ -0,0 +1,135 @@
+import random
+import re
+
+import pytest
+
+from core.organizations import OrganizationIndex, OrganizationMatcher
+
+
+def legacy_polish_organizations(
+    org_name: str, organizations: list, *, max_variation: int = 5
+):
+    # Frozen copy of the regex scan _polish_organizations used before the
+    # token index, the reference of the parity tests
+    result = [
+        text
+        for text in organizations
+        if text != org_name
+        and re.search(rf"(^|\s+){re.escape(org_name)}($|\s+)", text, re.IGNORECASE)
+    ]
+    if len(result) == 0 or len(result) > max_variation:
+        return None
+
+    longest_name = max(result, key=len)
+    return longest_name
+
+
+# Few words, so the names often contain each other, with the case, the
+# punctuation and the spacing the regex is sensitive to
+_WORDS = [
+    "ALFA",
+    "alfa",
+    "BETA",
+    "GAMA",
+    "Gama",
+    "LTDA",
+    "S.A",
+    "S/A",
+    "&",
+    "(BR)",
+    "-",
+    "ALFABETA",
+    "COMERCIO",
+    "SERVICOS",
+]
+_SPACES = [" ", " ", " ", "  ", "\t"]
+
+
+def legacy_find(organizations: list, text: str):
+    # Frozen copy of the list scan of the empty-row fallback
+    return next((item for item in organizations if item in text), None)
+
+
+def random_name(rng: random.Random) -> str:
+    words = [rng.choice(_WORDS) for _ in range(rng.randint(1, 4))]
+    name = words[0]
+    for word in words[1:]:
+        name += rng.choice(_SPACES) + word
+    return name
+
+
+def random_organizations(rng: random.Random) -> list[str]:
+    # Unique as the keys of the organization table of predict
+    names = [random_name(rng) for _ in range(rng.randint(1, 60))]
+    return list(dict.fromkeys(names))
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_polish_matches_legacy(seed):
+    rng = random.Random(seed)
+    organizations = random_organizations(rng)
+    index = OrganizationIndex(organizations)
+    for max_variation in (1, 2, 5, 1000):
+        for org_name in organizations:
+            assert index.polish(
+                org_name, max_variation=max_variation
+            ) == legacy_polish_organizations(
+                org_name, organizations, max_variation=max_variation
+            ), (org_name, max_variation)
+
+
+def test_polish_keeps_the_first_longest_name():
+    organizations = ["ALFA", "ALFA BETA", "GAMA ALFA", "ALFA GAMA"]
+    assert OrganizationIndex(organizations).polish("ALFA") == "ALFA BETA"
+    assert legacy_polish_organizations("ALFA", organizations) == "ALFA BETA"
+
+
+def test_polish_too_many_variations():
+    organizations = ["ALFA"] + [f"ALFA {word}" for word in _WORDS[2:8]]
+    index = OrganizationIndex(organizations)
+    assert index.polish("ALFA", max_variation=5) is None
+    assert index.polish("ALFA", max_variation=6) == "ALFA BETA"
+    assert legacy_polish_organizations("ALFA", organizations, max_variation=5) is None
+
+
+def random_fragments(rng: random.Random, size: int) -> list[str]:
+    # Two letter alphabet: the names overlap, nest in each other and repeat
+    # (different organizations can be polished to the same name)
+    return [
+        "".join(rng.choice("AB ") for _ in range(rng.randint(1, 5)))
+        for _ in range(size)
+    ]
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_matcher_matches_legacy(seed):
+    rng = random.Random(seed)
+    organizations = random_fragments(rng, rng.randint(0, 30))
+    organizations += rng.sample(organizations, len(organizations) // 3)
+    rng.shuffle(organizations)
+    matcher = OrganizationMatcher(organizations)
+    for text in random_fragments(rng, 50) + [random_name(rng) for _ in range(10)]:
+        assert matcher.find(text) == legacy_find(organizations, text), text
+
+
+def test_matcher_nested_and_overlapping_names():
+    organizations = ["ALFA BETA", "BETA", "ALFA", "LFA BE", "BETA GAMA", "BETA"]
+    matcher = OrganizationMatcher(organizations)
+    for text in [
+        "ALFA BETA GAMA",
+        "X ALFA BET",
+        "BETA GAMA",
+        "ALFALFA BE",
+        "ALF",
+        "",
+    ]:
+        assert matcher.find(text) == legacy_find(organizations, text), text
+    assert matcher.find("X ALFA BET") == "ALFA"
+    assert matcher.find("ALFALFA BE") == "ALFA"
+
+
+def test_matcher_empty_name_matches_any_text():
+    organizations = ["B", "", "A"]
+    matcher = OrganizationMatcher(organizations)
+    for text in ["A", "B", ""]:
+        assert matcher.find(text) == legacy_find(organizations, text), text
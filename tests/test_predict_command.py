@@ -0,0 +1,224 @@
+import argparse
+import json
+
+import pandas as pd
+import pytest
+
+from commands.predict_command import PredictCommand
+from core.predicter import ModelPredicter
+from utils.metrics import RunMetrics
+
+SOURCE, OUTPUT = "HISTORICO", "EMPRESA"
+
+TEXTS = [
+    "PAGTO ALFA LTDA",
+    "PAGTO ALFA",
+    "PAGTO BETA SERVICOS",
+    "PAGTO BETA",
+    "TED BETA SERVICOS",
+    "OUTRO",
+    "PAGTO ALFA",
+]
+
+# "ALFA LTDA -" and "ALFA LTDA" are different responses with the same
+# formatted output, only the second one is polished by predict
+COLLIDING = [
+    "PAGTO ALFA LTDA - REF 1",
+    "PAGTO ALFA LTDA REF 2",
+    "PAGTO ALFA LTDA COMERCIO",
+    "PAGTO BETA",
+    "PAGTO ALFA LTDA - REF 3",
+    "PAGTO BETA SERVICOS",
+    "PAGTO ALFA LTDA REF 4",
+]
+
+
+def stub_init(self, model, gpu_id, **options):
+    # No model: the text after "PAGTO " (up to " REF") is the organization
+    def predict_texts(texts, *, verbose=True):
+        entities = []
+        for text in texts:
+            start, end = text.find("PAGTO "), text.find(" REF")
+            entities.append(
+                ((start + 6, end if end != -1 else len(text), "ORG"),)
+                if start != -1
+                else ()
+            )
+        return entities
+
+    self.metrics = options.get("metrics") or RunMetrics()
+    self.cache = None
+    self.executor = None
+    self.orgs_list = {}
+    self._predict_texts = predict_texts
+
+
+@pytest.fixture(autouse=True)
+def stub_model(monkeypatch):
+    monkeypatch.setattr(ModelPredicter, "__init__", stub_init)
+
+
+def parse_args(*argv) -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    PredictCommand.add_arguments(parser)
+    return parser.parse_args(
+        [*argv, "--model", "model", "--src_col", SOURCE, "--out_col", OUTPUT]
+        + ["--sep", "SEMICOLON", "--no-log"]
+    )
+
+
+def write_input(path, texts=TEXTS, column=SOURCE):
+    pd.DataFrame({"ID": [str(x) for x in range(len(texts))], column: texts}).to_csv(
+        path, sep=";", index=False
+    )
+
+
+def read_output(path) -> list:
+    df = pd.read_csv(path, sep=";", dtype=str, keep_default_na=False)
+    assert df.columns.tolist() == ["ID", SOURCE, OUTPUT]
+    return df[OUTPUT].tolist()
+
+
+@pytest.mark.parametrize(
+    "options",
+    [[], ["--src_only"], ["--chunksize", "2"], ["--chunksize", "3", "--arrow"]],
+)
+@pytest.mark.parametrize("max_variation", ["0", "2"])
+def test_predict_file_modes_agree(tmp_path, options, max_variation):
+    write_input(tmp_path / "input.csv")
+    expected = []
+    for name, argv in (("expected", []), ("output", options)):
+        args = parse_args(
+            "--data",
+            str(tmp_path / "input.csv"),
+            "--output",
+            str(tmp_path / f"{name}.csv"),
+            "--max_variation",
+            max_variation,
+            *argv,
+        )
+        PredictCommand._predict_file(
+            args,
+            ModelPredicter(args.model, args.gpu_id),
+            args.data,
+            args.output,
+            ";",
+            SOURCE,
+            OUTPUT,
+        )
+        expected.append(read_output(args.output))
+    assert expected[0] == expected[1]
+    assert expected[0][0] == "ALFA LTDA"
+    assert expected[0][5] == ""
+    if max_variation == "2":
+        assert expected[0][1] == "ALFA LTDA"
+        assert expected[0][4] == "BETA SERVICOS"
+
+
+@pytest.mark.parametrize("responses", [[], ["--responses"]])
+@pytest.mark.parametrize("chunksize", ["1", "2", "3"])
+def test_chunked_polish_with_colliding_responses(tmp_path, chunksize, responses):
+    write_input(tmp_path / "input.csv", COLLIDING)
+    outputs = []
+    for name, argv in (("single", []), ("chunked", ["--chunksize", chunksize])):
+        args = parse_args(
+            "--data",
+            str(tmp_path / "input.csv"),
+            "--output",
+            str(tmp_path / f"{name}.csv"),
+            "--max_variation",
+            "3",
+            *responses,
+            *argv,
+        )
+        PredictCommand._predict_file(
+            args,
+            ModelPredicter(args.model, args.gpu_id),
+            args.data,
+            args.output,
+            ";",
+            SOURCE,
+            OUTPUT,
+            response_column=(
+                ModelPredicter.response_column(OUTPUT) if responses else None
+            ),
+        )
+        outputs.append(pd.read_csv(args.output, sep=";", dtype=str))
+    assert outputs[0].equals(outputs[1])
+    assert outputs[1][OUTPUT].tolist()[:2] == ["ALFA LTDA", "ALFA LTDA COMERCIO"]
+
+
+@pytest.mark.parametrize(
+    "texts",
+    # The second one is written by pandas: Arrow can't write unquoted values
+    [TEXTS, [*TEXTS[:-1], 'PAGTO "ALFA"; LTDA']],
+)
+def test_src_only_writes_the_same_bytes(tmp_path, texts):
+    write_input(tmp_path / "input.csv", texts)
+    contents = []
+    for name, argv in (("default", []), ("src_only", ["--src_only"])):
+        args = parse_args(
+            "--data",
+            str(tmp_path / "input.csv"),
+            "--output",
+            str(tmp_path / f"{name}.csv"),
+            *argv,
+        )
+        PredictCommand._predict_file(
+            args,
+            ModelPredicter(args.model, args.gpu_id),
+            args.data,
+            args.output,
+            ";",
+            SOURCE,
+            OUTPUT,
+        )
+        contents.append(args.output.read_bytes())
+    assert contents[0] == contents[1]
+
+
+def test_predict_file_missing_column(tmp_path):
+    write_input(tmp_path / "input.csv", column="OTHER")
+    args = parse_args("--data", str(tmp_path / "input.csv"), "--output", str(tmp_path))
+    with pytest.raises(ValueError, match="não existe"):
+        PredictCommand._predict_file(
+            args,
+            ModelPredicter(args.model, args.gpu_id),
+            args.data,
+            tmp_path / "output.csv",
+            ";",
+            SOURCE,
+            OUTPUT,
+        )
+
+
+def test_batch_records_failures_and_resumes(tmp_path, monkeypatch):
+    data, output = tmp_path / "data", tmp_path / "output"
+    data.mkdir()
+    write_input(data / "a.csv")
+    write_input(data / "b.csv", column="OTHER")
+    args = parse_args("--data", str(data), "--output", str(output))
+
+    PredictCommand.execute(args)
+    files = json.loads((output / "manifest.json").read_text(encoding="utf-8"))["files"]
+    a, b = (files[str((data / x).absolute())] for x in ("a.csv", "b.csv"))
+    assert a["status"] == "done"
+    assert b["status"] == "failed" and "não existe" in b["error"]
+    assert read_output(output / "a.csv")[0] == "ALFA LTDA"
+    assert not (output / "b.csv").exists()
+
+    # The next run skips the finished file and retries the failed one
+    write_input(data / "b.csv")
+    predicted = []
+    predict_file = PredictCommand._predict_file.__func__
+
+    def spy(cls, args, predicter, file_path, *rest, **options):
+        predicted.append(file_path.name)
+        return predict_file(cls, args, predicter, file_path, *rest, **options)
+
+    monkeypatch.setattr(PredictCommand, "_predict_file", classmethod(spy))
+    PredictCommand.execute(args)
+    files = json.loads((output / "manifest.json").read_text(encoding="utf-8"))["files"]
+    assert predicted == ["b.csv"]
+    assert all(x["status"] == "done" for x in files.values())
+    assert read_output(output / "b.csv") == read_output(output / "a.csv")
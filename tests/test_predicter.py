@@ -0,0 +1,98 @@
+import random
+
+import pandas as pd
+import pytest
+import spacy
+
+from core.predicter import ModelPredicter, _padded_batches
+
+SOURCE, OUTPUT = "HISTORICO", "EMPRESA"
+
+NAMES = ["ALFA LTDA", "BETA SERVICOS", "GAMA", "DELTA COMERCIO"]
+TEXTS = [
+    f"{prefix} {name} {index}"
+    for index in range(12)
+    for prefix, name in zip(("PAGTO", "TED", "DEB", "PIX"), NAMES)
+] + ["OUTRO", ""]
+
+
+@pytest.fixture
+def model(tmp_path):
+    # A real pipeline, the organizations are found by an entity ruler
+    nlp = spacy.blank("pt")
+    nlp.add_pipe("entity_ruler").add_patterns(
+        [{"label": "ORG", "pattern": name} for name in NAMES]
+    )
+    nlp.to_disk(tmp_path / "model")
+    return tmp_path / "model"
+
+
+def predict(predicter: ModelPredicter) -> pd.DataFrame:
+    return predicter.predict(
+        pd.DataFrame({SOURCE: TEXTS}), SOURCE, OUTPUT, 0, response_column="R"
+    )
+
+
+def test_workers_match_a_single_process(model):
+    predicter = ModelPredicter(model, -1, batch_size=2)
+    expected = predict(predicter)
+    predicter.close()
+    assert expected[OUTPUT].tolist()[:4] == NAMES
+
+    # batch_size 2 makes shards of 16 texts, spread over the processes
+    predicter = ModelPredicter(model, -1, batch_size=2, workers=2)
+    assert predicter.nlp is None
+    try:
+        assert predict(predicter).equals(expected)
+        assert predicter.executor is not None
+    finally:
+        predicter.close()
+    assert predicter.executor is None
+
+
+def test_workers_only_on_the_cpu(model):
+    with pytest.raises(ValueError, match="--workers"):
+        ModelPredicter(model, 0, workers=2)
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_padded_batches_are_bounded(seed):
+    rng = random.Random(seed)
+    docs = sorted(
+        ["x" * rng.randint(1, 40) for _ in range(rng.randint(0, 200))], key=len
+    )
+    batch_size, batch_tokens = rng.randint(1, 32), rng.randint(1, 400)
+    batches = list(_padded_batches(docs, batch_size, batch_tokens))
+    assert [doc for batch in batches for doc in batch] == docs
+    for batch in batches:
+        assert 0 < len(batch) <= batch_size
+        # Only a single doc longer than batch_tokens passes the bound
+        assert len(batch) == 1 or max(map(len, batch)) * len(batch) <= batch_tokens
+    # A batch is only closed when the next doc doesn't fit
+    for batch, following in zip(batches, batches[1:]):
+        padded = max(len(batch[-1]), len(following[0])) * (len(batch) + 1)
+        assert len(batch) == batch_size or padded > batch_tokens
+
+
+def test_padded_batching_keeps_the_input_order(model):
+    predicter = ModelPredicter(model, -1, batch_size=4, batch_tokens=0)
+    expected = predicter._predict_texts(TEXTS)
+    predicter.close()
+    # The texts are sorted by length for the batches, the results come back
+    # in the input order
+    predicter = ModelPredicter(model, -1, batch_size=4, batch_tokens=12)
+    batches = []
+    pipe = predicter.nlp.pipe
+
+    def spy(docs, **options):
+        docs = list(docs)
+        batches.append(docs)
+        return pipe(docs, **options)
+
+    predicter.nlp.pipe = spy
+    assert predicter._predict_texts(TEXTS) == expected
+    predicter.close()
+    assert [doc.text for batch in batches for doc in batch] == sorted(TEXTS, key=len)
+    assert all(
+        len(batch) == 1 or max(map(len, batch)) * len(batch) <= 12 for batch in batches
+    )
@@ -0,0 +1,127 @@
+import random
+
+import pandas as pd
+import pytest
+
+from core.corpus import CsvCorpus
+from core.preprocessor import DataPreprocessor
+
+SOURCE = "HISTORICO"
+RESPONSES = [
+    {"column": "EMPRESA", "type": "ORG"},
+    {"column": "BANCO", "type": "BANK"},
+    {"column": "CIDADE", "type": "LOC"},
+]
+MIN_SAMPLES = 3
+
+
+def legacy_create_train_dataframe(
+    df: pd.DataFrame, source_col: str, response_cols: list, MIN_SAMPLES: int = 5
+):
+    # Frozen copy of the groupby filter create_train_dataframe used before
+    # the vectorized counts, the reference of the parity tests
+    df[source_col] = DataPreprocessor.format_column(df[source_col])
+    for response_col in response_cols:
+        df[response_col["column"]] = DataPreprocessor.format_column(
+            df[response_col["column"]]
+        )
+        df = df.groupby(response_col["column"]).filter(lambda x: len(x) >= MIN_SAMPLES)
+
+    training_data = []
+    for _, row in df.iterrows():
+        source_val = row[source_col]
+        train_element = [source_val, {"entities": []}]
+        for response_col in response_cols:
+            response_val = row[response_col["column"]]
+            start_idx = source_val.find(response_val)
+            if start_idx != -1:
+                end_idx = start_idx + len(response_val)
+                train_element[1]["entities"].append(
+                    (start_idx, end_idx, response_col["type"])
+                )
+
+        if len(train_element[1]["entities"]) > 0:
+            training_data.append(train_element)
+
+    return training_data
+
+
+def random_dataframe(rng: random.Random) -> pd.DataFrame:
+    # Each value repeats MIN_SAMPLES - 1 to MIN_SAMPLES + 1 times, so the
+    # filter of a column changes the counts of the next ones, some values
+    # are missing or differ from the source only by the normalization
+    values = {
+        "EMPRESA": ["ALFA LTDA", "beta  servicos", "GAMA", "DELTA S/A", None],
+        "BANCO": ["ITAU", "BRADESCO", "CAIXA", None],
+        "CIDADE": ["SAO PAULO", "RIO", "RECIFE"],
+    }
+    rows = []
+    for _ in range(rng.randint(MIN_SAMPLES, 40)):
+        row = {column: rng.choice(choices) for column, choices in values.items()}
+        parts = ["PAGTO"] + [
+            value for value in row.values() if value is not None and rng.random() < 0.8
+        ]
+        row[SOURCE] = " ".join(parts)
+        rows.append(row)
+    rows = [row for row in rows for _ in range(rng.randint(1, 2))]
+    rng.shuffle(rows)
+    return pd.DataFrame(rows, columns=[SOURCE, *values])
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_train_dataframe_matches_legacy(seed):
+    rng = random.Random(seed)
+    df = random_dataframe(rng)
+    for min_samples in (1, MIN_SAMPLES, MIN_SAMPLES + 1):
+        for columns in (RESPONSES[:1], RESPONSES, RESPONSES[::-1]):
+            assert DataPreprocessor.create_train_dataframe(
+                df.copy(), SOURCE, columns, MIN_SAMPLES=min_samples
+            ) == legacy_create_train_dataframe(
+                df.copy(), SOURCE, columns, MIN_SAMPLES=min_samples
+            ), (
+                min_samples,
+                columns,
+            )
+
+
+def test_train_dataframe_min_samples_boundary():
+    df = pd.DataFrame(
+        {
+            SOURCE: ["PAGTO ALFA"] * MIN_SAMPLES + ["PAGTO BETA"] * (MIN_SAMPLES - 1),
+            "EMPRESA": ["ALFA"] * MIN_SAMPLES + ["BETA"] * (MIN_SAMPLES - 1),
+        }
+    )
+    dataset = DataPreprocessor.create_train_dataframe(
+        df, SOURCE, RESPONSES[:1], MIN_SAMPLES=MIN_SAMPLES
+    )
+    assert dataset == [["PAGTO ALFA", {"entities": [(6, 10, "ORG")]}]] * MIN_SAMPLES
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("chunksize", [2, 7])
+def test_train_dataframe_counts_match_legacy(tmp_path, seed, chunksize):
+    # The streamed corpus counts the whole file first, then filters each
+    # chunk with those counts
+    df = random_dataframe(random.Random(seed))
+    df.to_csv(tmp_path / "train.csv", sep=";", index=False)
+    corpus = CsvCorpus(
+        tmp_path / "train.csv",
+        source_column=SOURCE,
+        response_columns=";".join(f"{x['column']}:{x['type']}" for x in RESPONSES),
+        min_samples=MIN_SAMPLES,
+        chunksize=chunksize,
+    )
+    counts = corpus._response_counts()
+    dataset = [
+        item
+        for chunk in corpus._chunks()
+        for item in DataPreprocessor.create_train_dataframe(
+            chunk, SOURCE, RESPONSES, MIN_SAMPLES=MIN_SAMPLES, counts=counts
+        )
+    ]
+    assert dataset == legacy_create_train_dataframe(
+        DataPreprocessor.load(tmp_path / "train.csv", ";", "UTF-8"),
+        SOURCE,
+        RESPONSES,
+        MIN_SAMPLES=MIN_SAMPLES,
+    )
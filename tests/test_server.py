@@ -0,0 +1,162 @@
+import asyncio
+import json
+
+import pytest
+
+from core.server import PredictionServer
+
+
+class StubPredicter:
+    # Stands for ModelPredicter: the whole text is one organization, the
+    # texts of each call are kept to check the micro-batches
+    def __init__(self):
+        self.batches = []
+        self.closed = False
+
+    def _predict_texts(self, texts, *, verbose=True):
+        self.batches.append(list(texts))
+        return [((0, len(text), "ORG"),) if text else () for text in texts]
+
+    def close(self):
+        self.closed = True
+
+
+async def request(port: int, raw: bytes) -> tuple[int, dict]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(raw)
+    # Incomplete requests are answered once the server sees the end
+    writer.write_eof()
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split(b" ")[1]), json.loads(body)
+
+
+def http(method: str, path: str, body: bytes = b"", headers: str = None) -> bytes:
+    headers = headers if headers is not None else f"Content-Length: {len(body)}\r\n"
+    return f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n{headers}\r\n".encode(
+        "latin-1"
+    ) + body
+
+
+def predict_request(payload) -> bytes:
+    return http("POST", "/predict", json.dumps(payload).encode("utf-8"))
+
+
+def run_server(predicter, client, **options):
+    async def main():
+        server = PredictionServer(predicter, **options)
+        tcp = await server.start(host="127.0.0.1", port=0)
+        try:
+            async with tcp:
+                return await client(tcp.sockets[0].getsockname()[1])
+        finally:
+            server.close()
+
+    return asyncio.run(main())
+
+
+def test_concurrent_requests_share_a_batch():
+    predicter = StubPredicter()
+    texts = [f"EMPRESA {index}" for index in range(5)]
+
+    async def client(port):
+        return await asyncio.gather(
+            *(request(port, predict_request({"text": text})) for text in texts)
+        )
+
+    responses = run_server(predicter, client, max_batch_size=8, max_wait=0.5)
+    assert [status for status, _ in responses] == [200] * len(texts)
+    assert [payload["results"][0]["output"] for _, payload in responses] == texts
+    assert len(predicter.batches) == 1
+    assert sorted(predicter.batches[0]) == sorted(texts)
+    assert predicter.closed
+
+
+def test_batches_respect_max_batch_size():
+    predicter = StubPredicter()
+    texts = [f"EMPRESA {index}" for index in range(10)]
+
+    async def client(port):
+        return await asyncio.gather(
+            *(request(port, predict_request({"text": text})) for text in texts)
+        )
+
+    responses = run_server(predicter, client, max_batch_size=4, max_wait=0.5)
+    assert all(status == 200 for status, _ in responses)
+    assert all(len(batch) <= 4 for batch in predicter.batches)
+    assert sorted(text for batch in predicter.batches for text in batch) == sorted(
+        texts
+    )
+
+
+def test_batch_closes_after_max_wait():
+    predicter = StubPredicter()
+
+    async def client(port):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        first = await request(port, predict_request({"text": "EMPRESA A"}))
+        elapsed = loop.time() - start
+        # Sent after the first batch ran, so it can't join it
+        second = await request(port, predict_request({"text": "EMPRESA B"}))
+        return first, second, elapsed
+
+    first, second, elapsed = run_server(
+        predicter, client, max_batch_size=64, max_wait=0.05
+    )
+    assert first[0] == second[0] == 200
+    assert elapsed < 2
+    assert predicter.batches == [["EMPRESA A"], ["EMPRESA B"]]
+
+
+def test_texts_are_deduplicated_and_normalized():
+    predicter = StubPredicter()
+
+    async def client(port):
+        return await request(
+            port, predict_request({"texts": ["empresa  a", "EMPRESA A", ""]})
+        )
+
+    status, payload = run_server(predicter, client, max_wait=0.01)
+    assert status == 200
+    assert [x["normalized"] for x in payload["results"]] == [
+        "EMPRESA A",
+        "EMPRESA A",
+        "",
+    ]
+    assert [x["output"] for x in payload["results"]] == ["EMPRESA A", "EMPRESA A", ""]
+    assert payload["results"][0]["text"] == "empresa  a"
+    assert sorted(predicter.batches[0]) == ["", "EMPRESA A"]
+
+
+@pytest.mark.parametrize(
+    "raw, status",
+    [
+        (http("GET", "/health"), 200),
+        (http("GET", "/other"), 404),
+        (http("GET", "/predict"), 405),
+        (b"GET\r\n\r\n", 400),
+        (b"GET /health\r\n\r\n", 400),
+        (b"GET /health HTTP/1.1", 400),
+        (http("POST", "/predict", b"{"), 400),
+        (http("POST", "/predict", b"[1]"), 400),
+        (http("POST", "/predict", b'{"other": 1}'), 400),
+        (http("POST", "/predict", b'{"texts": [1]}'), 400),
+        (http("POST", "/predict", b'{"texts": "EMPRESA"}'), 400),
+        (http("POST", "/predict", headers="Content-Length: abc\r\n"), 400),
+        (http("POST", "/predict", headers="Content-Length: -1\r\n"), 400),
+        (http("POST", "/predict", headers=f"Content-Length: {2**30}\r\n"), 413),
+    ],
+)
+def test_routes_and_errors(raw, status):
+    predicter = StubPredicter()
+
+    async def client(port):
+        return await request(port, raw)
+
+    result, payload = run_server(predicter, client, max_wait=0.01)
+    assert result == status
+    assert ("error" in payload) == (status != 200)
+    assert predicter.batches == []
@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from core.predicter import ModelPredicter
+from core.preprocessor import DataPreprocessor
+from core.sharding import ROW_COLUMN, merge_files, shard_file
+from utils.metrics import RunMetrics
+
+SOURCE, OUTPUT = "HISTORICO", "EMPRESA"
+RESPONSE = ModelPredicter.response_column(OUTPUT)
+
+# The stub model answers the text between "PAGTO " and " REF" (or the end),
+# texts without "PAGTO" have no entity and are left to the fallback
+TEXTS = [
+    "PAGTO ALFA LTDA - REF 1",  # response "ALFA LTDA -", output "ALFA LTDA"
+    "PAGTO ALFA LTDA REF 2",  # same output as the one above
+    "PAGTO ALFA LTDA COMERCIO",
+    "PAGTO ALFA LTDA COMERCIO",
+    "PAGTO BETA",
+    "PAGTO BETA SERVICOS",
+    "DEB BETA SERVICOS 123",
+    "PAGTO GAMA",
+    "PAGTO GAMA LTDA",
+    "PAGTO GAMA EIRELI",
+    "TED GAMA",
+    "OUTRO",
+    "PAGTO DELTA REF 3",
+]
+
+
+def stub_predicter() -> ModelPredicter:
+    def predict_texts(texts, *, verbose=True):
+        entities = []
+        for text in texts:
+            start = text.find("PAGTO ")
+            if start == -1:
+                entities.append(())
+                continue
+            end = text.find(" REF")
+            entities.append(((start + 6, end if end != -1 else len(text), "ORG"),))
+        return entities
+
+    predicter = ModelPredicter.__new__(ModelPredicter)
+    predicter.metrics = RunMetrics()
+    predicter.cache = None
+    predicter.orgs_list = {}
+    predicter._predict_texts = predict_texts
+    return predicter
+
+
+def predict(df: pd.DataFrame, max_variation: int, responses: bool) -> pd.DataFrame:
+    return stub_predicter().predict(
+        df,
+        SOURCE,
+        OUTPUT,
+        max_variation,
+        response_column=RESPONSE if responses else None,
+    )
+
+
+def sharded_predict(tmp_path, df, parts, max_variation, responses):
+    input_path = tmp_path / "input.csv"
+    df.to_csv(input_path, sep=";", index=False)
+    outputs = []
+    for index, path in enumerate(
+        shard_file(input_path, tmp_path, parts, SOURCE, ";", "UTF-8")
+    ):
+        part = DataPreprocessor.load(path, ";", "UTF-8")
+        output = tmp_path / f"out{index}.csv"
+        DataPreprocessor.save(predict(part, 0, responses), output, ";")
+        outputs.append(output)
+    return merge_files(
+        outputs,
+        tmp_path / "output.csv",
+        SOURCE,
+        OUTPUT,
+        ";",
+        max_variation=max_variation,
+    )
+
+
+def output_values(df: pd.DataFrame) -> list:
+    return [x if isinstance(x, str) else "" for x in df[OUTPUT]]
+
+
+@pytest.mark.parametrize("parts", [1, 2, 3])
+@pytest.mark.parametrize("max_variation", [1, 3])
+def test_merge_with_responses_matches_predict(tmp_path, parts, max_variation):
+    df = pd.DataFrame({SOURCE: TEXTS, "ID": [str(x) for x in range(len(TEXTS))]})
+    expected = predict(df.copy(), max_variation, True)
+    merged = sharded_predict(tmp_path, df, parts, max_variation, True)
+    assert ROW_COLUMN not in merged.columns
+    assert merged["ID"].tolist() == df["ID"].tolist()
+    assert output_values(merged) == output_values(expected)
+
+
+def test_merge_without_responses_uses_the_outputs(tmp_path):
+    # The fallback polishes the formatted outputs: "ALFA LTDA -" and
+    # "ALFA LTDA" both became ALFA LTDA on the nodes, so both rows get the
+    # polished name, predict only polishes the second one
+    df = pd.DataFrame({SOURCE: TEXTS})
+    expected = predict(df.copy(), 3, True)
+    merged = sharded_predict(tmp_path, df, 2, 3, False)
+    assert expected[OUTPUT][0] == "ALFA LTDA"
+    assert merged[OUTPUT][0] == "ALFA LTDA COMERCIO"
+    assert output_values(merged)[1:] == output_values(expected)[1:]
+
+
+def test_merge_rejects_parts_without_responses(tmp_path):
+    df = pd.DataFrame({SOURCE: TEXTS})
+    paths = []
+    for index, responses in enumerate((True, False)):
+        output = predict(df.copy(), 0, responses)
+        output.insert(0, ROW_COLUMN, np.arange(len(df)) + index * len(df))
+        path = tmp_path / f"out{index}.csv"
+        DataPreprocessor.save(output, path, ";")
+        paths.append(path)
+    with pytest.raises(ValueError, match=RESPONSE):
+        merge_files(
+            paths, tmp_path / "output.csv", SOURCE, OUTPUT, ";", max_variation=3
+        )
@@ -0,0 +1,51 @@
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+MAIN = Path(__file__).resolve().parents[1] / "boss_textract" / "__main__.py"
+
+# Loaded only when a command executes, never to build the parser
+HEAVY_MODULES = ["pandas", "spacy", "torch", "sklearn"]
+
+# Wall time of "-h", the interpreter startup included (about 0.15s today)
+HELP_BUDGET_SECONDS = 1.5
+
+_CHECK = """
+import json, runpy, sys
+sys.path.insert(0, {directory!r})
+sys.argv = ["boss_textract", "-h"]
+try:
+    runpy.run_path({main!r}, run_name="__main__")
+except SystemExit:
+    pass
+print(json.dumps([x for x in {heavy!r} if x in sys.modules]))
+"""
+
+
+def test_help_does_not_import_heavy_modules():
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            _CHECK.format(
+                directory=str(MAIN.parent), main=str(MAIN), heavy=HEAVY_MODULES
+            ),
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert json.loads(result.stdout.strip().splitlines()[-1]) == []
+
+
+def test_help_startup_time():
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, str(MAIN), "-h"], capture_output=True, text=True
+    )
+    elapsed = time.perf_counter() - start
+    assert result.returncode == 0, result.stderr
+    assert "predict" in result.stdout
+    assert elapsed < HELP_BUDGET_SECONDS, f"-h levou {elapsed:.2f}s"
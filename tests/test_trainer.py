@@ -0,0 +1,98 @@
+import pandas as pd
+import pytest
+import spacy
+from spacy.tokens import DocBin
+
+from core import trainer as trainer_module
+from core.preprocessor import DataPreprocessor
+from core.trainer import ModelTrainer
+
+SOURCE = "HISTORICO"
+RESPONSES = [{"column": "EMPRESA", "type": "ORG"}]
+
+ROWS = [
+    ("PAGTO ALFA LTDA", "ALFA LTDA"),
+    ("TED ALFA LTDA", "ALFA LTDA"),
+    ("PAGTO ALFA LTDA 1", "ALFA LTDA"),
+    ("PAGTO BETA", "BETA"),
+    ("DEB BETA", "BETA"),
+    ("PAGTO GAMA", "GAMA"),
+]
+
+
+@pytest.fixture
+def trainings(monkeypatch):
+    # Only the corpus preparation runs, spaCy's train records the corpus
+    # directory it would read
+    calls = []
+    monkeypatch.setattr(
+        trainer_module,
+        "train",
+        lambda config_path, output_path, use_gpu, overrides: calls.append(
+            overrides["paths.train"]
+        ),
+    )
+    return calls
+
+
+def run(tmp_path, rows, min_samples, **options) -> tuple:
+    df = pd.DataFrame(rows, columns=[SOURCE, RESPONSES[0]["column"]])
+    dataset = DataPreprocessor.create_train_dataframe(
+        df, SOURCE, RESPONSES, MIN_SAMPLES=min_samples
+    )
+    trainer = ModelTrainer(
+        tmp_path / "config.cfg", tmp_path / "model", corpus_cache=tmp_path / "cache"
+    )
+    prepared = []
+    prepare_corpus = trainer._prepare_corpus
+
+    def spy(*args, **kwargs):
+        prepared.append(True)
+        return prepare_corpus(*args, **kwargs)
+
+    trainer._prepare_corpus = spy
+    trainer.train(dataset, **options)
+    return dataset, bool(prepared)
+
+
+def read_texts(path) -> list:
+    nlp = spacy.blank("pt")
+    return [
+        doc.text
+        for file in sorted(path.glob("*.spacy"))
+        for doc in DocBin().from_disk(file).get_docs(nlp.vocab)
+    ]
+
+
+def test_corpus_cache_reused_only_for_the_same_inputs(tmp_path, trainings):
+    dataset, prepared = run(tmp_path, ROWS, 2)
+    assert prepared and len(dataset) == 5
+    # The same data and options reuse the prepared corpus
+    assert run(tmp_path, ROWS, 2)[1] is False
+    assert trainings[0] == trainings[1]
+
+    # A higher --min_samples drops BETA, a different corpus is built
+    dataset, prepared = run(tmp_path, ROWS, 3)
+    assert prepared and len(dataset) == 3
+    assert trainings[2] != trainings[0]
+
+    # So does a change in the source data or the split
+    assert run(tmp_path, ROWS + [("PAGTO BETA SA", "BETA")], 2)[1] is True
+    assert run(tmp_path, ROWS, 2, train_size=0.5)[1] is True
+    assert len(set(trainings)) == 4
+
+    # Each cached corpus still has the examples it was built from
+    corpus = tmp_path / "cache" / ModelTrainer._corpus_key(dataset, None, 0.8)
+    assert str(corpus / "train") == trainings[2]
+    assert sorted(read_texts(corpus / "train") + read_texts(corpus / "dev")) == sorted(
+        text for text, _ in dataset
+    )
+    assert not any(x.name.endswith(".tmp") for x in (tmp_path / "cache").iterdir())
+
+
+def test_corpus_key_depends_on_the_spacy_version(monkeypatch):
+    dataset = [["PAGTO ALFA", {"entities": [(6, 10, "ORG")]}]]
+    key = ModelTrainer._corpus_key(dataset, None, 0.8)
+    assert ModelTrainer._corpus_key(dataset, dataset, 0.8) != key
+    monkeypatch.setattr(spacy.about, "__version__", "0.0.0")
+    assert ModelTrainer._corpus_key(dataset, None, 0.8) != key